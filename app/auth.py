@@ -7,9 +7,12 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from .models import User
-from .database import get_session
+from .database import get_session, get_read_session
+from .executors import BoundedExecutor
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +23,14 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24 * 7))  # Default: 1 week
 
+# Authenticated user cache
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))  # seconds
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+
+# Password hashing pool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 32))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
@@ -29,6 +40,20 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt releases the GIL, so a thread pool spreads hashing across cores
+# while the event loop keeps serving other requests
+password_executor = BoundedExecutor(
+    "password-hash", PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_MAX_QUEUE
+)
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password in the worker pool; raises ExecutorBusy when saturated"""
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash in the worker pool; raises ExecutorBusy when saturated"""
+    return await password_executor.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -40,33 +65,93 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def authenticate_user(session: AsyncSession, username: str, password: str):
+    """The user if the password matches, else False
+
+    The session's connection is handed back before the password is checked,
+    so a slow hash never holds a pooled connection.
+    """
     result = await session.execute(select(User).filter(User.username == username))
     user = result.scalars().first()
+    if user:
+        session.expunge(user)
+    await session.rollback()
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return False
     return user
 
-async def get_current_user_from_cookie(request: Request, session: AsyncSession = Depends(get_session)):
-    """Get the current user from the session cookie"""
-    token = request.cookies.get("session")
+class UserCache:
+    """Small in-process LRU cache of users keyed by token subject, with a TTL"""
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+
+    def get(self, username: str) -> Optional[User]:
+        item = self._entries.get(username)
+        if item is None:
+            return None
+        expires, user = item
+        if expires < time.monotonic():
+            del self._entries[username]
+            return None
+        self._entries.move_to_end(username)
+        return user
+
+    def set(self, username: str, user: User) -> None:
+        self._entries[username] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        self._entries.pop(username, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+user_cache = UserCache()
+
+class LoginRequired(Exception):
+    """Raised by require_user; the app turns it into a redirect to /login"""
+
+def get_token_subject(token: Optional[str]) -> Optional[str]:
+    """Return the username in a valid session token, or None"""
     if not token:
         return None
-    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
     except JWTError:
         return None
+    return payload.get("sub")
+
+async def get_current_user_from_cookie(request: Request, session: AsyncSession = Depends(get_read_session)):
+    """Get the current user from the session cookie"""
+    username = get_token_subject(request.cookies.get("session"))
+    if username is None:
+        return None
+    
+    user = user_cache.get(username)
+    if user is not None:
+        return user
     
     result = await session.execute(select(User).filter(User.username == username))
     user = result.scalars().first()
     if user is None:
         return None
     
+    # Detach so the cached copy outlives this request's session
+    session.expunge(user)
+    user_cache.set(username, user)
+    return user
+
+async def require_user(request: Request, session: AsyncSession = Depends(get_read_session)) -> User:
+    """Dependency for protected routes: the logged-in user, or a redirect to /login"""
+    user = await get_current_user_from_cookie(request, session)
+    if user is None:
+        raise LoginRequired()
     return user
 
 def login_required(func):
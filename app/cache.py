@@ -0,0 +1,139 @@
+"""
+Rendered-fragment cache.
+
+Fragments are keyed by what they show plus the current data version, a
+counter in the database that every mutation bumps in its own transaction.
+A bump therefore invalidates every cached fragment in every process at
+once, and stale entries simply age out. The version also gives each
+fragment a cheap ETag, so unchanged fragments are answered with 304
+before anything is rendered or even looked up.
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import DataVersion
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 256))
+FRAGMENT_CACHE_TTL = int(os.getenv("FRAGMENT_CACHE_TTL", 3600))  # seconds
+# Optional shared backend so several web processes reuse each other's renders
+REDIS_URL = os.getenv("REDIS_URL")
+
+DATA_VERSION = "data"
+
+
+async def get_state(session: AsyncSession) -> Tuple[int, Optional[datetime]]:
+    """Current data version and when it last changed"""
+    result = await session.execute(
+        select(DataVersion.version, DataVersion.updated_at).where(DataVersion.name == DATA_VERSION)
+    )
+    row = result.first()
+    return (0, None) if row is None else (row.version, row.updated_at)
+
+
+async def get_version(session: AsyncSession) -> int:
+    return (await get_state(session))[0]
+
+
+async def bump_version(session: AsyncSession) -> None:
+    """Invalidate cached fragments; commits with the caller's transaction"""
+    now = datetime.utcnow()
+    stmt = sqlite_insert(DataVersion).values(name=DATA_VERSION, version=1, updated_at=now)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DataVersion.name],
+            set_={"version": DataVersion.version + 1, "updated_at": now},
+        )
+    )
+
+
+def directory_fingerprint(path: str) -> str:
+    """Digest of every file under `path`, so a deploy with new templates gets new ETags"""
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def fragment_etag(key: str, version: int, salt: str = "") -> str:
+    digest = hashlib.sha1(f"{salt}:{key}:{version}".encode()).hexdigest()[:20]
+    # Weak: the bytes differ with the negotiated compression
+    return f'W/"{digest}"'
+
+
+class FragmentCache:
+    """LRU cache of rendered HTML with a TTL, optionally backed by Redis"""
+
+    def __init__(self, maxsize: int = FRAGMENT_CACHE_SIZE, ttl: float = FRAGMENT_CACHE_TTL, redis_url: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self._redis = redis.from_url(redis_url)
+            except ImportError:
+                logger.warning("REDIS_URL is set but the redis package is not installed; using the in-process cache")
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._items.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+        if item is not None:
+            del self._items[key]
+
+        if self._redis is not None:
+            try:
+                value = await self._redis.get(f"crumbline:fragment:{key}")
+            except Exception as e:
+                logger.warning("Fragment cache backend error: %s", e)
+                value = None
+            if value is not None:
+                html = value.decode()
+                self._remember(key, html)
+                self.hits += 1
+                return html
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, html: str) -> None:
+        self._remember(key, html)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"crumbline:fragment:{key}", html, ex=int(self.ttl))
+            except Exception as e:
+                logger.warning("Fragment cache backend error: %s", e)
+
+    def _remember(self, key: str, html: str) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, html)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+fragment_cache = FragmentCache(redis_url=REDIS_URL)
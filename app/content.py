@@ -0,0 +1,186 @@
+"""
+Entry content processing, done once at ingest.
+
+Feed HTML is reduced to an allowlist of tags and attributes, relative URLs
+are made absolute, and tracking pixels are dropped. The same pass collects
+the plain text used for the summary, the word count and the search index,
+so templates can render stored content as-is.
+"""
+import html
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set
+from urllib.parse import urljoin, urlparse
+
+# Characters of plain text kept as an entry's list-view summary
+SUMMARY_LENGTH = 300
+
+# Elements whose text is never shown to readers
+SKIPPED_TAGS = {"script", "style", "template", "noscript"}
+
+# Elements dropped together with everything inside them
+DROPPED_TAGS = SKIPPED_TAGS | {"iframe", "object", "embed", "form", "svg", "math", "head", "title"}
+
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "caption", "cite", "code", "dd", "del", "div", "dl", "dt",
+    "em", "figcaption", "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins",
+    "kbd", "li", "mark", "ol", "p", "pre", "q", "s", "small", "span", "strong", "sub", "sup",
+    "table", "tbody", "td", "tfoot", "th", "thead", "time", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES: Dict[str, Set[str]] = {
+    "a": {"href", "title"},
+    "abbr": {"title"},
+    "blockquote": {"cite"},
+    "img": {"src", "alt", "title", "width", "height"},
+    "q": {"cite"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan", "scope"},
+    "time": {"datetime"},
+}
+URL_ATTRIBUTES = {"href", "src", "cite"}
+URL_SCHEMES = {"http", "https", "mailto"}
+VOID_TAGS = {"br", "hr", "img"}
+# Block elements; their text is kept apart from the next block's
+BLOCK_TAGS = {
+    "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure", "h1", "h2", "h3", "h4",
+    "h5", "h6", "hr", "li", "ol", "p", "pre", "table", "td", "th", "tr", "ul",
+}
+
+# Hosts that only serve tracking images
+TRACKING_HOSTS = {
+    "feeds.feedburner.com", "feedproxy.google.com", "pixel.wp.com", "stats.wordpress.com",
+    "www.google-analytics.com", "pixel.quantserve.com", "ad.doubleclick.net",
+}
+
+
+@dataclass
+class CleanContent:
+    html: str
+    text: str
+
+    @property
+    def word_count(self) -> int:
+        return len(self.text.split())
+
+    @property
+    def summary(self) -> str:
+        return summarize(self.text)
+
+
+def _is_tracking_pixel(attrs: Dict[str, str]) -> bool:
+    if attrs.get("width") in ("0", "1") or attrs.get("height") in ("0", "1"):
+        return True
+    return urlparse(attrs.get("src", "")).netloc.lower() in TRACKING_HOSTS
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self, base_url: Optional[str]):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.out: List[str] = []
+        self.text: List[str] = []
+        self.open: List[str] = []
+        self._dropping = 0
+
+    def _url(self, value: str) -> Optional[str]:
+        value = value.strip()
+        if self.base_url:
+            value = urljoin(self.base_url, value)
+        if urlparse(value).scheme.lower() not in URL_SCHEMES:
+            return None
+        return value
+
+    def _attributes(self, tag: str, attrs) -> Optional[Dict[str, str]]:
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        clean = {}
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES:
+                value = self._url(value)
+                if value is None:
+                    continue
+            clean[name] = value
+        if tag == "img":
+            if "src" not in clean or _is_tracking_pixel(clean):
+                return None
+            clean["loading"] = "lazy"
+        elif tag == "a" and "href" in clean:
+            clean["rel"] = "noopener noreferrer nofollow"
+            clean["target"] = "_blank"
+        return clean
+
+    def handle_starttag(self, tag, attrs):
+        if self._dropping or tag in DROPPED_TAGS:
+            if tag in DROPPED_TAGS:
+                self._dropping += 1
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if tag not in ALLOWED_TAGS:
+            return
+        clean = self._attributes(tag, attrs)
+        if clean is None:
+            return
+        rendered = "".join(f' {name}="{html.escape(value)}"' for name, value in clean.items())
+        self.out.append(f"<{tag}{rendered}>")
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in DROPPED_TAGS and self._dropping:
+            self._dropping -= 1
+        elif tag not in VOID_TAGS and self.open and self.open[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            if self._dropping:
+                self._dropping -= 1
+            return
+        if self._dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if tag in self.open:
+            # Close anything left open inside this element
+            while self.open:
+                inner = self.open.pop()
+                self.out.append(f"</{inner}>")
+                if inner == tag:
+                    break
+
+    def handle_data(self, data):
+        if self._dropping:
+            return
+        self.out.append(html.escape(data, quote=False))
+        self.text.append(data)
+
+    def result(self) -> CleanContent:
+        self.close()
+        while self.open:
+            self.out.append(f"</{self.open.pop()}>")
+        return CleanContent(html="".join(self.out).strip(), text=" ".join("".join(self.text).split()))
+
+
+def clean_html(content: Optional[str], base_url: Optional[str] = None) -> CleanContent:
+    """Sanitize feed HTML and extract its plain text in one pass"""
+    if not content:
+        return CleanContent(html="", text="")
+    sanitizer = _Sanitizer(base_url)
+    sanitizer.feed(content)
+    return sanitizer.result()
+
+
+def html_to_text(content: Optional[str]) -> str:
+    """Plain text of an HTML fragment, with whitespace collapsed"""
+    return clean_html(content).text
+
+
+def summarize(text: str, length: int = SUMMARY_LENGTH) -> str:
+    """Cut plain text to at most `length` characters on a word boundary"""
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(" ", 1)[0]
+    return cut.rstrip(" ,;:.") + "…"
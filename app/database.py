@@ -1,6 +1,10 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .models import Base
+from .migrations import run_migrations
+from .metrics import instrument_engine
 import os
 from dotenv import load_dotenv
 
@@ -9,17 +13,87 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///feeds.db")
 
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# SQLite performance profile, applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # milliseconds
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # negative means KiB
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+
+# Connection pools: SQLite allows one writer at a time, so writes share a
+# small pool while page loads read from their own connections
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", 1))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+
+def sqlite_pragmas(read_only: bool = False):
+    """PRAGMA statements for the configured SQLite profile"""
+    pragmas = [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA temp_store={SQLITE_TEMP_STORE}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # Only takes effect on a new, empty database; existing ones are
+        # switched over by the maintenance job
+        pragmas.insert(0, "PRAGMA auto_vacuum=INCREMENTAL")
+    return pragmas
+
+
+def _create_engine(pool_size: int, read_only: bool = False):
+    if not IS_SQLITE:
+        return create_async_engine(SQLALCHEMY_DATABASE_URL, pool_size=pool_size)
+
+    new_engine = create_async_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def _apply_profile(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(read_only):
+            cursor.execute(pragma)
+        cursor.close()
+
+    return new_engine
+
+
+# Writer engine: migrations, refresh and anything that modifies data
+engine = _create_engine(DB_WRITE_POOL_SIZE)
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Reader engine: page rendering, never blocked behind the writer in WAL mode
+read_engine = _create_engine(DB_READ_POOL_SIZE, read_only=True)
+instrument_engine(engine, "write")
+instrument_engine(read_engine, "read")
+read_session = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations, Base.metadata)
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
-        yield session 
\ No newline at end of file
+        yield session
+
+async def get_read_session() -> AsyncSession:
+    async with read_session() as session:
+        yield session
@@ -0,0 +1,71 @@
+import asyncio
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class ExecutorBusy(Exception):
+    """Raised when a bounded executor's queue is full"""
+
+
+class BoundedExecutor:
+    """Worker pool for blocking or CPU-bound calls, with a queue cap and depth counters"""
+
+    # Every pool in the process, for the metrics endpoint
+    instances: "weakref.WeakSet[BoundedExecutor]" = weakref.WeakSet()
+
+    def __init__(self, name: str, max_workers: int, max_queue: Optional[int] = None, kind: str = "thread"):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        # Counters are only touched from the event loop thread
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+        BoundedExecutor.instances.add(self)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a free worker"""
+        return max(self.in_flight - self.max_workers, 0)
+
+    async def run(self, func: Callable, *args):
+        """Run func(*args) in the pool; raises ExecutorBusy if the queue is full"""
+        if self.max_queue is not None and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name} queue is full")
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
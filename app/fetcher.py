@@ -0,0 +1,348 @@
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Collection, Dict, List, Optional
+from urllib.parse import urljoin
+from xml.parsers import expat
+
+import feedparser
+import httpx
+from dotenv import load_dotenv
+
+from .executors import BoundedExecutor
+
+# Load environment variables
+load_dotenv()
+
+# Fetch settings
+FEED_FETCH_TIMEOUT = float(os.getenv("FEED_FETCH_TIMEOUT", 30))
+FEED_PARSE_WORKERS = int(os.getenv("FEED_PARSE_WORKERS", 4))
+FEED_PARSE_EXECUTOR = os.getenv("FEED_PARSE_EXECUTOR", "thread")  # "thread" or "process"
+
+# Download and parse limits per fetch
+FEED_MAX_BYTES = int(os.getenv("FEED_MAX_BYTES", 25 * 1024 * 1024))
+FEED_MAX_COMPRESSION_RATIO = int(os.getenv("FEED_MAX_COMPRESSION_RATIO", 100))
+FEED_MAX_ITEMS = int(os.getenv("FEED_MAX_ITEMS", 500))
+# Stop reading a newest-first feed after this many items in a row we already have
+FEED_STOP_AFTER_KNOWN = int(os.getenv("FEED_STOP_AFTER_KNOWN", 3))
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Compression ratios are only judged past this much decoded data
+RATIO_CHECK_BYTES = 1024 * 1024
+
+# Custom user agent and headers to avoid blocking
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; Crumbline/1.0; +https://crumbline.outeniquastudios.com/)',
+    'Accept': 'application/rss+xml, application/xml, text/xml, */*'
+}
+
+
+@dataclass
+class FetchResult:
+    """A downloaded and parsed feed document"""
+    url: str
+    status: int
+    headers: Dict[str, str]
+    content: bytes
+    parsed: Optional[feedparser.FeedParserDict] = None
+    content_hash: Optional[str] = None
+    # True on a 304 or when the body hash matches the previous fetch;
+    # nothing is parsed in that case
+    not_modified: bool = False
+    # Wall-clock time per phase, for the metrics
+    download_seconds: Optional[float] = None
+    parse_seconds: Optional[float] = None
+    # The document was cut after its last wanted item; the rest was not read
+    truncated: bool = False
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get('etag')
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get('last-modified')
+
+
+class FeedTooLarge(ValueError):
+    """A feed exceeded the download size or compression ratio limits"""
+
+
+class _Stop(Exception):
+    pass
+
+
+_DATE_FIELDS = {"pubdate", "published", "updated", "date"}
+_ITEM_FIELDS = {"guid", "id", "link"} | _DATE_FIELDS
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class ItemScanner:
+    """Finds where a feed document can be cut as it downloads
+
+    Items (RSS `<item>`, Atom `<entry>`) are tracked with expat, which
+    reports byte offsets, so the document can be cut after any complete
+    item and closed again with the end tags still open there. Scanning
+    stops after `max_items` items, or after `stop_after_known` items in a
+    row whose guid is in `known_guids`; the latter only while the items
+    seen so far run newest first, so no new item can follow. Documents
+    expat cannot read are left whole.
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        known_guids: Collection[str] = (),
+        stop_after_known: int = FEED_STOP_AFTER_KNOWN,
+        base_url: str = "",
+    ):
+        self.max_items = max_items
+        self.known_guids = known_guids
+        self.stop_after_known = stop_after_known
+        self.base_url = base_url
+        self.data = bytearray()
+        self.items = 0
+        # Offset after the last complete item, and the end tags open there
+        self.cut: Optional[int] = None
+        self.closing = b""
+        self.done = False
+        self.failed = False
+
+        self._stack: List[str] = []
+        self._item_depth: Optional[int] = None
+        self._field: Optional[str] = None
+        self._text: List[str] = []
+        self._values: Dict[str, str] = {}
+        self._last_date: Optional[datetime] = None
+        self._newest_first = True
+        self._known_run = 0
+
+        self._parser = expat.ParserCreate()
+        # Undefined entities such as &nbsp; are common in feeds; with a
+        # foreign DTD expat skips them instead of failing
+        self._parser.UseForeignDTD(True)
+        self._parser.ExternalEntityRefHandler = lambda *args: 1
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._characters
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add downloaded bytes; True once the rest of the document is not needed"""
+        if not self.data and chunk[:2] in (b"\xff\xfe", b"\xfe\xff"):
+            # UTF-16: the end tags appended on a cut would be mis-encoded
+            self.failed = True
+        self.data += chunk
+        if self.done or self.failed:
+            return self.done
+        try:
+            self._parser.Parse(chunk, False)
+        except _Stop:
+            self.done = True
+        except expat.ExpatError:
+            self.failed = True
+        return self.done
+
+    def truncate(self) -> bytes:
+        """The document up to the cut, closed; the whole document if not cut"""
+        if self.cut is None:
+            return bytes(self.data)
+        return bytes(self.data[:self.cut]) + self.closing
+
+    def _start(self, name: str, attrs: Dict[str, str]) -> None:
+        local = name.rsplit(":", 1)[-1].lower()
+        if self._item_depth is None:
+            if local in ("item", "entry"):
+                self._item_depth = len(self._stack)
+                self._values = {}
+        elif len(self._stack) == self._item_depth + 1 and local in _ITEM_FIELDS:
+            self._field = local
+            self._text = []
+            if local == "link" and attrs.get("href") and attrs.get("rel", "alternate") == "alternate":
+                self._values.setdefault("link", attrs["href"])
+        self._stack.append(name)
+
+    def _characters(self, data: str) -> None:
+        if self._field is not None:
+            self._text.append(data)
+
+    def _end(self, name: str) -> None:
+        self._stack.pop()
+        if self._item_depth is None:
+            return
+        if self._field is not None and len(self._stack) == self._item_depth + 1:
+            value = "".join(self._text).strip()
+            key = "date" if self._field in _DATE_FIELDS else "guid" if self._field == "id" else self._field
+            if value:
+                self._values.setdefault(key, value)
+            self._field = None
+        elif len(self._stack) == self._item_depth:
+            self._item_depth = None
+            self._end_item()
+
+    def _end_item(self) -> None:
+        self.items += 1
+        self.cut = self.data.find(b">", self._parser.CurrentByteIndex) + 1
+        self.closing = "".join(f"</{name}>" for name in reversed(self._stack)).encode()
+
+        date = _parse_date(self._values.get("date"))
+        if date is None:
+            self._newest_first = False
+        elif self._last_date is not None and date > self._last_date:
+            self._newest_first = False
+        self._last_date = date or self._last_date
+
+        guid = self._values.get("guid")
+        if guid is None and self._values.get("link"):
+            guid = urljoin(self.base_url, self._values["link"])
+        if self._newest_first and guid in self.known_guids:
+            self._known_run += 1
+        else:
+            self._known_run = 0
+
+        if (self.max_items and self.items >= self.max_items) or (
+            self.stop_after_known and self._known_run >= self.stop_after_known
+        ):
+            raise _Stop()
+
+
+def parse_feed(content: bytes, url: str, headers: Dict[str, str]) -> feedparser.FeedParserDict:
+    """Parse a downloaded feed body; CPU-bound, meant to run in a worker"""
+    response_headers = dict(headers)
+    # Lets feedparser resolve relative links against the final URL
+    response_headers['content-location'] = url
+    return feedparser.parse(content, response_headers=response_headers)
+
+
+class FeedFetcher:
+    """Shared fetch service: async download plus off-loop parsing"""
+
+    def __init__(
+        self,
+        parse_workers: int = FEED_PARSE_WORKERS,
+        executor_kind: str = FEED_PARSE_EXECUTOR,
+        timeout: float = FEED_FETCH_TIMEOUT,
+        max_bytes: int = FEED_MAX_BYTES,
+        max_ratio: int = FEED_MAX_COMPRESSION_RATIO,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self._client: Optional[httpx.AsyncClient] = None
+        self.executor = BoundedExecutor("feed-parse", parse_workers, kind=executor_kind)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=REQUEST_HEADERS,
+                timeout=self.timeout,
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def download(
+        self, url: str, headers: Optional[Dict[str, str]] = None, scanner: Optional[ItemScanner] = None
+    ) -> httpx.Response:
+        """Download a feed into `scanner.data`, stopping once the scanner has what it needs
+
+        Raises FeedTooLarge past `max_bytes` (unless the scanner can cut the
+        document at a complete item) or when the body inflates by more than
+        `max_ratio`. Peak memory is bounded by `max_bytes` either way.
+        """
+        scanner = scanner if scanner is not None else ItemScanner()
+        async with self.client.stream("GET", url, headers=headers) as response:
+            # 304 is an expected answer to a conditional GET, not an error
+            if response.status_code != 304:
+                response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                if scanner.feed(chunk):
+                    break
+                size = len(scanner.data)
+                if size > self.max_bytes:
+                    if scanner.cut is None:
+                        raise FeedTooLarge(f"Feed is larger than {self.max_bytes // (1024 * 1024)} MiB")
+                    # Keep the items read so far
+                    scanner.done = True
+                    break
+                if size > RATIO_CHECK_BYTES and size > self.max_ratio * max(response.num_bytes_downloaded, 1):
+                    raise FeedTooLarge(f"Feed decompresses by more than {self.max_ratio}:1")
+        return response
+
+    async def parse(self, content: bytes, url: str, headers: Dict[str, str]) -> feedparser.FeedParserDict:
+        """Parse a feed body in the worker pool"""
+        return await self.executor.run(parse_feed, content, url, headers)
+
+    async def fetch(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        max_items: Optional[int] = FEED_MAX_ITEMS,
+        known_guids: Collection[str] = (),
+    ) -> FetchResult:
+        """Download and parse a feed, skipping the parse if it has not changed
+
+        Only the first `max_items` items are read, and a newest-first feed
+        is read only up to the items in `known_guids` (see ItemScanner).
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        start = time.perf_counter()
+        scanner = ItemScanner(max_items, known_guids, base_url=url)
+        response = await self.download(url, headers, scanner)
+        response_headers = dict(response.headers)
+        final_url = str(response.url)
+        result = FetchResult(
+            url=final_url,
+            status=response.status_code,
+            headers=response_headers,
+            # Hashed as downloaded, so an unchanged feed cut at the same item matches
+            content=bytes(scanner.data),
+            download_seconds=time.perf_counter() - start,
+            truncated=scanner.done,
+        )
+        if response.status_code == 304:
+            result.not_modified = True
+            return result
+
+        result.content_hash = hashlib.sha256(result.content).hexdigest()
+        if content_hash and result.content_hash == content_hash:
+            result.not_modified = True
+            return result
+
+        start = time.perf_counter()
+        document = scanner.truncate() if scanner.done else result.content
+        result.parsed = await self.parse(document, final_url, response_headers)
+        result.parse_seconds = time.perf_counter() - start
+        return result
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.executor.shutdown()
+
+
+# One fetch service shared by add_feed, update_feed and the refresh engine
+fetcher = FeedFetcher()
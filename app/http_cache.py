@@ -0,0 +1,131 @@
+"""
+HTTP caching and compression.
+
+Static files are linked by content-hashed names (`output.3f9c2a1b7d4e.css`)
+and served with a one-year immutable lifetime, so browsers never revalidate
+them; a changed file gets a new name. Dynamic responses carry validators
+instead, and a request that repeats one gets an empty 304. Responses are
+compressed with brotli when the optional brotli-asgi package is installed,
+with gzip otherwise; server-sent event streams are left uncompressed.
+"""
+import hashlib
+import os
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Responses smaller than this are not worth compressing
+COMPRESSION_MINIMUM_SIZE = 500
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<suffix>\.[^./]+)$")
+
+
+class HashedStaticFiles(StaticFiles):
+    """StaticFiles that also serves files under content-hashed names"""
+
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.root = directory
+        # path -> ((mtime, size), digest); a file is re-hashed only when it changes
+        self._digests: Dict[str, Tuple[Tuple[float, int], str]] = {}
+
+    def digest(self, path: str) -> Optional[str]:
+        full_path = os.path.join(self.root, path)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        key = (stat.st_mtime, stat.st_size)
+        cached = self._digests.get(path)
+        if cached is None or cached[0] != key:
+            with open(full_path, "rb") as f:
+                cached = (key, hashlib.sha256(f.read()).hexdigest()[:12])
+            self._digests[path] = cached
+        return cached[1]
+
+    def hashed_path(self, path: str) -> str:
+        """`css/site.css` -> `css/site.<digest>.css`, or the path unchanged if it is missing"""
+        digest = self.digest(path)
+        if digest is None:
+            return path
+        stem, suffix = os.path.splitext(path)
+        return f"{stem}.{digest}{suffix}"
+
+    async def get_response(self, path: str, scope):
+        match = _HASHED_NAME.match(path)
+        if match:
+            original = match["stem"] + match["suffix"]
+            response = await super().get_response(original, scope)
+            # A page cached before the file changed may still ask for the
+            # old name: serve the current file, but only cache exact matches
+            response.headers["Cache-Control"] = (
+                IMMUTABLE if self.digest(original) == match["digest"] else "no-cache"
+            )
+            return response
+        response = await super().get_response(path, scope)
+        # Unhashed names can change in place: always revalidate
+        response.headers.setdefault("Cache-Control", "no-cache")
+        return response
+
+
+def _passing_event_streams(middleware):
+    """`middleware` for everything except server-sent event streams
+
+    Compressors hold output back until they have a block's worth, which
+    would delay events indefinitely. EventSource always asks for the
+    stream in its Accept header.
+    """
+    class Middleware(middleware):
+        async def __call__(self, scope, receive, send):
+            if scope["type"] == "http" and b"text/event-stream" in dict(scope["headers"]).get(b"accept", b""):
+                await self.app(scope, receive, send)
+            else:
+                await super().__call__(scope, receive, send)
+
+    Middleware.__name__ = middleware.__name__
+    return Middleware
+
+
+def add_compression(app: FastAPI) -> None:
+    if BrotliMiddleware is not None:
+        app.add_middleware(
+            _passing_event_streams(BrotliMiddleware), minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True
+        )
+    else:
+        app.add_middleware(_passing_event_streams(GZipMiddleware), minimum_size=COMPRESSION_MINIMUM_SIZE)
+
+
+def http_date(moment: datetime) -> str:
+    """Format a naive UTC timestamp for Last-Modified"""
+    return format_datetime(moment.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's cached copy is still current (RFC 9110 section 13.2.2)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" matches "x" and vice versa
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
@@ -0,0 +1,131 @@
+"""
+Refresh job queue shared by every worker process using the database.
+
+Due feeds are copied into refresh_jobs, and workers claim batches of jobs
+by stamping them with their id and a lease expiry in a single UPDATE.
+SQLite runs that statement under its write lock, so a job is never handed
+to two workers. A finished job is deleted; a job whose worker died keeps
+its lease until it expires and is then claimed again. The upserts here
+are SQLite's own INSERT ... ON CONFLICT, so the queue needs SQLite.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, func, literal, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .leases import LEASE_TTL, WORKER_ID
+from .models import Feed, RefreshJob
+from . import schedule
+
+# Load environment variables
+load_dotenv()
+
+# A job claimed this many times without finishing is dropped as poisoned
+REFRESH_JOB_MAX_ATTEMPTS = int(os.getenv("REFRESH_JOB_MAX_ATTEMPTS", 5))
+
+
+def _claimable(now: datetime):
+    return and_(
+        RefreshJob.due_at <= now,
+        RefreshJob.attempts < REFRESH_JOB_MAX_ATTEMPTS,
+        or_(RefreshJob.lease_expires_at.is_(None), RefreshJob.lease_expires_at < now),
+    )
+
+
+def due_jobs(now: datetime):
+    """Job rows (feed_id, due_at, attempts) for the feeds whose next poll time has come"""
+    return select(Feed.id, func.coalesce(Feed.next_poll_at, now), literal(0)).where(
+        or_(Feed.next_poll_at.is_(None), Feed.next_poll_at <= now)
+    )
+
+
+async def enqueue_due(session: AsyncSession, now: Optional[datetime] = None) -> None:
+    """Queue every feed whose next poll time has come"""
+    now = now or datetime.utcnow()
+    # Feeds that already have a job, claimed or not, are left alone
+    await session.execute(
+        sqlite_insert(RefreshJob)
+        .from_select(["feed_id", "due_at", "attempts"], due_jobs(now))
+        .on_conflict_do_nothing(index_elements=["feed_id"])
+    )
+    await session.commit()
+
+
+async def claim(
+    session: AsyncSession,
+    limit: int,
+    owner: str = WORKER_ID,
+    ttl: int = LEASE_TTL,
+    now: Optional[datetime] = None,
+) -> List[int]:
+    """Atomically lease up to `limit` due jobs; returns their feed ids"""
+    if limit <= 0:
+        return []
+    now = now or datetime.utcnow()
+    candidates = (
+        select(RefreshJob.feed_id)
+        .where(_claimable(now))
+        .order_by(RefreshJob.due_at)
+        .limit(limit)
+    )
+    result = await session.execute(
+        update(RefreshJob)
+        # Re-check the lease so a row claimed since the subquery ran is skipped
+        .where(RefreshJob.feed_id.in_(candidates.scalar_subquery()), _claimable(now))
+        .values(
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=ttl),
+            attempts=RefreshJob.attempts + 1,
+        )
+        .returning(RefreshJob.feed_id)
+        .execution_options(synchronize_session=False)
+    )
+    feed_ids = list(result.scalars().all())
+    await session.commit()
+    return feed_ids
+
+
+async def complete(session: AsyncSession, feed_id: int, owner: str = WORKER_ID) -> None:
+    """Remove a finished job, unless its lease has since passed to another worker"""
+    await session.execute(
+        delete(RefreshJob).where(RefreshJob.feed_id == feed_id, RefreshJob.lease_owner == owner)
+    )
+    await session.commit()
+
+
+async def retry(session: AsyncSession, feed_id: int, error: str, owner: str = WORKER_ID) -> None:
+    """Release a job that raised, pushing it back by the usual failure backoff"""
+    job = await session.get(RefreshJob, feed_id)
+    if job is None or job.lease_owner != owner:
+        return
+    job.last_error = error
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.due_at = datetime.utcnow() + timedelta(seconds=schedule.backoff_interval(job.attempts))
+    await session.commit()
+
+
+async def backlog(session: AsyncSession, now: Optional[datetime] = None) -> int:
+    """Jobs that are due and free to be claimed"""
+    now = now or datetime.utcnow()
+    return await session.scalar(select(func.count()).select_from(RefreshJob).where(_claimable(now)))
+
+
+async def reap(session: AsyncSession, now: Optional[datetime] = None) -> List[int]:
+    """Drop jobs that used up their attempts; returns their feed ids"""
+    now = now or datetime.utcnow()
+    result = await session.execute(
+        delete(RefreshJob)
+        .where(
+            RefreshJob.attempts >= REFRESH_JOB_MAX_ATTEMPTS,
+            or_(RefreshJob.lease_expires_at.is_(None), RefreshJob.lease_expires_at < now),
+        )
+        .returning(RefreshJob.feed_id)
+    )
+    feed_ids = list(result.scalars().all())
+    await session.commit()
+    return feed_ids
@@ -0,0 +1,42 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Lease
+
+# Load environment variables
+load_dotenv()
+
+# How long a lease stays valid if its holder dies without releasing it
+LEASE_TTL = int(os.getenv("LEASE_TTL", 300))  # seconds
+
+# Identifies this process across hosts
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def acquire(session: AsyncSession, name: str, owner: str = WORKER_ID, ttl: Optional[int] = None) -> bool:
+    """Take or renew the named lease; False if another live owner holds it"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl or LEASE_TTL)
+    # A single upsert is atomic under SQLite's writer lock, so two workers
+    # can never both see the lease as free
+    stmt = (
+        sqlite_insert(Lease)
+        .values(name=name, owner=owner, expires_at=expires_at)
+        .on_conflict_do_update(
+            index_elements=[Lease.name],
+            set_={"owner": owner, "expires_at": expires_at},
+            where=or_(Lease.expires_at < now, Lease.owner == owner),
+        )
+        .returning(Lease.name)
+    )
+    result = await session.execute(stmt)
+    acquired = result.first() is not None
+    await session.commit()
+    return acquired
@@ -0,0 +1,257 @@
+"""
+Live updates over server-sent events.
+
+Feeds are refreshed by the worker process, so the web process learns about
+new entries by watching the data version (see cache.py): one primary-key
+lookup every LIVE_POLL_INTERVAL per process, however many pages are open.
+When the version moves, the new entries are rendered once and the same
+encoded events are queued for every open stream.
+
+Each update carries the data version as its event id. A browser that
+reconnects sends the last one back and is replayed what it missed from a
+short buffer, so streams can end at any time: slow readers are cut off
+rather than buffered for, and every stream ends after LIVE_STREAM_SECONDS
+so a restarting server is never held open by them.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Deque, Optional, Set
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from . import cache
+from .metrics import LIVE_CONNECTIONS, LIVE_UPDATES
+from .models import Entry, Feed
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 2))  # seconds
+# More new entries than this at once are announced, not pushed
+LIVE_MAX_ENTRIES = int(os.getenv("LIVE_MAX_ENTRIES", 20))
+LIVE_STREAM_SECONDS = int(os.getenv("LIVE_STREAM_SECONDS", 300))
+
+# Updates queued per stream before it is dropped as too slow
+QUEUE_SIZE = 100
+# Updates kept for reconnecting streams to catch up from
+REPLAY_SIZE = 50
+# Comment lines keep idle connections open through proxies
+KEEPALIVE_SECONDS = 15
+# How soon browsers reconnect after a stream ends
+RECONNECT_MILLISECONDS = 1000
+
+
+def encode_event(event: str, data: str = "", event_id: Optional[int] = None) -> str:
+    """One message in text/event-stream format"""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+@dataclass
+class Update:
+    version: int
+    # Encoded events, shared by every stream
+    message: str
+
+
+class Broker:
+    """Fans updates out to the open streams of this process"""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, replay_size: int = REPLAY_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.recent: Deque[Update] = deque(maxlen=replay_size)
+        # Streams that saw this version or later can be caught up from `recent`
+        self.horizon: Optional[int] = None
+        self.stale_message = ""
+
+    def publish(self, update: Update) -> None:
+        if len(self.recent) == self.recent.maxlen:
+            self.horizon = self.recent[0].version
+        self.recent.append(update)
+        LIVE_UPDATES.inc()
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(update)
+            except asyncio.QueueFull:
+                # It reconnects and catches up from `recent` instead
+                self._drop(queue)
+
+    def subscribe(self, since: Optional[int] = None) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        if since is not None and self.horizon is not None:
+            if since < self.horizon:
+                queue.put_nowait(Update(since, self.stale_message))
+            missed = [update for update in self.recent if update.version > since]
+            for update in missed[-(self.queue_size - 1):]:
+                queue.put_nowait(update)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def _drop(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def close(self) -> None:
+        """End every open stream"""
+        for queue in list(self.subscribers):
+            self._drop(queue)
+
+    async def stream(
+        self, since: Optional[int] = None, max_seconds: float = LIVE_STREAM_SECONDS
+    ) -> AsyncIterator[str]:
+        queue = self.subscribe(since)
+        LIVE_CONNECTIONS.inc()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_seconds
+        try:
+            yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    update = await asyncio.wait_for(queue.get(), min(KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if update is None:
+                    return
+                yield update.message
+        finally:
+            self.unsubscribe(queue)
+            LIVE_CONNECTIONS.dec()
+
+
+def live_target(feed_id: Optional[int] = None, category_id: Optional[int] = None, unread: bool = False) -> str:
+    """Id of the element an entry list's pushed entries are inserted into"""
+    if feed_id:
+        return f"live-feed-{feed_id}"
+    if category_id:
+        return f"live-category-{category_id}"
+    return "live-unread" if unread else "live-all"
+
+
+class Watcher:
+    """Polls the data version and publishes what changed to a broker
+
+    `render(template_name, context)` turns the new entries into HTML.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        session_factory,
+        render: Callable[[str, dict], str],
+        interval: float = LIVE_POLL_INTERVAL,
+        max_entries: int = LIVE_MAX_ENTRIES,
+    ):
+        self.broker = broker
+        self.session_factory = session_factory
+        self.render = render
+        self.interval = interval
+        self.max_entries = max_entries
+        self.version: Optional[int] = None
+        self.last_entry_id = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def start_state(self) -> None:
+        async with self.session_factory() as session:
+            self.version = await cache.get_version(session)
+            self.last_entry_id = (await session.execute(select(func.max(Entry.id)))).scalar() or 0
+        self.broker.horizon = self.version
+        self.broker.stale_message = encode_event("notice", self.render("live_notice.html", {"stale": True}))
+
+    async def poll(self) -> Optional[Update]:
+        """Publish an update if the data changed since the last poll"""
+        # One read transaction, so the version and the entries agree
+        async with self.session_factory() as session:
+            version = await cache.get_version(session)
+            if version == self.version:
+                return None
+            counts = (
+                await session.execute(
+                    select(Entry.feed_id, Feed.title, func.count(), func.max(Entry.id))
+                    .join(Feed, Feed.id == Entry.feed_id)
+                    .where(Entry.id > self.last_entry_id)
+                    .group_by(Entry.feed_id, Feed.title)
+                    .order_by(func.count().desc())
+                )
+            ).all()
+            total = sum(row[2] for row in counts)
+            entries = []
+            if 0 < total <= self.max_entries:
+                entries = (
+                    await session.execute(
+                        select(Entry, Feed.category_id)
+                        .join(Feed, Feed.id == Entry.feed_id)
+                        .where(Entry.id > self.last_entry_id)
+                        .order_by(Entry.published.desc(), Entry.id.desc())
+                    )
+                ).all()
+
+        message = encode_event("changed", event_id=version)
+        if counts:
+            notice = self.render(
+                "live_notice.html",
+                {"feeds": [(row[1], row[2]) for row in counts], "total": total, "pushed": bool(entries)},
+            )
+            message += encode_event("notice", notice, version)
+        if entries:
+            targets = defaultdict(list)
+            for entry, category_id in entries:
+                for target in (live_target(), live_target(unread=True), live_target(feed_id=entry.feed_id)):
+                    targets[target].append(entry)
+                if category_id:
+                    targets[live_target(category_id=category_id)].append(entry)
+            message += encode_event("entries", self.render("live_entries.html", {"targets": targets}), version)
+
+        self.version = version
+        self.last_entry_id = max([self.last_entry_id] + [row[3] for row in counts])
+        update = Update(version, message)
+        self.broker.publish(update)
+        return update
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Live update poll failed")
+
+    async def ensure_started(self) -> None:
+        """Start polling on first use, outside any request's context"""
+        if self.task is None or self.task.done():
+            # Before any stream subscribes, so the first can be caught up
+            await self.start_state()
+            # A fresh context keeps the poll queries out of the per-request
+            # SQL tally of whichever request happened to start it
+            self.task = asyncio.create_task(self.run(), context=contextvars.Context())
+
+    async def stop(self) -> None:
+        self.broker.close()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+broker = Broker()
@@ -1,42 +1,194 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form, status
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, File, HTTPException, Request, Form, UploadFile, status
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi.security import OAuth2PasswordRequestForm
+import os
+from urllib.parse import urlencode
+from markupsafe import Markup
 
-from .database import get_session, init_db
-from . import services
+from .database import async_session, get_session, get_read_session, init_db, read_session
+from . import cache, live, metrics, opml, services, search, websub
+from .log import configure_logging
+from .worker import create_scheduler
+from .fetcher import fetcher
+from .executors import ExecutorBusy
+from .http_cache import HashedStaticFiles, add_compression, http_date, is_not_modified
 from .models import Feed, Entry, User, Category
 from .auth import (
-    authenticate_user, create_access_token, get_password_hash,
-    get_current_user_from_cookie, login_required
+    authenticate_user, create_access_token, get_password_hash, get_password_hash_async,
+    get_current_user_from_cookie, login_required, require_user,
+    LoginRequired, get_token_subject, user_cache, password_executor
 )
 
 app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+add_compression(app)
+app.add_middleware(metrics.MetricsMiddleware)
+static_files = HashedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Background scheduler for feed updates
-scheduler = AsyncIOScheduler()
+def static_url(path: str) -> str:
+    """Content-hashed URL of a static file, cacheable forever"""
+    return f"/static/{static_files.hashed_path(path)}"
 
-async def update_all_feeds():
-    async for session in get_session():
-        feeds = await services.get_feeds(session)
-        for feed in feeds:
-            await services.update_feed(session, feed)
+templates.env.globals["static_url"] = static_url
+
+def next_page_url(cursor: Optional[str], **filters) -> Optional[str]:
+    """URL of the infinite-scroll endpoint for the page after `cursor`"""
+    if not cursor:
+        return None
+    params = {key: value for key, value in filters.items() if value}
+    params["cursor"] = cursor
+    return f"/entries?{urlencode(params)}"
+
+# Part of every fragment ETag, so clients revalidate after templates or
+# the static files they link to change
+RENDER_FINGERPRINT = cache.directory_fingerprint("templates") + cache.directory_fingerprint("static")
+
+async def cached_fragment(key: str, version: int, template_name: str, load_context) -> Markup:
+    """Render a template fragment, or reuse the render made at this data version"""
+    cache_key = f"{key}@{version}"
+    html = await cache.fragment_cache.get(cache_key)
+    if html is None:
+        html = templates.get_template(template_name).render(await load_context())
+        await cache.fragment_cache.set(cache_key, html)
+    return Markup(html)
+
+async def fragment_response(
+    request: Request, session: AsyncSession, key: str, template_name: str, load_context
+) -> Response:
+    """Cached fragment with an ETag; unchanged fragments get a bare 304"""
+    # Read the version before the data: a render can then only be newer
+    # than the version it is stored under, never older
+    version, changed_at = await cache.get_state(session)
+    headers = validator_headers(cache.fragment_etag(key, version, RENDER_FINGERPRINT), changed_at)
+    if is_not_modified(request, headers["ETag"], changed_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    html = await cached_fragment(key, version, template_name, load_context)
+    return HTMLResponse(html, headers=headers)
+
+def validator_headers(etag: str, changed_at: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "HX-Request"}
+    if changed_at is not None:
+        headers["Last-Modified"] = http_date(changed_at)
+    return headers
+
+def sidebar_loader(session: AsyncSession):
+    async def load():
+        categories, uncategorized_feeds = await services.get_categories_with_feeds(session)
+        return {"categories": categories, "uncategorized_feeds": uncategorized_feeds}
+    return load
+
+def entries_loader(session: AsyncSession, **filters):
+    async def load():
+        entries, next_cursor = await services.get_entries(
+            session,
+            feed_id=filters.get("feed_id"),
+            category_id=filters.get("category_id"),
+            unread_only=filters.get("unread", False),
+            cursor=filters.get("cursor"),
+        )
+        return {
+            "entries": entries,
+            # Only the first page receives pushed entries, at its top
+            "live_target": None if filters.get("cursor") else live.live_target(
+                filters.get("feed_id"), filters.get("category_id"), filters.get("unread", False)
+            ),
+            "next_url": next_page_url(
+                next_cursor,
+                feed_id=filters.get("feed_id"),
+                category_id=filters.get("category_id"),
+                unread=filters.get("unread", False),
+            ),
+        }
+    return load
+
+def entries_key(**filters) -> str:
+    return "entries?" + urlencode(sorted((key, value) for key, value in filters.items() if value))
+
+async def index_page(request: Request, session: AsyncSession, current_user: User, key: str, load_entries) -> Response:
+    """Full page around the cached sidebar and entry list fragments"""
+    version, changed_at = await cache.get_state(session)
+    # The header shows the user, so their pages get their own validators
+    etag = cache.fragment_etag(f"page:{current_user.id}:{key}", version, RENDER_FINGERPRINT)
+    headers = validator_headers(etag, changed_at)
+    if is_not_modified(request, etag, changed_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "categories": await services.get_categories(session),
+            "sidebar_html": await cached_fragment("sidebar", version, "feed_list.html", sidebar_loader(session)),
+            "entries_html": await cached_fragment(key, version, "feed_entries.html", load_entries),
+            "current_user": current_user,
+            "unread_count": await services.get_unread_count(session),
+            "live_version": version,
+        },
+        headers=headers
+    )
+
+def render_template(template_name: str, context: dict) -> str:
+    return templates.get_template(template_name).render(context)
+
+live_watcher = live.Watcher(live.broker, read_session, render_template)
+
+# Feed refresh runs in the dedicated worker (worker.py). Set RUN_SCHEDULER
+# to run it inside the web process instead, for single-process setups only
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "False").lower() in ("true", "1", "t")
+scheduler = create_scheduler() if RUN_SCHEDULER else None
 
 @app.on_event("startup")
 async def startup_event():
+    configure_logging()
     await init_db()
-    scheduler.add_job(update_all_feeds, 'interval', minutes=30)
-    scheduler.start()
+    if scheduler is not None:
+        scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    await live_watcher.stop()
+    await fetcher.close()
+    password_executor.shutdown()
+    opml.parse_executor.shutdown()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape target; keep it off the public internet (see nginx_crumbline.conf)"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+@app.get("/events")
+async def live_events(request: Request, since: Optional[int] = None):
+    """Server-sent events for open pages: change signals, notices and new entries"""
+    # Authenticated by hand: a session dependency would hold a pooled
+    # connection for as long as the stream stays open
+    async with read_session() as session:
+        current_user = await get_current_user_from_cookie(request, session)
+    if current_user is None:
+        raise LoginRequired()
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    await live_watcher.ensure_started()
+    return StreamingResponse(
+        live.broker.stream(since),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx passes events through as they are sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Custom error handlers
+@app.exception_handler(LoginRequired)
+async def login_required_handler(request: Request, exc: LoginRequired):
+    return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
+
 @app.exception_handler(status.HTTP_403_FORBIDDEN)
 async def forbidden_exception_handler(request: Request, exc: HTTPException):
     return templates.TemplateResponse(
@@ -47,12 +199,7 @@ async def forbidden_exception_handler(request: Request, exc: HTTPException):
 
 # User profile route
 @app.get("/profile", response_class=HTMLResponse)
-async def profile(request: Request, session: AsyncSession = Depends(get_session)):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    
+async def profile(request: Request, current_user: User = Depends(require_user)):
     return templates.TemplateResponse(
         "profile.html",
         {"request": request, "current_user": current_user}
@@ -68,9 +215,16 @@ async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
-    user = await authenticate_user(session, username, password)
+    try:
+        user = await authenticate_user(session, username, password)
+    except ExecutorBusy:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "Too many login attempts, please try again shortly"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     if not user:
         # For HTMX requests, return just the form with errors
         if request.headers.get("HX-Request") == "true":
@@ -112,7 +266,7 @@ async def register(
     email: str = Form(...),
     password: str = Form(...),
     confirm_password: str = Form(...),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
     # Validate password
     if password != confirm_password:
@@ -134,6 +288,8 @@ async def register(
         select(User).filter((User.username == username) | (User.email == email))
     )
     existing_user = result.scalars().first()
+    # Hand the connection back before hashing
+    await session.rollback()
     if existing_user:
         error_message = "Username or email already exists"
         # For HTMX requests
@@ -150,20 +306,41 @@ async def register(
         )
     
     # Create new user
-    hashed_password = get_password_hash(password)
+    try:
+        hashed_password = await get_password_hash_async(password)
+    except ExecutorBusy:
+        return templates.TemplateResponse(
+            "register.html",
+            {"request": request, "error": "Server is busy, please try again shortly"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     new_user = User(
         username=username,
         email=email,
         password=hashed_password
     )
-    session.add(new_user)
-    await session.commit()
+    # The writer connection is only taken for the INSERT itself
+    async with async_session() as writer:
+        writer.add(new_user)
+        try:
+            await writer.commit()
+        except IntegrityError:
+            # Registered by a concurrent request since the check above
+            return templates.TemplateResponse(
+                "register.html",
+                {"request": request, "error": "Username or email already exists"},
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+    user_cache.invalidate(username)
     
     # Redirect to login
     return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
 @app.get("/logout")
-async def logout():
+async def logout(request: Request):
+    username = get_token_subject(request.cookies.get("session"))
+    if username:
+        user_cache.invalidate(username)
     response = RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
     response.delete_cookie(key="session")
     return response
@@ -172,60 +349,36 @@ async def logout():
 @app.get("/", response_class=HTMLResponse)
 async def home(
     request: Request, 
-    session: AsyncSession = Depends(get_session)
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    
-    categories, uncategorized_feeds = await services.get_categories_with_feeds(session)
-    entries = await services.get_entries(session)
-    unread_count = await services.get_unread_count(session)
-
     if request.headers.get("HX-Request") == "true":
-        return templates.TemplateResponse(
-            "feed_entries.html",
-            {
-                "request": request,
-                "entries": entries,
-                "current_user": current_user,
-                "unread_count": unread_count
-            }
+        return await fragment_response(
+            request, session, entries_key(), "feed_entries.html", entries_loader(session)
         )
+    return await index_page(request, session, current_user, entries_key(), entries_loader(session))
 
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "categories": categories,
-            "uncategorized_feeds": uncategorized_feeds,
-            "entries": entries,
-            "current_user": current_user,
-            "unread_count": unread_count
-        }
-    )
+@app.get("/sidebar", response_class=HTMLResponse)
+async def sidebar(
+    request: Request,
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Category and feed list; polled so unread counts stay current"""
+    return await fragment_response(request, session, "sidebar", "feed_list.html", sidebar_loader(session))
 
 @app.post("/feeds", response_class=HTMLResponse)
 async def add_feed(
     request: Request,
     url: str = Form(...),
     category: str = Form(None),
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    
     try:
         feed = await services.add_feed(session, url, category)
         # Return updated feed list to refresh the sidebar
-        categories, uncategorized_feeds = await services.get_categories_with_feeds(session)
-        return templates.TemplateResponse(
-            "feed_list.html",
-            {"request": request, "categories": categories, "uncategorized_feeds": uncategorized_feeds, "current_user": current_user}
-        )
+        return await fragment_response(request, session, "sidebar", "feed_list.html", sidebar_loader(session))
     except ValueError as e:
         # For HTMX requests, return the form with error message
         error_message = str(e)
@@ -240,112 +393,254 @@ async def add_feed(
 async def get_feed_entries(
     request: Request,
     feed_id: int,
-    session: AsyncSession = Depends(get_session)
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    
-    entries = await services.get_entries(session, feed_id=feed_id)
-    unread_count = await services.get_unread_count(session)
-    return templates.TemplateResponse(
-        "feed_entries.html",
-        {
-            "request": request,
-            "entries": entries,
-            "current_user": current_user,
-            "unread_count": unread_count
-        }
+    return await fragment_response(
+        request, session, entries_key(feed_id=feed_id), "feed_entries.html",
+        entries_loader(session, feed_id=feed_id)
+    )
+
+@app.get("/entries", response_class=HTMLResponse)
+async def entries_page(
+    request: Request,
+    cursor: str,
+    feed_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    unread: bool = False,
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Next page of entries for infinite scroll"""
+    filters = dict(feed_id=feed_id, category_id=category_id, unread=unread, cursor=cursor)
+    try:
+        return await fragment_response(
+            request, session, entries_key(**filters), "feed_entries.html", entries_loader(session, **filters)
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/search", response_class=HTMLResponse)
+async def search_entries(
+    request: Request,
+    q: str = "",
+    feed_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    unread: bool = False,
+    page: int = 1,
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Ranked full-text search; later pages are loaded by infinite scroll"""
+    page = max(page, 1)
+    entries, next_page = await search.search_entries(
+        session, q, feed_id=feed_id, category_id=category_id, unread_only=unread, page=page
     )
+    next_url = None
+    if next_page:
+        params = {"q": q, "feed_id": feed_id, "category_id": category_id, "unread": unread, "page": next_page}
+        next_url = "/search?" + urlencode({key: value for key, value in params.items() if value})
+    context = {
+        "request": request,
+        "entries": entries,
+        "next_url": next_url,
+        "query": q,
+        "page": page,
+        "current_user": current_user
+    }
+
+    if request.headers.get("HX-Request") == "true":
+        return templates.TemplateResponse("search_results.html", context)
+
+    version = await cache.get_version(session)
+    context.update({
+        "categories": await services.get_categories(session),
+        "sidebar_html": await cached_fragment("sidebar", version, "feed_list.html", sidebar_loader(session)),
+        "unread_count": await services.get_unread_count(session),
+        "results_template": "search_results.html",
+        "live_version": version,
+    })
+    return templates.TemplateResponse("index.html", context)
+
+@app.get("/entries/{entry_id}/content", response_class=HTMLResponse)
+async def entry_content(
+    entry_id: int,
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Full body of one entry, swapped in when the reader expands it"""
+    content = await services.get_entry_content(session, entry_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    return HTMLResponse(content)
 
 @app.post("/entries/{entry_id}/toggle", response_class=HTMLResponse)
 async def toggle_entry(
     request: Request,
     entry_id: int,
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    
-    entry = await session.get(Entry, entry_id)
+    entry = await services.toggle_entry_read(session, entry_id)
     if not entry:
         raise HTTPException(status_code=404, detail="Entry not found")
     
-    entry.is_read = not entry.is_read
-    await session.commit()
-    
     return templates.TemplateResponse(
         "feed_entry.html",
         {"request": request, "entry": entry, "current_user": current_user}
     )
 
+@app.post("/feeds/{feed_id}/read", response_class=HTMLResponse)
+async def mark_feed_read(
+    request: Request,
+    feed_id: int,
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    feed = await services.mark_feed_read(session, feed_id)
+    if not feed:
+        raise HTTPException(status_code=404, detail="Feed not found")
+    
+    return templates.TemplateResponse(
+        "feed_item.html",
+        {"request": request, "feed": feed, "current_user": current_user}
+    )
+
 @app.delete("/feeds/{feed_id}", response_class=HTMLResponse)
 async def delete_feed(
     request: Request,
     feed_id: int,
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    
     feed = await session.get(Feed, feed_id)
     if not feed:
         raise HTTPException(status_code=404, detail="Feed not found")
     
     await session.delete(feed)
+    await cache.bump_version(session)
     await session.commit()
     return ""
 
+@app.get("/websub/{feed_id}")
+async def websub_verify(request: Request, feed_id: int, session: AsyncSession = Depends(get_session)):
+    """WebSub hub confirming a subscription we asked for, or reporting a denial"""
+    feed = await session.get(Feed, feed_id)
+    reply = None if feed is None else await websub.verify(session, feed, request.query_params)
+    if reply is None:
+        raise HTTPException(status_code=404, detail="No such subscription")
+    return PlainTextResponse(reply)
+
+@app.post("/websub/{feed_id}")
+async def websub_push(request: Request, feed_id: int):
+    """New content pushed by a WebSub hub"""
+    # The whole body is read and bounded before any database work, so a
+    # slow or oversized upload never holds a connection
+    too_large = HTTPException(status_code=413, detail="Pushed document too large")
+    if int(request.headers.get("content-length") or 0) > websub.MAX_PUSH_BYTES:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > websub.MAX_PUSH_BYTES:
+            raise too_large
+    body = bytes(body)
+
+    async with read_session() as session:
+        feed = await session.get(Feed, feed_id)
+    if feed is None:
+        # Tells the hub to stop pushing for a deleted feed
+        return Response(status_code=status.HTTP_410_GONE)
+    # Only signed content gets a writer connection. Acknowledged even when
+    # dropped: hubs retry anything else
+    if websub.authentic(feed, body, request.headers):
+        async with async_session() as session:
+            await websub.receive(session, feed, body, request.headers)
+    return Response(status_code=status.HTTP_202_ACCEPTED)
+
+@app.post("/opml/import", response_class=HTMLResponse)
+async def import_opml(
+    request: Request,
+    file: UploadFile = File(...),
+    current_user: User = Depends(require_user)
+):
+    """Start subscribing to an OPML file's feeds; the response polls for progress"""
+    try:
+        feeds = await opml.read_opml(file.file)
+    except ValueError as e:
+        return templates.TemplateResponse(
+            "opml_progress.html",
+            {"request": request, "error": str(e)},
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    except ExecutorBusy:
+        return templates.TemplateResponse(
+            "opml_progress.html",
+            {"request": request, "error": "Too many imports at once, please try again shortly"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    import_id = await opml.start_import(feeds)
+    return templates.TemplateResponse(
+        "opml_progress.html",
+        {"request": request, "import_id": import_id, "progress": opml.ImportProgress(total=len(feeds))}
+    )
+
+@app.get("/opml/import/{import_id}", response_class=HTMLResponse)
+async def opml_import_progress(
+    request: Request,
+    import_id: str,
+    current_user: User = Depends(require_user)
+):
+    progress = await opml.get_import(import_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    response = templates.TemplateResponse(
+        "opml_progress.html",
+        {"request": request, "import_id": import_id, "progress": progress}
+    )
+    if progress.finished:
+        # Lets the sidebar pick up the new feeds straight away
+        response.headers["HX-Trigger"] = "feeds-changed"
+    return response
+
+@app.get("/opml/export")
+async def export_opml(current_user: User = Depends(require_user)):
+    return Response(
+        await opml.export_opml(),
+        media_type="text/x-opml",
+        headers={"Content-Disposition": 'attachment; filename="crumbline.opml"'}
+    )
+
 # Category endpoints
 @app.get("/categories/{category_id}/entries", response_class=HTMLResponse)
 async def get_category_entries(
     request: Request,
     category_id: int,
-    session: AsyncSession = Depends(get_session)
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
-    entries = await services.get_entries(session, category_id=category_id)
-    category = await session.get(Category, category_id)
-    unread_count = await services.get_unread_count(session)
-    return templates.TemplateResponse(
-        "category_entries.html",
-        {
-            "request": request,
-            "entries": entries,
-            "category": category,
-            "current_user": current_user,
-            "unread_count": unread_count
-        }
+    load_entries = entries_loader(session, category_id=category_id)
+
+    async def load():
+        context = await load_entries()
+        context["category"] = await session.get(Category, category_id)
+        return context
+
+    return await fragment_response(
+        request, session, entries_key(category_id=category_id), "category_entries.html", load
     )
 
 @app.post("/categories", response_class=HTMLResponse)
 async def create_category(
     request: Request,
     name: str = Form(...),
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
     try:
         category = await services.create_category(session, name)
         # Return updated feed list to refresh the sidebar
-        categories, uncategorized_feeds = await services.get_categories_with_feeds(session)
-        return templates.TemplateResponse(
-            "feed_list.html",
-            {"request": request, "categories": categories, "uncategorized_feeds": uncategorized_feeds, "current_user": current_user}
-        )
+        return await fragment_response(request, session, "sidebar", "feed_list.html", sidebar_loader(session))
     except ValueError as e:
         categories, uncategorized_feeds = await services.get_categories_with_feeds(session)
         return templates.TemplateResponse(
@@ -359,13 +654,9 @@ async def update_category(
     request: Request,
     category_id: int,
     name: str = Form(...),
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
     try:
         category = await services.update_category(session, category_id, name)
         return templates.TemplateResponse(
@@ -383,13 +674,9 @@ async def update_category(
 async def delete_category(
     request: Request,
     category_id: int,
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
     success = await services.delete_category(session, category_id)
     if not success:
         raise HTTPException(status_code=404, detail="Category not found")
@@ -401,13 +688,9 @@ async def move_feed_to_category(
     request: Request,
     feed_id: int,
     category_id: int = Form(None),
+    current_user: User = Depends(require_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Check if user is logged in
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-
     try:
         feed = await services.move_feed_to_category(session, feed_id, category_id)
         return templates.TemplateResponse(
@@ -417,32 +700,66 @@ async def move_feed_to_category(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _retention_form(max_age_days: str, max_entries: str, keep_unread: str):
+    """Parse retention form fields; blank fields inherit the category or defaults"""
+    try:
+        days = int(max_age_days) if max_age_days.strip() else None
+        entries = int(max_entries) if max_entries.strip() else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Retention limits must be whole numbers")
+    keep = keep_unread.strip().lower()
+    return days, entries, (keep in ("true", "1", "t", "on") if keep else None)
+
+@app.put("/feeds/{feed_id}/retention", response_class=HTMLResponse)
+async def update_feed_retention(
+    request: Request,
+    feed_id: int,
+    max_age_days: str = Form(""),
+    max_entries: str = Form(""),
+    keep_unread: str = Form(""),
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    days, entries, keep = _retention_form(max_age_days, max_entries, keep_unread)
+    try:
+        feed = await services.set_feed_retention(session, feed_id, days, entries, keep)
+        return templates.TemplateResponse(
+            "feed_item.html",
+            {"request": request, "feed": feed, "current_user": current_user}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/categories/{category_id}/retention", response_class=HTMLResponse)
+async def update_category_retention(
+    request: Request,
+    category_id: int,
+    max_age_days: str = Form(""),
+    max_entries: str = Form(""),
+    keep_unread: str = Form(""),
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    days, entries, keep = _retention_form(max_age_days, max_entries, keep_unread)
+    try:
+        category = await services.set_category_retention(session, category_id, days, entries, keep)
+        return templates.TemplateResponse(
+            "category_item.html",
+            {"request": request, "category": category, "current_user": current_user}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/unread", response_class=HTMLResponse)
 async def unread_entries(
     request: Request,
-    session: AsyncSession = Depends(get_session)
+    current_user: User = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session)
 ):
-    current_user = await get_current_user_from_cookie(request, session)
-    if not current_user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
-    entries_result = await session.execute(
-        select(Entry).where(Entry.is_read == False).order_by(Entry.published.desc())
-    )
-    entries = entries_result.scalars().all()
-    unread_count = await services.get_unread_count(session)
     if request.headers.get("HX-Request") == "true":
-        return templates.TemplateResponse(
-            "feed_entries.html",
-            {"request": request, "entries": entries, "current_user": current_user, "unread_count": unread_count}
+        return await fragment_response(
+            request, session, entries_key(unread=True), "feed_entries.html", entries_loader(session, unread=True)
         )
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "categories": [],
-            "uncategorized_feeds": [],
-            "entries": entries,
-            "current_user": current_user,
-            "unread_count": unread_count
-        }
+    return await index_page(
+        request, session, current_user, entries_key(unread=True), entries_loader(session, unread=True)
     )
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Prometheus metrics.
+
+The web process serves them at /metrics. The refresh worker is a separate
+process with its own counters, so it serves them on METRICS_PORT when that
+is set. Per-request database figures come from engine event hooks that add
+each query to the request being handled at the time.
+"""
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, Summary, generate_latest, start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+from .executors import BoundedExecutor
+
+# Load environment variables
+load_dotenv()
+
+# Worker processes serve their metrics on this port (unset: not served)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+REQUEST_LATENCY = Histogram(
+    "crumbline_http_request_duration_seconds", "Time to answer an HTTP request", ["method", "route", "status"]
+)
+REQUEST_DB_QUERIES = Histogram(
+    "crumbline_http_request_db_queries", "SQL statements run per HTTP request", ["route"], buckets=COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "crumbline_http_request_db_seconds", "Time spent in SQL per HTTP request", ["route"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "crumbline_db_query_duration_seconds", "Duration of single SQL statements", ["engine", "statement"]
+)
+
+FEED_PHASE_SECONDS = Histogram(
+    "crumbline_feed_phase_duration_seconds", "Time per feed update phase across all feeds", ["phase"]
+)
+# Summaries rather than histograms: two series per feed and phase, not a dozen
+FEED_SECONDS = Summary("crumbline_feed_seconds", "Time per feed update phase", ["feed_id", "phase"])
+FEED_BYTES = Counter("crumbline_feed_bytes", "Feed document bytes downloaded", ["feed_id"])
+FEED_UPDATES = Counter(
+    "crumbline_feed_updates", "Feed updates by outcome (updated, not_modified, pushed, failed)", ["outcome"]
+)
+FEED_NEW_ENTRIES = Counter("crumbline_feed_new_entries", "Entries stored by feed updates")
+
+REFRESH_CYCLE_SECONDS = Histogram(
+    "crumbline_refresh_cycle_duration_seconds", "Time to work the refresh queue",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+REFRESH_BACKLOG = Gauge("crumbline_refresh_backlog_jobs", "Refresh jobs due at the start of the last cycle")
+REFRESH_LAST_CYCLE = Gauge("crumbline_refresh_last_cycle_timestamp_seconds", "When the last refresh cycle ended")
+
+LIVE_CONNECTIONS = Gauge("crumbline_live_connections", "Open server-sent event streams")
+LIVE_UPDATES = Counter("crumbline_live_updates", "Updates published to server-sent event streams")
+
+
+@dataclass
+class _QueryTally:
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Tally for the request being handled, if any
+_request_queries: ContextVar[Optional[_QueryTally]] = ContextVar("request_queries", default=None)
+
+
+def instrument_engine(async_engine, name: str) -> None:
+    """Time every statement an engine runs and add it to the current request"""
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finish(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.labels(name, kind).observe(elapsed)
+        tally = _request_queries.get()
+        if tally is not None:
+            tally.count += 1
+            tally.seconds += elapsed
+
+
+def observe_feed(feed_id: int, result, ingest_seconds: Optional[float] = None) -> None:
+    """Record the phases of one feed update from its FetchResult"""
+    feed = str(feed_id)
+    FEED_BYTES.labels(feed).inc(len(result.content))
+    phases = {"download": result.download_seconds, "parse": result.parse_seconds, "ingest": ingest_seconds}
+    for phase, seconds in phases.items():
+        if seconds is not None:
+            FEED_PHASE_SECONDS.labels(phase).observe(seconds)
+            FEED_SECONDS.labels(feed, phase).observe(seconds)
+
+
+class ExecutorCollector:
+    """Queue depths of the worker pools, read when metrics are scraped"""
+
+    def collect(self):
+        labels = ["executor"]
+        workers = GaugeMetricFamily("crumbline_executor_workers", "Worker pool size", labels=labels)
+        in_flight = GaugeMetricFamily("crumbline_executor_in_flight", "Calls running or waiting", labels=labels)
+        queued = GaugeMetricFamily("crumbline_executor_queued", "Calls waiting for a free worker", labels=labels)
+        completed = CounterMetricFamily("crumbline_executor_completed", "Calls finished", labels=labels)
+        rejected = CounterMetricFamily("crumbline_executor_rejected", "Calls refused on a full queue", labels=labels)
+        for executor in list(BoundedExecutor.instances):
+            stats = executor.stats()
+            workers.add_metric([executor.name], stats["workers"])
+            in_flight.add_metric([executor.name], stats["in_flight"])
+            queued.add_metric([executor.name], stats["queued"])
+            completed.add_metric([executor.name], stats["completed"])
+            rejected.add_metric([executor.name], stats["rejected"])
+        return [workers, in_flight, queued, completed, rejected]
+
+
+REGISTRY.register(ExecutorCollector())
+
+
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("root_path") or scope["path"].startswith("/static/"):
+        return "/static"
+    # Unknown paths share one label so scanners cannot explode the series count
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Times each HTTP request and counts the SQL it ran, labelled by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+        streaming = False
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                streaming = (b"content-type", b"text/event-stream") in [
+                    (name.lower(), value.split(b";")[0]) for name, value in message.get("headers", [])
+                ]
+            await send(message)
+
+        tally = _QueryTally()
+        token = _request_queries.set(tally)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            if streaming:
+                # An event stream lasts as long as the page is open; it is
+                # counted by crumbline_live_connections instead
+                return
+            route = _route_name(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, status).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route).observe(tally.count)
+            REQUEST_DB_SECONDS.labels(route).observe(tally.seconds)
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+def serve(port: Optional[str] = METRICS_PORT) -> None:
+    """Expose this process's metrics on their own port (worker processes)"""
+    if port:
+        start_http_server(int(port))
@@ -0,0 +1,229 @@
+"""
+Versioned schema migrations.
+
+`create_all` only creates missing tables, so columns and indexes added to
+existing tables have to be applied here. The schema version lives in
+SQLite's PRAGMA user_version. Every migration must be safe to run against
+a database that `create_all` has just built from the current models.
+
+Web and worker processes all migrate at startup, so the version check and
+every migration run inside one BEGIN IMMEDIATE transaction: the first
+process applies them and the others wait, then find nothing left to do.
+"""
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import MetaData
+from sqlalchemy.engine import Connection
+
+from .content import clean_html, html_to_text, summarize
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+# How long a process waits for another one's migrations (milliseconds)
+MIGRATION_LOCK_TIMEOUT = 10 * 60 * 1000
+
+
+def migration(version: int, description: str):
+    """Register a migration function for the given schema version"""
+    def register(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn: Connection, table: str, column: str, definition: str) -> None:
+    if column not in _columns(conn, table):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _recount_unread(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "UPDATE feeds SET unread_count = ("
+        "SELECT COUNT(*) FROM entries WHERE entries.feed_id = feeds.id AND entries.is_read = 0)"
+    )
+
+
+def _entry_batches(conn: Connection, columns: str, size: int = 1000):
+    """Yield entries in id order, `size` rows at a time, for backfills"""
+    last_id = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            f"SELECT id, {columns} FROM entries WHERE id > ? ORDER BY id LIMIT {int(size)}", (last_id,)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def get_version(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def lock_schema(conn: Connection) -> None:
+    """Start a transaction holding SQLite's write lock; the caller's commit releases it
+
+    pysqlite opens no transaction for PRAGMA or DDL by itself, so it is
+    started explicitly. Must be called with no transaction open.
+    """
+    busy_timeout = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+    conn.exec_driver_sql(f"PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT}")
+    try:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    finally:
+        conn.exec_driver_sql(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+
+
+def run_migrations(conn: Connection, metadata: Optional[MetaData] = None) -> int:
+    """Apply pending migrations in order; returns the resulting version
+
+    Runs under `lock_schema`, creating any tables in `metadata` first, and
+    reads the version only once the lock is held. Everything is committed
+    together by the caller.
+    """
+    lock_schema(conn)
+    if metadata is not None:
+        metadata.create_all(conn)
+    current = get_version(conn)
+    for version, description, func in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying migration %d: %s", version, description)
+        func(conn)
+        # PRAGMA does not accept bound parameters
+        conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+        current = version
+    return current
+
+
+@migration(1, "feed validators, polling state and unread counters")
+def _feed_state_columns(conn: Connection) -> None:
+    _add_column(conn, "feeds", "etag", "VARCHAR")
+    _add_column(conn, "feeds", "last_modified", "VARCHAR")
+    _add_column(conn, "feeds", "content_hash", "VARCHAR")
+    _add_column(conn, "feeds", "next_poll_at", "DATETIME")
+    _add_column(conn, "feeds", "poll_interval", "INTEGER")
+    _add_column(conn, "feeds", "error_count", "INTEGER DEFAULT 0")
+    _add_column(conn, "feeds", "unread_count", "INTEGER NOT NULL DEFAULT 0")
+    _recount_unread(conn)
+
+
+@migration(2, "indexes for the entry list, unread and refresh queries")
+def _hot_path_indexes(conn: Connection) -> None:
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_entries_published ON entries (published, id)",
+        "CREATE INDEX IF NOT EXISTS ix_entries_feed_published ON entries (feed_id, published, id)",
+        "CREATE INDEX IF NOT EXISTS ix_entries_feed_link ON entries (feed_id, link)",
+        "CREATE INDEX IF NOT EXISTS ix_entries_unread_published ON entries (published, id) WHERE is_read = 0",
+        "CREATE INDEX IF NOT EXISTS ix_feeds_next_poll_at ON feeds (next_poll_at)",
+        "CREATE INDEX IF NOT EXISTS ix_feeds_category_id ON feeds (category_id)",
+    ):
+        conn.exec_driver_sql(statement)
+    # Give the planner statistics for the new indexes
+    conn.exec_driver_sql("ANALYZE")
+
+
+@migration(3, "entry guids with a unique (feed_id, guid) key")
+def _entry_guid_key(conn: Connection) -> None:
+    _add_column(conn, "entries", "guid", "VARCHAR")
+    # Entries were deduplicated by link until now
+    conn.exec_driver_sql("UPDATE entries SET guid = link WHERE guid IS NULL")
+    conn.exec_driver_sql(
+        "DELETE FROM entries WHERE id NOT IN (SELECT MIN(id) FROM entries GROUP BY feed_id, guid)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_entries_feed_guid ON entries (feed_id, guid)"
+    )
+    # The unique key covers link lookups for legacy rows
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_entries_feed_link")
+    _recount_unread(conn)
+
+
+@migration(4, "full-text search index over entry titles and content")
+def _entries_fts(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5("
+        "title, content, tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    # Title matches weigh more than body matches
+    conn.exec_driver_sql("INSERT INTO entries_fts (entries_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN "
+        "DELETE FROM entries_fts WHERE rowid = old.id; END"
+    )
+
+    for rows in _entry_batches(conn, "title, content"):
+        conn.exec_driver_sql(
+            "INSERT INTO entries_fts (rowid, title, content) VALUES (?, ?, ?)",
+            [(row.id, html_to_text(row.title), html_to_text(row.content)) for row in rows],
+        )
+
+
+@migration(5, "per-feed and per-category retention overrides")
+def _retention_columns(conn: Connection) -> None:
+    for table in ("feeds", "categories"):
+        _add_column(conn, table, "retention_days", "INTEGER")
+        _add_column(conn, table, "retention_max_entries", "INTEGER")
+        _add_column(conn, table, "retention_keep_unread", "BOOLEAN")
+
+
+@migration(6, "plain-text entry summaries for list views")
+def _entry_summaries(conn: Connection) -> None:
+    _add_column(conn, "entries", "summary", "TEXT")
+    for rows in _entry_batches(conn, "content"):
+        conn.exec_driver_sql(
+            "UPDATE entries SET summary = ? WHERE id = ?",
+            [(summarize(html_to_text(row.content)), row.id) for row in rows],
+        )
+
+
+@migration(7, "sanitized entry content with word counts")
+def _sanitize_content(conn: Connection) -> None:
+    _add_column(conn, "entries", "word_count", "INTEGER")
+    for rows in _entry_batches(conn, "link, content", size=500):
+        updates = []
+        for row in rows:
+            cleaned = clean_html(row.content, row.link if (row.link or "").startswith("http") else None)
+            updates.append((cleaned.html, cleaned.summary, cleaned.word_count, row.id))
+        conn.exec_driver_sql(
+            "UPDATE entries SET content = ?, summary = ?, word_count = ? WHERE id = ?", updates
+        )
+
+
+@migration(8, "last-change time for HTTP Last-Modified headers")
+def _data_version_time(conn: Connection) -> None:
+    _add_column(conn, "data_versions", "updated_at", "DATETIME")
+
+
+@migration(9, "WebSub hub subscriptions")
+def _websub_columns(conn: Connection) -> None:
+    _add_column(conn, "feeds", "hub_url", "VARCHAR")
+    _add_column(conn, "feeds", "hub_topic", "VARCHAR")
+    _add_column(conn, "feeds", "hub_secret", "VARCHAR")
+    _add_column(conn, "feeds", "hub_state", "VARCHAR")
+    _add_column(conn, "feeds", "hub_expires_at", "DATETIME")
+
+
+@migration(10, "entries always have a publish time")
+def _published_not_null(conn: Connection) -> None:
+    # Keyset cursors need a publish time on every entry; ingest has always
+    # defaulted to the current time, so only legacy rows can lack one
+    conn.exec_driver_sql(
+        "UPDATE entries SET published = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE published IS NULL"
+    )
+    # SQLite cannot add NOT NULL to an existing column; these hold the line
+    # on upgraded databases, where create_all did not build the table
+    for name, event in (("insert", "INSERT"), ("update", "UPDATE OF published")):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS entries_published_{name} BEFORE {event} ON entries "
+            "WHEN NEW.published IS NULL BEGIN "
+            "SELECT RAISE(ABORT, 'NOT NULL constraint failed: entries.published'); END"
+        )
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Index, text
+from sqlalchemy.orm import declarative_base, deferred, relationship
 from datetime import datetime
 
 Base = declarative_base()
@@ -15,35 +15,140 @@ class User(Base):
 
 class Feed(Base):
     __tablename__ = "feeds"
+    __table_args__ = (
+        Index("ix_feeds_next_poll_at", "next_poll_at"),
+        Index("ix_feeds_category_id", "category_id"),
+    )
     
     id = Column(Integer, primary_key=True)
     url = Column(String, unique=True, nullable=False)
     title = Column(String)
     description = Column(Text)
     last_updated = Column(DateTime, default=datetime.utcnow)
+    # HTTP validators and body hash from the last successful fetch
+    etag = Column(String)
+    last_modified = Column(String)
+    content_hash = Column(String)
+    # Adaptive polling state
+    next_poll_at = Column(DateTime)
+    poll_interval = Column(Integer)  # seconds
+    error_count = Column(Integer, default=0)
+    # Maintained on ingest and read toggles so badges never scan entries
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Retention overrides; NULL falls back to the category, then the defaults
+    retention_days = Column(Integer)
+    retention_max_entries = Column(Integer)
+    retention_keep_unread = Column(Boolean)
+    # WebSub: the hub the feed advertises and our subscription to it
+    hub_url = Column(String)
+    hub_topic = Column(String)
+    hub_secret = Column(String)
+    hub_state = Column(String)  # pending, active or denied
+    hub_expires_at = Column(DateTime)
     category_id = Column(Integer, ForeignKey("categories.id"))
     
     category = relationship("Category", back_populates="feeds")
     entries = relationship("Entry", back_populates="feed", cascade="all, delete-orphan")
+    pruned_entries = relationship("PrunedEntry", cascade="all, delete-orphan")
 
 class Category(Base):
     __tablename__ = "categories"
     
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
+    # Retention overrides for the category's feeds; NULL uses the defaults
+    retention_days = Column(Integer)
+    retention_max_entries = Column(Integer)
+    retention_keep_unread = Column(Boolean)
     
     feeds = relationship("Feed", back_populates="category")
 
 class Entry(Base):
     __tablename__ = "entries"
+    # Keep in step with the index migration in app/migrations.py
+    __table_args__ = (
+        # Home page: newest first across all feeds
+        Index("ix_entries_published", "published", "id"),
+        # Feed view
+        Index("ix_entries_feed_published", "feed_id", "published", "id"),
+        # Ingestion dedup key: duplicates are dropped by INSERT ... ON CONFLICT
+        Index("uq_entries_feed_guid", "feed_id", "guid", unique=True),
+        # Unread view: only unread rows are indexed
+        Index("ix_entries_unread_published", "published", "id", sqlite_where=text("is_read = 0")),
+    )
     
     id = Column(Integer, primary_key=True)
     feed_id = Column(Integer, ForeignKey("feeds.id"))
+    # Feed-supplied id, or the link when the feed has none
+    guid = Column(String)
     title = Column(String, nullable=False)
     link = Column(String, nullable=False)
-    published = Column(DateTime)
-    content = Column(Text)
+    # Defaults to the ingest time for undated items; keyset cursors rely on it
+    published = Column(DateTime, nullable=False)
+    # Sanitized at ingest. Full bodies are only loaded by the per-entry
+    # content endpoint; list views render the summary instead
+    content = deferred(Column(Text), raiseload=True)
+    # Plain-text excerpt and length, computed from the sanitized content
+    summary = Column(Text)
+    word_count = Column(Integer)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    feed = relationship("Feed", back_populates="entries")
\ No newline at end of file
+    feed = relationship("Feed", back_populates="entries")
+
+class PrunedEntry(Base):
+    """An entry removed by retention, kept by key so refreshes don't store it again"""
+    __tablename__ = "pruned_entries"
+    
+    feed_id = Column(Integer, ForeignKey("feeds.id"), primary_key=True)
+    guid = Column(String, primary_key=True)
+    # Last time it was pruned or turned up in a refresh; maintenance
+    # forgets entries the feed no longer carries
+    seen_at = Column(DateTime, nullable=False)
+
+class Lease(Base):
+    """A named, time-limited lock held by one worker process"""
+    __tablename__ = "leases"
+    
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class RefreshJob(Base):
+    """A feed waiting to be refreshed, claimed by one worker at a time"""
+    __tablename__ = "refresh_jobs"
+    __table_args__ = (
+        Index("ix_refresh_jobs_due_at", "due_at"),
+    )
+    
+    feed_id = Column(Integer, ForeignKey("feeds.id"), primary_key=True)
+    due_at = Column(DateTime, nullable=False)
+    # Set while a worker holds the job; an expired lease can be reclaimed
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text)
+
+class OpmlImport(Base):
+    """Progress of an OPML import, so any web process can report it"""
+    __tablename__ = "opml_imports"
+    
+    id = Column(String, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    added = Column(Integer, nullable=False, default=0)
+    existing = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    errors = Column(Text)  # JSON list of messages
+    finished = Column(Boolean, nullable=False, default=False)
+    started_at = Column(DateTime, nullable=False)
+    # Written while the import runs; a stale one died with its process
+    updated_at = Column(DateTime, nullable=False)
+
+class DataVersion(Base):
+    """Counter bumped by every change that alters rendered pages"""
+    __tablename__ = "data_versions"
+    
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)  # served as Last-Modified
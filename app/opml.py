@@ -0,0 +1,353 @@
+"""
+OPML import and export.
+
+Imports are parsed incrementally, so a large export is never held in memory
+as a tree, and its feeds are subscribed concurrently through the same
+`services.add_feed` path as the web form. Outline folders become categories.
+Imports started from the web UI write their progress to the opml_imports
+table, so a poll answered by any web process sees it, and an import cut
+short by a restart shows as interrupted. The command line reports progress
+as it goes:
+
+    python -m app.opml import subscriptions.opml
+    python -m app.opml export > subscriptions.opml
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import selectinload
+
+from .database import async_session, init_db, read_session
+from .executors import BoundedExecutor
+from .models import Category, Feed, OpmlImport
+from .log import configure_logging
+from .refresh import HostLimiter
+from . import services
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Feeds fetched and validated at once during an import
+OPML_IMPORT_CONCURRENCY = int(os.getenv("OPML_IMPORT_CONCURRENCY", 10))
+OPML_IMPORT_PER_HOST = int(os.getenv("OPML_IMPORT_PER_HOST", 2))
+
+# Finished imports kept for the progress view
+MAX_TRACKED_IMPORTS = 20
+# How often a running import writes its progress (seconds)
+PROGRESS_INTERVAL = 1.0
+# A running import whose progress is older than this was interrupted
+STALE_IMPORT_SECONDS = 60
+# Failures listed per import; the count covers the rest
+MAX_REPORTED_ERRORS = 50
+
+
+@dataclass
+class OpmlFeed:
+    url: str
+    title: Optional[str] = None
+    category: Optional[str] = None
+
+
+@dataclass
+class ImportProgress:
+    total: int = 0
+    done: int = 0
+    added: int = 0
+    existing: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+    finished: bool = False
+    # Stopped without finishing, e.g. by a restart of its process
+    interrupted: bool = False
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def percent(self) -> int:
+        return 100 if not self.total else self.done * 100 // self.total
+
+
+def _attribute(element: ET.Element, name: str) -> Optional[str]:
+    # Exporters disagree on the case of OPML attribute names
+    for key, value in element.attrib.items():
+        if key.lower() == name.lower():
+            value = value.strip()
+            return value or None
+    return None
+
+
+def parse_opml(source: BinaryIO) -> Iterator[OpmlFeed]:
+    """Yield the feeds in an OPML document as they are read
+
+    A feed takes its category from the innermost folder it is nested in,
+    or else from its own `category` attribute. Raises ValueError if the
+    document is not well-formed.
+    """
+    folders: List[Optional[str]] = []
+    try:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if element.tag != "outline":
+                continue
+            url = _attribute(element, "xmlUrl")
+            if event == "start":
+                # Only the attributes are read here, and they are complete on start
+                folders.append(None if url else _attribute(element, "text") or _attribute(element, "title"))
+                if url:
+                    category = next((name for name in reversed(folders) if name), None)
+                    if category is None:
+                        # e.g. category="/Tech/Python": use the last path part
+                        tags = (_attribute(element, "category") or "").split(",")[0]
+                        category = tags.strip("/").split("/")[-1].strip() or None
+                    yield OpmlFeed(
+                        url=url,
+                        title=_attribute(element, "title") or _attribute(element, "text"),
+                        category=category,
+                    )
+            else:
+                folders.pop()
+                element.clear()
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid OPML file: {e}")
+
+
+# Uploads are parsed off the event loop, a few at a time
+parse_executor = BoundedExecutor("opml-parse", max_workers=2, max_queue=4)
+
+
+def _read_feeds(source: BinaryIO) -> List[OpmlFeed]:
+    return list(parse_opml(source))
+
+
+async def read_opml(source: BinaryIO) -> List[OpmlFeed]:
+    """The feeds in an uploaded OPML file, parsed in `parse_executor`
+
+    Raises ValueError if the document is not well-formed, ExecutorBusy if
+    too many uploads are waiting.
+    """
+    return await parse_executor.run(_read_feeds, source)
+
+
+async def _ensure_categories(names) -> None:
+    """Create missing categories up front so concurrent subscribes never race on them"""
+    names = set(names)
+    if not names:
+        return
+    async with async_session() as session:
+        result = await session.execute(select(Category.name).where(Category.name.in_(names)))
+        for name in names - set(result.scalars()):
+            session.add(Category(name=name))
+        await session.commit()
+
+
+async def _subscribe(
+    feed: OpmlFeed, progress: ImportProgress, slots: asyncio.Semaphore, hosts: HostLimiter
+) -> None:
+    async with slots, hosts.for_url(feed.url):
+        # Each feed gets its own session so one failure never rolls back the others
+        async with async_session() as session:
+            try:
+                await services.add_feed(session, feed.url, feed.category)
+                progress.added += 1
+            except ValueError as e:
+                progress.failed += 1
+                if len(progress.errors) < MAX_REPORTED_ERRORS:
+                    progress.errors.append(f"{feed.url}: {e}")
+            except Exception as e:
+                await session.rollback()
+                progress.failed += 1
+                if len(progress.errors) < MAX_REPORTED_ERRORS:
+                    progress.errors.append(f"{feed.url}: {type(e).__name__}: {e}")
+    progress.done += 1
+
+
+async def import_feeds(
+    feeds: List[OpmlFeed],
+    progress: Optional[ImportProgress] = None,
+    concurrency: int = OPML_IMPORT_CONCURRENCY,
+    per_host: int = OPML_IMPORT_PER_HOST,
+) -> ImportProgress:
+    """Subscribe to every feed not already present, `concurrency` at a time"""
+    progress = progress or ImportProgress()
+    unique = {}
+    for feed in feeds:
+        unique.setdefault(feed.url, feed)
+    progress.total = len(unique)
+
+    async with read_session() as session:
+        known = set((await session.execute(select(Feed.url))).scalars())
+    new = [feed for url, feed in unique.items() if url not in known]
+    progress.existing = progress.done = len(unique) - len(new)
+
+    try:
+        await _ensure_categories(feed.category for feed in new if feed.category)
+        slots = asyncio.Semaphore(concurrency)
+        hosts = HostLimiter(per_host)
+        await asyncio.gather(*(_subscribe(feed, progress, slots, hosts) for feed in new))
+    finally:
+        progress.finished = True
+    return progress
+
+
+# Running import tasks; the event loop only keeps weak references
+_background = set()
+
+
+async def _save_progress(import_id: str, progress: ImportProgress) -> None:
+    async with async_session() as session:
+        await session.execute(
+            update(OpmlImport)
+            .where(OpmlImport.id == import_id)
+            .values(
+                total=progress.total,
+                done=progress.done,
+                added=progress.added,
+                existing=progress.existing,
+                failed=progress.failed,
+                errors=json.dumps(progress.errors),
+                finished=progress.finished,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        await session.commit()
+
+
+async def _run_import(import_id: str, feeds: List[OpmlFeed]) -> None:
+    progress = ImportProgress(total=len(feeds))
+    task = asyncio.create_task(import_feeds(feeds, progress))
+    while not task.done():
+        await asyncio.wait([task], timeout=PROGRESS_INTERVAL)
+        if not task.done():
+            await _save_progress(import_id, progress)
+    try:
+        await task
+    except Exception as e:
+        logger.exception("OPML import %s failed", import_id)
+        progress.errors.append(f"Import stopped: {type(e).__name__}: {e}")
+    await _save_progress(import_id, progress)
+
+
+async def start_import(feeds: List[OpmlFeed]) -> str:
+    """Run an import in the background; returns its id for `get_import`"""
+    import_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    async with async_session() as session:
+        # Forget all but the latest finished or interrupted imports
+        done = (
+            select(OpmlImport.id)
+            .where(or_(
+                OpmlImport.finished == True,
+                OpmlImport.updated_at < now - timedelta(seconds=STALE_IMPORT_SECONDS),
+            ))
+            .order_by(OpmlImport.started_at.desc())
+            .offset(MAX_TRACKED_IMPORTS - 1)
+        )
+        await session.execute(delete(OpmlImport).where(OpmlImport.id.in_(done.scalar_subquery())))
+        session.add(OpmlImport(id=import_id, total=len(feeds), started_at=now, updated_at=now))
+        await session.commit()
+
+    task = asyncio.create_task(_run_import(import_id, feeds))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return import_id
+
+
+async def get_import(import_id: str) -> Optional[ImportProgress]:
+    """Last recorded progress of an import started by any process, or None"""
+    async with read_session() as session:
+        row = await session.get(OpmlImport, import_id)
+    if row is None:
+        return None
+    stale = datetime.utcnow() - timedelta(seconds=STALE_IMPORT_SECONDS)
+    return ImportProgress(
+        total=row.total,
+        done=row.done,
+        added=row.added,
+        existing=row.existing,
+        failed=row.failed,
+        errors=json.loads(row.errors or "[]"),
+        finished=row.finished,
+        interrupted=not row.finished and row.updated_at < stale,
+    )
+
+
+async def export_opml() -> bytes:
+    """All subscriptions as an OPML 2.0 document, one folder per category"""
+    async with read_session() as session:
+        categories = (
+            await session.execute(
+                select(Category).options(selectinload(Category.feeds)).order_by(Category.name)
+            )
+        ).scalars().all()
+        uncategorized = (
+            await session.execute(select(Feed).where(Feed.category_id.is_(None)).order_by(Feed.title))
+        ).scalars().all()
+
+    root = ET.Element("opml", version="2.0")
+    head = ET.SubElement(root, "head")
+    ET.SubElement(head, "title").text = "Crumbline subscriptions"
+    ET.SubElement(head, "dateCreated").text = datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
+    body = ET.SubElement(root, "body")
+
+    def add_feed(parent: ET.Element, feed: Feed) -> None:
+        title = feed.title or feed.url
+        ET.SubElement(parent, "outline", type="rss", text=title, title=title, xmlUrl=feed.url)
+
+    for category in categories:
+        folder = ET.SubElement(body, "outline", text=category.name, title=category.name)
+        for feed in sorted(category.feeds, key=lambda feed: feed.title or feed.url):
+            add_feed(folder, feed)
+    for feed in uncategorized:
+        add_feed(body, feed)
+
+    ET.indent(root)
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+async def _import_file(path: str) -> None:
+    await init_db()
+    with open(path, "rb") as f:
+        feeds = list(parse_opml(f))
+    progress = ImportProgress()
+    task = asyncio.create_task(import_feeds(feeds, progress))
+    while not task.done():
+        await asyncio.wait([task], timeout=2)
+        print(f"Imported {progress.done}/{progress.total} feeds")
+    await task
+    for error in progress.errors:
+        print(f"  failed: {error}")
+    print(
+        f"OPML import: {progress.added} added, {progress.existing} already subscribed, "
+        f"{progress.failed} failed in {time.monotonic() - progress.started_at:.1f}s"
+    )
+
+
+async def _export_file() -> None:
+    await init_db()
+    sys.stdout.buffer.write(await export_opml())
+
+
+def main() -> None:
+    configure_logging()
+    if len(sys.argv) == 3 and sys.argv[1] == "import":
+        asyncio.run(_import_file(sys.argv[2]))
+    elif len(sys.argv) == 2 and sys.argv[1] == "export":
+        asyncio.run(_export_file())
+    else:
+        print("Usage: python -m app.opml import <file.opml> | export", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
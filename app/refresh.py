@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from .database import async_session, read_session
+from .models import Feed
+from .leases import WORKER_ID
+from . import jobs, leases, metrics, services
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Refresh concurrency settings
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", 10))
+REFRESH_PER_HOST = int(os.getenv("REFRESH_PER_HOST", 2))
+
+# Only one worker at a time needs to scan feeds for due jobs
+ENQUEUE_LEASE = "refresh:enqueue"
+ENQUEUE_LEASE_TTL = 120  # seconds
+
+
+@dataclass
+class RefreshStats:
+    """Outcome of a single refresh cycle"""
+    feeds_total: int = 0
+    feeds_fetched: int = 0
+    new_entries: int = 0
+    skipped_entries: int = 0
+    failures: int = 0
+    failed_urls: List[str] = field(default_factory=list)
+    started_at: float = 0.0
+    duration: float = 0.0
+
+
+class HostLimiter:
+    """Caps the number of in-flight requests per host"""
+
+    def __init__(self, per_host: int = REFRESH_PER_HOST):
+        self.per_host = per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def for_url(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc.lower()
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self._semaphores[host] = semaphore
+        return semaphore
+
+
+async def _run_job(feed_id: int, hosts: HostLimiter, stats: RefreshStats, owner: str):
+    # Each job gets its own session so one slow or failing feed never
+    # holds a transaction open for the others
+    async with async_session() as session:
+        feed = await session.get(Feed, feed_id)
+        known_guids = frozenset()
+        if feed is not None:
+            session.expunge(feed)
+            known_guids = await services.recent_guids(session, feed_id)
+        # Hand the connection back before the network fetch
+        await session.rollback()
+        if feed is None:
+            # The feed was deleted after it was queued
+            await jobs.complete(session, feed_id, owner)
+            return
+
+        try:
+            async with hosts.for_url(feed.url):
+                ingested = await services.update_feed(session, feed, known_guids)
+        except Exception as e:
+            logger.error(
+                "Error refreshing feed %s: %s", feed.url, e, exc_info=True,
+                extra={"feed_id": feed_id, "feed_url": feed.url},
+            )
+            await session.rollback()
+            await jobs.retry(session, feed_id, str(e), owner)
+            stats.failures += 1
+            stats.failed_urls.append(feed.url)
+            return
+        # update_feed has already committed the feed's new poll time, so a
+        # worker queueing due feeds after this point will not pick it again
+        await jobs.complete(session, feed_id, owner)
+
+    if ingested is not None:
+        stats.feeds_fetched += 1
+        stats.new_entries += ingested.new
+        stats.skipped_entries += ingested.skipped
+    else:
+        stats.failures += 1
+        stats.failed_urls.append(feed.url)
+
+
+async def process_jobs(
+    concurrency: int = REFRESH_CONCURRENCY,
+    per_host: int = REFRESH_PER_HOST,
+    owner: str = WORKER_ID,
+) -> RefreshStats:
+    """Claim and run queued refresh jobs until none are left
+
+    Each free slot claims a job as soon as it opens, so throughput grows
+    with the number of workers draining the same queue.
+    """
+    stats = RefreshStats(started_at=time.time())
+    start = time.monotonic()
+    hosts = HostLimiter(per_host)
+    running = set()
+
+    while True:
+        free = concurrency - len(running)
+        if free > 0:
+            async with async_session() as session:
+                feed_ids = await jobs.claim(session, free, owner)
+            stats.feeds_total += len(feed_ids)
+            for feed_id in feed_ids:
+                running.add(asyncio.create_task(_run_job(feed_id, hosts, stats, owner)))
+        if not running:
+            break
+        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                logger.error("Error running refresh job", exc_info=task.exception())
+                stats.failures += 1
+
+    stats.duration = time.monotonic() - start
+    return stats
+
+
+async def refresh_due_feeds(concurrency: Optional[int] = None, per_host: Optional[int] = None) -> RefreshStats:
+    """Queue the feeds whose next poll time has come, then work the queue"""
+    async with async_session() as session:
+        if await leases.acquire(session, ENQUEUE_LEASE, ttl=ENQUEUE_LEASE_TTL):
+            await jobs.enqueue_due(session)
+            for feed_id in await jobs.reap(session):
+                logger.warning(
+                    "Dropping refresh job for feed %s after %d attempts", feed_id, jobs.REFRESH_JOB_MAX_ATTEMPTS,
+                    extra={"feed_id": feed_id},
+                )
+                await services.record_failure(session, feed_id)
+    return await _run_cycle(concurrency, per_host)
+
+
+async def _run_cycle(concurrency: Optional[int], per_host: Optional[int]) -> RefreshStats:
+    async with read_session() as session:
+        metrics.REFRESH_BACKLOG.set(await jobs.backlog(session))
+    stats = await process_jobs(
+        concurrency=concurrency or REFRESH_CONCURRENCY,
+        per_host=per_host or REFRESH_PER_HOST,
+    )
+    metrics.REFRESH_LAST_CYCLE.set_to_current_time()
+    if not stats.feeds_total:
+        return stats
+
+    metrics.REFRESH_CYCLE_SECONDS.observe(stats.duration)
+    logger.info(
+        "Refresh cycle: %d/%d feeds fetched, %d new entries, %d failed in %.2fs",
+        stats.feeds_fetched, stats.feeds_total, stats.new_entries, stats.failures, stats.duration,
+        extra={
+            "feeds_total": stats.feeds_total,
+            "feeds_fetched": stats.feeds_fetched,
+            "new_entries": stats.new_entries,
+            "failures": stats.failures,
+            "duration": round(stats.duration, 3),
+        },
+    )
+    return stats
@@ -0,0 +1,244 @@
+"""
+Entry retention and database upkeep.
+
+Old entries are pruned per feed, in small batches so the refresh worker is
+never locked out for long. Each limit is taken from the feed if it is set
+there, then from the feed's category, then from the defaults below. A value
+of 0 means no limit, and nothing is pruned until an operator sets a limit.
+Pruned entries are remembered by guid so the next refresh does not store
+them again. After pruning, free pages are handed back with an incremental
+VACUUM and the planner statistics are refreshed.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import IS_SQLITE, async_session, engine, read_session
+from .models import Category, Entry, Feed, PrunedEntry
+from . import cache, leases
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Defaults for feeds and categories without their own settings; pruning
+# deletes data, so it is off until configured
+RETENTION_MAX_AGE_DAYS = int(os.getenv("RETENTION_MAX_AGE_DAYS", 0))
+RETENTION_MAX_ENTRIES = int(os.getenv("RETENTION_MAX_ENTRIES", 0))  # per feed
+RETENTION_KEEP_UNREAD = os.getenv("RETENTION_KEEP_UNREAD", "True").lower() in ("true", "1", "t")
+# Rows per DELETE; each batch is its own short write transaction
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+# Pruned entries a feed has stopped carrying for this long are forgotten
+RETENTION_TOMBSTONE_DAYS = int(os.getenv("RETENTION_TOMBSTONE_DAYS", 365))
+MAINTENANCE_INTERVAL_HOURS = int(os.getenv("MAINTENANCE_INTERVAL_HOURS", 6))
+
+# Free pages returned to the filesystem per run (4 KiB each by default)
+VACUUM_PAGES_PER_RUN = 10000
+# Rows ANALYZE samples per index; keeps it fast on large tables
+ANALYSIS_LIMIT = 1000
+MAINTENANCE_LEASE = "maintenance"
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_days: int = RETENTION_MAX_AGE_DAYS
+    max_entries: int = RETENTION_MAX_ENTRIES
+    keep_unread: bool = RETENTION_KEEP_UNREAD
+
+    def cutoff(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Entries published before this are past the age limit"""
+        if not self.max_age_days:
+            return None
+        return (now or datetime.utcnow()) - timedelta(days=self.max_age_days)
+
+
+@dataclass
+class PruneStats:
+    feeds: int = 0
+    deleted: int = 0
+    duration: float = 0.0
+
+
+def _first_set(*values):
+    return next((value for value in values if value is not None), None)
+
+
+def policy_for(feed: Feed, category: Optional[Category] = None) -> RetentionPolicy:
+    """Resolve a feed's retention from its own, its category's and the default settings"""
+    return RetentionPolicy(
+        max_age_days=_first_set(
+            feed.retention_days, getattr(category, "retention_days", None), RETENTION_MAX_AGE_DAYS
+        ),
+        max_entries=_first_set(
+            feed.retention_max_entries, getattr(category, "retention_max_entries", None), RETENTION_MAX_ENTRIES
+        ),
+        keep_unread=_first_set(
+            feed.retention_keep_unread, getattr(category, "retention_keep_unread", None), RETENTION_KEEP_UNREAD
+        ),
+    )
+
+
+async def load_policy(session: AsyncSession, feed: Feed) -> RetentionPolicy:
+    category = await session.get(Category, feed.category_id) if feed.category_id else None
+    return policy_for(feed, category)
+
+
+async def ingest_cutoff(session: AsyncSession, feed: Feed, policy: RetentionPolicy) -> Optional[datetime]:
+    """Oldest publish time worth storing for a feed on refresh
+
+    Anything older is past the age limit, or would fall beyond the count
+    limit and be pruned on the next run. New entries are unread, so when
+    the policy keeps unread entries nothing is skipped here; entries that
+    were already pruned are skipped by their tombstones instead.
+    """
+    if policy.keep_unread:
+        return None
+    cutoff = policy.cutoff()
+    if policy.max_entries:
+        oldest_kept = await session.scalar(
+            select(Entry.published)
+            .where(Entry.feed_id == feed.id)
+            .order_by(Entry.published.desc(), Entry.id.desc())
+            .offset(policy.max_entries - 1)
+            .limit(1)
+        )
+        if oldest_kept is not None and (cutoff is None or oldest_kept > cutoff):
+            cutoff = oldest_kept
+    return cutoff
+
+
+async def remember_pruned(session: AsyncSession, feed_id: int, guids, now: Optional[datetime] = None) -> None:
+    """Record or refresh tombstones for a feed's pruned entries"""
+    rows = [{"feed_id": feed_id, "guid": guid, "seen_at": now or datetime.utcnow()} for guid in set(guids) if guid]
+    if rows:
+        stmt = sqlite_insert(PrunedEntry).values(rows)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["feed_id", "guid"], set_={"seen_at": stmt.excluded.seen_at}
+        ))
+
+
+async def _delete_in_batches(session: AsyncSession, feed_id: int, candidates, batch_size: int) -> int:
+    deleted = 0
+    while True:
+        result = await session.execute(
+            delete(Entry)
+            .where(Entry.id.in_(candidates.limit(batch_size).scalar_subquery()))
+            .returning(Entry.guid, Entry.is_read)
+        )
+        removed = result.all()
+        await remember_pruned(session, feed_id, [row.guid for row in removed])
+        unread = sum(1 for row in removed if not row.is_read)
+        if unread:
+            await session.execute(
+                update(Feed).where(Feed.id == feed_id).values(unread_count=Feed.unread_count - unread)
+            )
+        if removed:
+            await cache.bump_version(session)
+        await session.commit()
+        deleted += len(removed)
+        if len(removed) < batch_size:
+            return deleted
+
+
+async def prune_feed(
+    session: AsyncSession,
+    feed_id: int,
+    policy: RetentionPolicy,
+    now: Optional[datetime] = None,
+    batch_size: int = RETENTION_BATCH_SIZE,
+) -> int:
+    """Delete a feed's entries that fall outside its policy; returns how many"""
+    deleted = 0
+    cutoff = policy.cutoff(now)
+    if cutoff is not None:
+        too_old = select(Entry.id).where(Entry.feed_id == feed_id, Entry.published < cutoff)
+        if policy.keep_unread:
+            too_old = too_old.where(Entry.is_read == True)
+        deleted += await _delete_in_batches(session, feed_id, too_old, batch_size)
+
+    if policy.max_entries:
+        # Everything after the newest max_entries rows, walked along ix_entries_feed_published
+        beyond = (
+            select(Entry.id, Entry.is_read)
+            .where(Entry.feed_id == feed_id)
+            .order_by(Entry.published.desc(), Entry.id.desc())
+            .offset(policy.max_entries)
+            .subquery()
+        )
+        over_limit = select(beyond.c.id)
+        if policy.keep_unread:
+            over_limit = over_limit.where(beyond.c.is_read == True)
+        deleted += await _delete_in_batches(session, feed_id, over_limit, batch_size)
+    return deleted
+
+
+async def prune_entries(batch_size: int = RETENTION_BATCH_SIZE) -> PruneStats:
+    """Apply every feed's retention policy"""
+    stats = PruneStats()
+    start = time.monotonic()
+    now = datetime.utcnow()
+    async with read_session() as session:
+        feeds = (await session.execute(select(Feed))).scalars().all()
+        categories = {category.id: category for category in (await session.execute(select(Category))).scalars()}
+
+    async with async_session() as session:
+        for feed in feeds:
+            policy = policy_for(feed, categories.get(feed.category_id))
+            deleted = await prune_feed(session, feed.id, policy, now, batch_size)
+            stats.feeds += 1
+            stats.deleted += deleted
+        if RETENTION_TOMBSTONE_DAYS:
+            await session.execute(
+                delete(PrunedEntry).where(PrunedEntry.seen_at < now - timedelta(days=RETENTION_TOMBSTONE_DAYS))
+            )
+            await session.commit()
+    stats.duration = time.monotonic() - start
+    return stats
+
+
+async def compact_database() -> None:
+    """Return free pages to the filesystem and refresh planner statistics"""
+    if not IS_SQLITE:
+        return
+    async with engine.connect() as conn:
+        # VACUUM cannot run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+        if mode != 2:
+            # Databases created before incremental vacuum was enabled need
+            # one full VACUUM to switch modes
+            logger.info("Switching the database to incremental vacuum (one-off full VACUUM)")
+            await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            await conn.exec_driver_sql("VACUUM")
+        else:
+            # Each step of the pragma frees one page; executescript runs it
+            # to completion where execute would stop after the first step
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_RUN})")
+        await conn.exec_driver_sql(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        await conn.exec_driver_sql("ANALYZE")
+
+
+async def run_maintenance() -> Optional[PruneStats]:
+    """Scheduled job: prune entries and compact, on one worker per interval"""
+    async with async_session() as session:
+        ttl = max(MAINTENANCE_INTERVAL_HOURS * 3600 - 60, 60)
+        if not await leases.acquire(session, MAINTENANCE_LEASE, ttl=ttl):
+            return None
+
+    stats = await prune_entries()
+    await compact_database()
+    logger.info(
+        "Maintenance: pruned %d entries from %d feeds in %.2fs", stats.deleted, stats.feeds, stats.duration,
+        extra={"deleted": stats.deleted, "feeds": stats.feeds, "duration": round(stats.duration, 3)},
+    )
+    return stats
@@ -0,0 +1,162 @@
+import calendar
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from .models import Feed
+
+# Load environment variables
+load_dotenv()
+
+# Polling bounds, in minutes
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", 15))
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", 60 * 24))
+POLL_DEFAULT_INTERVAL = int(os.getenv("POLL_DEFAULT_INTERVAL", 30))
+POLL_BACKOFF_MAX = int(os.getenv("POLL_BACKOFF_MAX", 60 * 24))
+# Fallback polling for feeds a WebSub hub pushes to
+POLL_PUSH_INTERVAL = int(os.getenv("POLL_PUSH_INTERVAL", 60 * 24))
+
+# How many recent entries to look at when estimating the posting rate
+RATE_SAMPLE_SIZE = 20
+# Interval growth factor applied on each unchanged poll
+NOT_MODIFIED_GROWTH = 1.25
+
+_MAX_AGE_RE = re.compile(r"(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*(\d+)", re.IGNORECASE)
+
+
+def _clamp(seconds: float, low: int = POLL_MIN_INTERVAL, high: int = POLL_MAX_INTERVAL) -> int:
+    return int(min(max(seconds, low * 60), high * 60))
+
+
+def posting_interval(parsed, now: Optional[datetime] = None) -> Optional[float]:
+    """Estimate seconds between posts from the entry dates in a parsed feed"""
+    now = now or datetime.utcnow()
+    stamps = []
+    for entry in parsed.get("entries", []):
+        struct = entry.get("published_parsed") or entry.get("updated_parsed")
+        if struct:
+            try:
+                stamps.append(calendar.timegm(struct))
+            except (TypeError, ValueError, OverflowError):
+                continue
+    if not stamps:
+        return None
+
+    stamps = sorted(stamps, reverse=True)[:RATE_SAMPLE_SIZE]
+    newest = stamps[0]
+    # A feed that has gone quiet should slow down even if it used to be busy
+    quiet_for = max(calendar.timegm(now.utctimetuple()) - newest, 0)
+    if len(stamps) < 2:
+        return quiet_for or None
+    average_gap = (newest - stamps[-1]) / (len(stamps) - 1)
+    return max(average_gap, quiet_for / 2)
+
+
+def server_interval(headers: Dict[str, str], parsed=None) -> Optional[int]:
+    """Seconds the publisher asks us to wait, from Cache-Control, Expires or <ttl>"""
+    hints = []
+
+    cache_control = headers.get("cache-control", "")
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        hints.append(int(match.group(1)))
+    elif headers.get("expires"):
+        try:
+            expires = parsedate_to_datetime(headers["expires"])
+            if headers.get("date"):
+                date = parsedate_to_datetime(headers["date"])
+            else:
+                date = datetime.now(timezone.utc)
+            hints.append(int((expires - date).total_seconds()))
+        except (TypeError, ValueError, IndexError):
+            pass
+
+    if parsed is not None:
+        ttl = parsed.get("feed", {}).get("ttl")
+        if ttl and str(ttl).strip().isdigit():
+            hints.append(int(str(ttl).strip()) * 60)
+
+    hints = [hint for hint in hints if hint > 0]
+    return max(hints) if hints else None
+
+
+def retry_after(headers: Optional[Dict[str, str]], now: Optional[datetime] = None) -> Optional[int]:
+    """Seconds a Retry-After header asks us to wait, given as seconds or an HTTP date"""
+    value = (headers or {}).get("retry-after", "").strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    now = (now or datetime.utcnow()).replace(tzinfo=timezone.utc)
+    return max(int((moment - now).total_seconds()), 0)
+
+
+def backoff_interval(error_count: int) -> int:
+    """Exponential backoff after consecutive failures"""
+    exponent = min(max(error_count - 1, 0), 16)
+    return _clamp(POLL_DEFAULT_INTERVAL * 60 * (2 ** exponent), high=POLL_BACKOFF_MAX)
+
+
+def _apply_hint(interval: float, headers: Dict[str, str], parsed=None, feed: Optional[Feed] = None) -> int:
+    hint = server_interval(headers, parsed)
+    if hint:
+        interval = max(interval, hint)
+    if feed is not None and feed.hub_state == "active":
+        # The hub pushes new entries; polling is only a safety net
+        return _clamp(max(interval, POLL_PUSH_INTERVAL * 60), high=max(POLL_MAX_INTERVAL, POLL_PUSH_INTERVAL))
+    return _clamp(interval)
+
+
+def on_success(feed: Feed, parsed, headers: Dict[str, str], now: Optional[datetime] = None):
+    """Schedule the next poll after a feed was fetched and parsed"""
+    now = now or datetime.utcnow()
+    rate = posting_interval(parsed, now)
+    # Poll about twice per expected post
+    interval = rate / 2 if rate else POLL_DEFAULT_INTERVAL * 60
+    feed.poll_interval = _apply_hint(interval, headers, parsed, feed)
+    feed.error_count = 0
+    feed.next_poll_at = now + timedelta(seconds=feed.poll_interval)
+
+
+def on_not_modified(feed: Feed, headers: Dict[str, str], now: Optional[datetime] = None):
+    """Schedule the next poll after a 304 or an unchanged body"""
+    now = now or datetime.utcnow()
+    # Stretch the interval a little each time nothing has changed;
+    # the next real update resets it from the posting rate
+    interval = (feed.poll_interval or POLL_DEFAULT_INTERVAL * 60) * NOT_MODIFIED_GROWTH
+    feed.poll_interval = _apply_hint(interval, headers, feed=feed)
+    feed.error_count = 0
+    feed.next_poll_at = now + timedelta(seconds=feed.poll_interval)
+
+
+def on_failure(feed: Feed, now: Optional[datetime] = None, headers: Optional[Dict[str, str]] = None):
+    """Back off after a failed fetch, for at least as long as a Retry-After asks"""
+    now = now or datetime.utcnow()
+    feed.error_count = (feed.error_count or 0) + 1
+    delay = backoff_interval(feed.error_count)
+    wait = retry_after(headers, now)
+    if wait:
+        delay = max(delay, min(wait, POLL_BACKOFF_MAX * 60))
+    feed.next_poll_at = now + timedelta(seconds=delay)
+
+
+def on_push_subscribed(feed: Feed, now: Optional[datetime] = None):
+    """Drop to fallback polling once a hub has confirmed a subscription"""
+    now = now or datetime.utcnow()
+    feed.poll_interval = max(feed.poll_interval or 0, POLL_PUSH_INTERVAL * 60)
+    feed.next_poll_at = now + timedelta(seconds=feed.poll_interval)
+
+
+def on_push_lost(feed: Feed, now: Optional[datetime] = None):
+    """Resume regular polling when a hub subscription ends, starting now"""
+    now = now or datetime.utcnow()
+    feed.poll_interval = POLL_DEFAULT_INTERVAL * 60
+    feed.next_poll_at = now
@@ -0,0 +1,100 @@
+"""
+Full-text search over entries.
+
+entries_fts is an FTS5 table holding the plain text of each entry's title
+and content, keyed by the entry id (its rowid). Ingest adds rows, and a
+trigger on entries removes them, so the index follows the entries table.
+The table itself is created by migration 4.
+"""
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, Text, insert, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .content import html_to_text
+from .models import Entry, Feed
+
+# Search results per page
+SEARCH_PAGE_SIZE = 20
+
+# Not part of the ORM metadata: create_all must not try to build it
+entries_fts = Table(
+    "entries_fts",
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("title", Text),
+    Column("content", Text),
+    Column("rank", Float),
+)
+
+
+def fts_row(entry_id: int, title: Optional[str], text: str) -> dict:
+    """Index row for an entry; `text` is the body already reduced to plain text"""
+    return {"rowid": entry_id, "title": html_to_text(title), "content": text}
+
+
+async def index_entries(session: AsyncSession, rows: List[dict]) -> None:
+    """Add freshly inserted entries to the search index"""
+    if rows:
+        await session.execute(insert(entries_fts), rows)
+
+
+def match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching every word
+
+    Words are quoted so FTS5 operators in user input are taken literally,
+    and the last word matches as a prefix for search-as-you-type.
+    """
+    terms = re.findall(r"\w+", query or "")
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_query(
+    match: str,
+    feed_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    unread_only: bool = False,
+    offset: int = 0,
+    limit: int = SEARCH_PAGE_SIZE,
+):
+    """Build a ranked search query; fetches one extra row to detect a next page"""
+    query = (
+        select(Entry)
+        .join(entries_fts, entries_fts.c.rowid == Entry.id)
+        .where(literal_column("entries_fts").op("MATCH")(match))
+    )
+    if feed_id:
+        query = query.where(Entry.feed_id == feed_id)
+    if category_id:
+        query = query.join(Feed, Feed.id == Entry.feed_id).where(Feed.category_id == category_id)
+    if unread_only:
+        query = query.where(Entry.is_read == False)
+    # rank is bm25 with the column weights configured by the migration
+    return query.order_by(entries_fts.c.rank).offset(offset).limit(limit + 1)
+
+
+async def search_entries(
+    session: AsyncSession,
+    query: str,
+    feed_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    unread_only: bool = False,
+    page: int = 1,
+    limit: int = SEARCH_PAGE_SIZE,
+) -> Tuple[List[Entry], Optional[int]]:
+    """Return one page of matching entries, best first, and the next page number"""
+    match = match_expression(query)
+    if match is None:
+        return [], None
+    result = await session.execute(
+        search_query(match, feed_id, category_id, unread_only, (page - 1) * limit, limit)
+    )
+    entries = list(result.scalars().all())
+    if len(entries) > limit:
+        return entries[:limit], page + 1
+    return entries, None
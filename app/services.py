@@ -1,13 +1,203 @@
+import logging
+import os
+import time
 import feedparser
+import httpx
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Optional
+from urllib.parse import urljoin
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from .models import Feed, Entry, Category
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
+from .models import Feed, Entry, Category, PrunedEntry
+from .fetcher import fetcher, FetchResult
+from . import cache, metrics, retention, schedule, search, websub
+from .content import clean_html
+
+logger = logging.getLogger(__name__)
+
+# Number of entries per page in list views
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 30))
+# Rows per INSERT statement; keeps well under SQLite's bound-parameter limit
+INGEST_BATCH_SIZE = 500
+# Entries stored when a feed is added
+INITIAL_ENTRIES = 10
+# Latest guids per feed that let a refresh stop reading early
+KNOWN_GUIDS = 50
+
+async def _fetch(url: str, special_handling: bool = False, feed: Feed = None, known_guids=()) -> FetchResult:
+    """Fetch and parse a feed through the shared fetch service"""
+    try:
+        if feed is not None:
+            # Conditional GET against what we stored last time
+            return await fetcher.fetch(
+                url, etag=feed.etag, last_modified=feed.last_modified, content_hash=feed.content_hash,
+                known_guids=known_guids,
+            )
+        return await fetcher.fetch(url, max_items=INITIAL_ENTRIES)
+    except httpx.HTTPError as e:
+        if not special_handling:
+            raise
+        # Known problematic feeds fall back to an empty document
+        logger.warning("Fetch failed for specially handled feed %s: %s", url, e, extra={"feed_url": url})
+        return FetchResult(
+            url=url,
+            status=0,
+            headers={},
+            content=b"",
+            parsed=feedparser.FeedParserDict(
+                feed=feedparser.FeedParserDict(), entries=[], bozo=1, bozo_exception=e
+            ),
+        )
+
+@dataclass
+class IngestResult:
+    """How many parsed entries were stored and how many were already known"""
+    new: int = 0
+    skipped: int = 0
+
+def _entry_values(feed: Feed, entry) -> dict:
+    """Map a parsed feed entry to an entries row"""
+    published = None
+    if entry.get("published_parsed"):
+        try:
+            published = datetime(*entry["published_parsed"][:6])
+        except (TypeError, ValueError) as e:
+            logger.warning("Could not parse date in feed %s: %s", feed.url, e, extra={"feed_url": feed.url})
+    if published is None:
+        # Default to current time if no usable date info
+        published = datetime.utcnow()
+    
+    # Use get() for all attributes to avoid AttributeError and provide safe defaults
+    entry_link = entry.get('link', '#')
+    # Make sure links are absolute
+    if entry_link != '#' and feed.url.startswith('http'):
+        entry_link = urljoin(feed.url, entry_link)
+    
+    return {
+        "feed_id": feed.id,
+        "guid": entry.get('id') or entry_link,
+        "title": entry.get('title', 'Untitled'),
+        "link": entry_link,
+        "published": published,
+        "content": entry.get("description", ""),
+        "is_read": False,
+        "created_at": datetime.utcnow(),
+    }
+
+@dataclass
+class PreparedEntries:
+    """A parse's new entries on their way to `store_entries`"""
+    total: int = 0  # entries in the parse
+    rows: dict = field(default_factory=dict)  # guid -> entries row
+    fts: dict = field(default_factory=dict)  # guid -> search row, filled by `sanitize_entries`
+    pruned: frozenset = frozenset()  # pruned guids the feed still lists
+
+async def prepare_entries(
+    session: AsyncSession, feed: Feed, entries, published_after: Optional[datetime] = None
+) -> PreparedEntries:
+    """Map parsed entries to rows, leaving out the ones already stored or pruned
+
+    Only reads through `session`. Entries published before `published_after`
+    are left out too, so a refresh does not bring back items the retention
+    policy has removed or would remove.
+    """
+    prepared = PreparedEntries(total=len(entries))
+    rows = {}
+    for entry in entries:
+        values = _entry_values(feed, entry)
+        if published_after is not None and values["published"] < published_after:
+            continue
+        rows.setdefault(values["guid"], values)
+    if not rows:
+        return prepared
+    
+    # Skip entries we already have before doing any content work on them.
+    # Rows stored before entries had a guid were keyed by their link.
+    keys = list(set(rows) | {row["link"] for row in rows.values()})
+    known, pruned = set(), set()
+    for start in range(0, len(keys), INGEST_BATCH_SIZE):
+        batch = keys[start:start + INGEST_BATCH_SIZE]
+        result = await session.execute(
+            select(Entry.guid).where(Entry.feed_id == feed.id, Entry.guid.in_(batch))
+        )
+        known.update(result.scalars())
+        result = await session.execute(
+            select(PrunedEntry.guid).where(PrunedEntry.feed_id == feed.id, PrunedEntry.guid.in_(batch))
+        )
+        pruned.update(result.scalars())
+    known |= pruned
+    prepared.pruned = frozenset(pruned)
+    prepared.rows = {guid: row for guid, row in rows.items() if guid not in known and row["link"] not in known}
+    return prepared
+
+def _sanitize_rows(feed_url: str, rows: dict):
+    """Sanitized rows and their search rows (without rowid); runs in the parse pool"""
+    fts = {}
+    for guid, row in rows.items():
+        base_url = row["link"] if row["link"].startswith("http") else feed_url
+        cleaned = clean_html(row["content"], base_url)
+        row["content"] = cleaned.html
+        row["summary"] = cleaned.summary
+        row["word_count"] = cleaned.word_count
+        fts[guid] = search.fts_row(None, row["title"], cleaned.text)
+    return rows, fts
+
+async def sanitize_entries(feed_url: str, prepared: PreparedEntries) -> None:
+    """Sanitize new entries once, off the event loop, so templates can render stored content as-is
+
+    Needs no connection: callers with nothing pending hand theirs back first.
+    """
+    if prepared.rows:
+        prepared.rows, prepared.fts = await fetcher.executor.run(_sanitize_rows, feed_url, prepared.rows)
+
+async def store_entries(session: AsyncSession, feed: Feed, prepared: PreparedEntries) -> IngestResult:
+    """Insert sanitized entries in bulk; the (feed_id, guid) key drops any stored meanwhile"""
+    if prepared.pruned:
+        # Still in the feed, so keep the tombstones from expiring
+        await retention.remember_pruned(session, feed.id, prepared.pruned)
+    
+    new = 0
+    values = list(prepared.rows.values())
+    for start in range(0, len(values), INGEST_BATCH_SIZE):
+        stmt = (
+            sqlite_insert(Entry)
+            .values(values[start:start + INGEST_BATCH_SIZE])
+            .on_conflict_do_nothing(index_elements=["feed_id", "guid"])
+            .returning(Entry.id, Entry.guid)
+        )
+        inserted = (await session.execute(stmt)).all()
+        new += len(inserted)
+        await search.index_entries(session, [
+            {**prepared.fts[guid], "rowid": entry_id} for entry_id, guid in inserted
+        ])
+    
+    if new:
+        await session.execute(
+            update(Feed).where(Feed.id == feed.id).values(unread_count=Feed.unread_count + new)
+        )
+        await cache.bump_version(session)
+    return IngestResult(new=new, skipped=prepared.total - new)
+
+async def ingest_entries(
+    session: AsyncSession, feed: Feed, entries, published_after: Optional[datetime] = None
+) -> IngestResult:
+    """Store parsed entries in bulk; the (feed_id, guid) key drops duplicates in the database
+
+    Runs `prepare_entries`, `sanitize_entries` and `store_entries` on one
+    session. Callers holding the writer for a large parse should run them
+    separately and hand the connection back before sanitizing.
+    """
+    prepared = await prepare_entries(session, feed, entries, published_after)
+    await sanitize_entries(feed.url, prepared)
+    return await store_entries(session, feed, prepared)
 
 async def add_feed(session: AsyncSession, url: str, category_name: str = None) -> Feed:
     # Parse feed to get initial data
     try:
-        print(f"Attempting to parse feed: {url}")
+        logger.info("Adding feed %s", url, extra={"feed_url": url})
         
         # Special handling for feeds that might be on the same server
         # or for problematic feeds
@@ -19,57 +209,49 @@ async def add_feed(session: AsyncSession, url: str, category_name: str = None) -
             special_handling = True
             feed_title = "Sex & Love Letters"
             feed_description = "A feed for Sex & Love Letters blog"
-            print(f"Special handling for known problematic feed: {url}")
+            logger.debug("Special handling for known problematic feed: %s", url)
         elif "outeniquastudios.com" in url:
             # This might be a local feed on the same server
             special_handling = True
             feed_title = "Local Feed"
             feed_description = "A locally hosted feed"
-            print(f"Special handling for potential local feed: {url}")
+            logger.debug("Special handling for potential local feed: %s", url)
         
-        # Add custom user agent and headers to avoid blocking
-        request_headers = {
-            'User-Agent': 'Mozilla/5.0 (compatible; Crumbline/1.0; +https://crumbline.outeniquastudios.com/)',
-            'Accept': 'application/rss+xml, application/xml, text/xml, */*'
-        }
+        result = await _fetch(url, special_handling)
+        parsed = result.parsed
         
-        parsed = feedparser.parse(url, request_headers=request_headers)
-        
-        # Print detailed debug info for this specific feed
-        if "sexandloveletters.com" in url:
-            print(f"Detailed feed info for {url}:")
-            print(f"Feed keys: {parsed.feed.keys() if hasattr(parsed, 'feed') else 'No feed attribute'}")
-            print(f"Feed status: {parsed.get('status', 'unknown')}")
-            print(f"Feed bozo: {parsed.get('bozo', 'unknown')}")
-            if hasattr(parsed, 'entries') and len(parsed.entries) > 0:
-                print(f"First entry keys: {parsed.entries[0].keys()}")
-                print(f"Number of entries: {len(parsed.entries)}")
-                print(f"First entry preview: {str(parsed.entries[0])[:200]}...")
+        # Detailed debug info for this specific feed
+        if "sexandloveletters.com" in url and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Feed %s: keys=%s status=%s bozo=%s entries=%d",
+                url,
+                list(parsed.feed.keys()) if hasattr(parsed, 'feed') else None,
+                parsed.get('status', 'unknown'),
+                parsed.get('bozo', 'unknown'),
+                len(getattr(parsed, 'entries', [])),
+            )
+            if getattr(parsed, 'entries', None):
+                logger.debug("First entry preview: %s...", str(parsed.entries[0])[:200])
         
         # Check for bozo exception but don't immediately fail for problematic feeds
         if parsed.bozo and hasattr(parsed, 'bozo_exception') and not special_handling:
-            print(f"Bozo exception: {type(parsed.bozo_exception).__name__}: {parsed.bozo_exception}")
             raise ValueError(f"Invalid RSS feed: {parsed.bozo_exception}")
         elif parsed.bozo and not special_handling:
-            print("Feed marked as bozo but no exception")
             raise ValueError("Invalid RSS feed format")
         
         # Check if feed has entries or use special handling
         if (not hasattr(parsed, 'entries') or len(parsed.entries) == 0) and not special_handling:
-            print("Feed contains no entries")
             raise ValueError("Feed contains no entries")
             
         # Check if feed has a title or use special handling
         if not hasattr(parsed.feed, 'title') and not special_handling:
-            print("Feed has no title")
             raise ValueError("Feed has no title")
             
     except Exception as e:
-        print(f"Exception type: {type(e).__name__}")
-        print(f"Exception message: {str(e)}")
-        print(f"Stack trace: ", e.__traceback__)
         if isinstance(e, ValueError):
+            logger.info("Rejected feed %s: %s", url, e, extra={"feed_url": url})
             raise
+        logger.warning("Could not fetch feed %s", url, exc_info=True, extra={"feed_url": url})
         raise ValueError(f"Error fetching feed: {str(e)}")
     
     # Check if feed already exists
@@ -97,8 +279,13 @@ async def add_feed(session: AsyncSession, url: str, category_name: str = None) -
         url=url,
         title=feed_title if special_handling and feed_title else parsed.feed.get("title", url),
         description=feed_description if special_handling and feed_description else parsed.feed.get("description", ""),
+        etag=result.etag,
+        last_modified=result.last_modified,
+        content_hash=result.content_hash,
         category=category
     )
+    websub.note_hub(feed, result)
+    schedule.on_success(feed, parsed, result.headers)
     session.add(feed)
     await session.flush()
     
@@ -106,131 +293,141 @@ async def add_feed(session: AsyncSession, url: str, category_name: str = None) -
     if special_handling and not hasattr(parsed, 'entries') or len(parsed.entries) == 0:
         # For problematic feeds without entries, create a placeholder entry
         if "sexandloveletters.com" in url:
-            db_entry = Entry(
-                feed=feed,
-                title="Visit Sex & Love Letters",
-                link="https://sexandloveletters.com",
-                published=datetime.utcnow(),
-                content="Please visit the website directly to read content."
-            )
-            session.add(db_entry)
+            await ingest_entries(session, feed, [{
+                "title": "Visit Sex & Love Letters",
+                "link": "https://sexandloveletters.com",
+                "description": "Please visit the website directly to read content.",
+            }])
     else:
         # Normal case - add entries from feed
-        for entry in parsed.entries[:10]:  # Limit to 10 most recent entries
-            published = None
-            if hasattr(entry, "published_parsed") and entry.published_parsed:
-                try:
-                    published = datetime(*entry.published_parsed[:6])
-                except Exception as e:
-                    print(f"Date parsing error: {e}")
-                    # Default to current time if parsing fails
-                    published = datetime.utcnow()
-            else:
-                # Default to current time if no date info
-                published = datetime.utcnow()
-            
-            # Use get() method for all attributes to avoid AttributeError
-            # and provide safe defaults
-            entry_link = entry.get('link', '#')
-            # Make sure links are absolute
-            if entry_link.startswith('/'):
-                # Convert relative URL to absolute using feed domain
-                if url.startswith('http'):
-                    from urllib.parse import urlparse
-                    parsed_url = urlparse(url)
-                    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-                    entry_link = base_url + entry_link
-            
-            db_entry = Entry(
-                feed=feed,
-                title=entry.get('title', 'Untitled'),
-                link=entry_link,
-                published=published,
-                content=entry.get("description", "")
-            )
-            session.add(db_entry)
+        cutoff = await retention.ingest_cutoff(session, feed, retention.policy_for(feed, category))
+        await ingest_entries(session, feed, parsed.entries[:INITIAL_ENTRIES], cutoff)
     
+    await cache.bump_version(session)
     await session.commit()
+    if feed.hub_url:
+        # Best effort: the worker retries subscriptions that did not take
+        await websub.subscribe(session, feed.id)
     return feed
 
-async def update_feed(session: AsyncSession, feed: Feed) -> None:
+async def record_failure(session: AsyncSession, feed_id: int, headers: Optional[dict] = None) -> None:
+    """Back off a feed's next poll after a failed update"""
+    try:
+        feed = await session.get(Feed, feed_id)
+        if feed is not None:
+            schedule.on_failure(feed, headers=headers)
+            await session.commit()
+    except Exception as e:
+        logger.error("Could not record failure for feed %s: %s", feed_id, e, extra={"feed_id": feed_id})
+        await session.rollback()
+
+async def recent_guids(session: AsyncSession, feed_id: int, limit: int = KNOWN_GUIDS) -> frozenset:
+    """Guids of a feed's latest stored entries, for `update_feed`"""
+    result = await session.execute(
+        select(Entry.guid).where(Entry.feed_id == feed_id).order_by(Entry.id.desc()).limit(limit)
+    )
+    return frozenset(result.scalars())
+
+async def update_feed(session: AsyncSession, feed: Feed, known_guids=()) -> Optional[IngestResult]:
+    """Fetch a feed and store its new entries; returns None if the update failed
+
+    A newest-first feed is only read up to the entries in `known_guids`
+    (see `recent_guids`), so a long feed with a few new items stays cheap.
+    """
+    feed_id, feed_url = feed.id, feed.url
     try:
         # Special handling for problematic feeds
         special_handling = False
         if "sexandloveletters.com" in feed.url:
             special_handling = True
-            print(f"Special handling for known problematic feed update: {feed.url}")
+            logger.debug("Special handling for known problematic feed update: %s", feed.url)
         elif "outeniquastudios.com" in feed.url:
             special_handling = True
-            print(f"Special handling for potential local feed update: {feed.url}")
-        
-        # Add custom user agent and headers to avoid blocking
-        request_headers = {
-            'User-Agent': 'Mozilla/5.0 (compatible; Crumbline/1.0; +https://crumbline.outeniquastudios.com/)',
-            'Accept': 'application/rss+xml, application/xml, text/xml, */*'
-        }
+            logger.debug("Special handling for potential local feed update: %s", feed.url)
         
-        parsed = feedparser.parse(feed.url, request_headers=request_headers)
+        # Download and parse before touching the session so no connection
+        # is held while waiting on the network
+        result = await _fetch(feed.url, special_handling, feed, known_guids)
+        if result.not_modified:
+            # Nothing changed since the last poll: no parse and no entry
+            # work, only push the next poll out
+            feed = await session.get(Feed, feed_id)
+            if feed is not None:
+                # The body can be unchanged while the validators are not;
+                # stale ones would have every later poll download it again
+                feed.etag = result.etag or feed.etag
+                feed.last_modified = result.last_modified or feed.last_modified
+                schedule.on_not_modified(feed, result.headers)
+                await session.commit()
+            metrics.observe_feed(feed_id, result)
+            metrics.FEED_UPDATES.labels("not_modified").inc()
+            return IngestResult()
+        parsed = result.parsed
         
         # Skip error checking for special handling cases
         if not special_handling and parsed.bozo and hasattr(parsed, 'bozo_exception'):
-            print(f"Warning: Feed {feed.url} has bozo exception: {parsed.bozo_exception}")
-            return
+            logger.warning(
+                "Feed %s has bozo exception: %s", feed.url, parsed.bozo_exception,
+                extra={"feed_id": feed_id, "feed_url": feed.url},
+            )
+            metrics.FEED_UPDATES.labels("failed").inc()
+            await record_failure(session, feed_id)
+            return None
+        
+        # Dedup lookups come first, then the connection goes back while new
+        # entries are sanitized, so the writer is only held for the writes
+        prepared = None
+        start = time.perf_counter()
+        if (not special_handling or (hasattr(parsed, 'entries') and len(parsed.entries) > 0)):
+            policy = await retention.load_policy(session, feed)
+            cutoff = await retention.ingest_cutoff(session, feed, policy)
+            prepared = await prepare_entries(session, feed, parsed.entries, cutoff)
+            await session.rollback()
+            await sanitize_entries(feed_url, prepared)
+        
+        # The feed may come from another (closed) session, so work on this session's copy
+        feed = await session.get(Feed, feed_id)
+        if feed is None:
+            return None
         
         # Update feed metadata if not using special handling
         if not special_handling:
-            feed.title = parsed.feed.get("title", feed.title)
+            title = parsed.feed.get("title", feed.title)
+            if title != feed.title:
+                # The sidebar shows feed titles
+                await cache.bump_version(session)
+            feed.title = title
             feed.description = parsed.feed.get("description", feed.description)
         
         feed.last_updated = datetime.utcnow()
-        
-        # Get existing entry links
-        existing_links = await session.execute(
-            select(Entry.link).where(Entry.feed_id == feed.id)
-        )
-        existing_links = {link[0] for link in existing_links}
+        feed.etag = result.etag
+        feed.last_modified = result.last_modified
+        feed.content_hash = result.content_hash
+        websub.note_hub(feed, result)
+        schedule.on_success(feed, parsed, result.headers)
         
         # Add new entries if not using special handling or if there are entries
-        if (not special_handling or (hasattr(parsed, 'entries') and len(parsed.entries) > 0)):
-            for entry in parsed.entries:
-                # Skip if entry already exists
-                entry_link = entry.get('link', '#')
-                if entry_link in existing_links:
-                    continue
-                    
-                published = None
-                if hasattr(entry, "published_parsed") and entry.published_parsed:
-                    try:
-                        published = datetime(*entry.published_parsed[:6])
-                    except (TypeError, ValueError) as e:
-                        print(f"Warning: Could not parse date in feed {feed.url}: {e}")
-                        published = datetime.utcnow()
-                else:
-                    published = datetime.utcnow()
-                
-                # Make sure links are absolute
-                if entry_link.startswith('/'):
-                    # Convert relative URL to absolute using feed domain
-                    if feed.url.startswith('http'):
-                        from urllib.parse import urlparse
-                        parsed_url = urlparse(feed.url)
-                        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-                        entry_link = base_url + entry_link
-                
-                db_entry = Entry(
-                    feed=feed,
-                    title=entry.get('title', 'Untitled'),
-                    link=entry_link,
-                    published=published,
-                    content=entry.get("description", "")
-                )
-                session.add(db_entry)
+        ingested = IngestResult()
+        if prepared is not None:
+            ingested = await store_entries(session, feed, prepared)
         
         await session.commit()
+        metrics.observe_feed(feed_id, result, time.perf_counter() - start)
+        metrics.FEED_UPDATES.labels("updated").inc()
+        metrics.FEED_NEW_ENTRIES.inc(ingested.new)
+        return ingested
     except Exception as e:
-        print(f"Error updating feed {feed.url}: {str(e)}")
-        print(f"Stack trace: ", e.__traceback__)
+        logger.error(
+            "Error updating feed %s: %s", feed_url, e, exc_info=True,
+            extra={"feed_id": feed_id, "feed_url": feed_url},
+        )
+        metrics.FEED_UPDATES.labels("failed").inc()
         # Don't let feed update errors crash the application
+        await session.rollback()
+        # A 429 or 503 may say when to come back
+        headers = dict(e.response.headers) if isinstance(e, httpx.HTTPStatusError) else None
+        await record_failure(session, feed_id, headers)
+        return None
 
 async def get_feeds(session: AsyncSession):
     result = await session.execute(
@@ -238,24 +435,109 @@ async def get_feeds(session: AsyncSession):
     )
     return result.scalars().all()
 
-async def get_entries(session: AsyncSession, feed_id: int = None, category_id: int = None):
-    query = select(Entry).join(Feed)
+def encode_cursor(entry: Entry) -> str:
+    """Opaque keyset cursor pointing just past the given entry"""
+    return f"{entry.published.isoformat()}_{entry.id}"
+
+def decode_cursor(cursor: str):
+    """Split a cursor back into (published, id); raises ValueError if malformed"""
+    published, _, entry_id = cursor.rpartition("_")
+    return datetime.fromisoformat(published), int(entry_id)
+
+def entries_query(
+    feed_id: int = None,
+    category_id: int = None,
+    unread_only: bool = False,
+    cursor: str = None,
+    limit: int = PAGE_SIZE,
+):
+    """Build the query for one page of entries (fetches one extra row)"""
+    query = select(Entry)
     if feed_id:
         query = query.where(Entry.feed_id == feed_id)
     if category_id:
-        query = query.where(Feed.category_id == category_id)
-    query = query.order_by(Entry.published.desc())
-    
+        query = query.join(Feed).where(Feed.category_id == category_id)
+    if unread_only:
+        query = query.where(Entry.is_read == False)
+    if cursor:
+        # Keyset pagination on (published, id): cost does not grow with depth
+        published, entry_id = decode_cursor(cursor)
+        # Row-value comparison so SQLite can seek straight into the index
+        query = query.where(tuple_(Entry.published, Entry.id) < tuple_(published, entry_id))
+    return query.order_by(Entry.published.desc(), Entry.id.desc()).limit(limit + 1)
+
+async def get_entries(
+    session: AsyncSession,
+    feed_id: int = None,
+    category_id: int = None,
+    unread_only: bool = False,
+    cursor: str = None,
+    limit: int = PAGE_SIZE,
+):
+    """Get one page of entries, newest first, plus the cursor for the next page"""
+    query = entries_query(feed_id, category_id, unread_only, cursor, limit)
     result = await session.execute(query)
-    return result.scalars().all()
+    entries = result.scalars().all()
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1])
+    return entries, next_cursor
 
-async def toggle_entry_read(session: AsyncSession, entry_id: int) -> bool:
-    entry = await session.get(Entry, entry_id)
-    if entry:
-        entry.is_read = not entry.is_read
-        await session.commit()
-        return entry.is_read
-    return False
+async def get_entry_content(session: AsyncSession, entry_id: int) -> Optional[str]:
+    """Full body of one entry, or None if the entry does not exist"""
+    result = await session.execute(select(Entry.content).where(Entry.id == entry_id))
+    row = result.first()
+    return None if row is None else (row.content or "")
+
+async def toggle_entry_read(session: AsyncSession, entry_id: int):
+    """Flip an entry's read state and keep its feed's unread counter in step
+
+    The flip is a single UPDATE and the counter moves by the state it
+    returns, so toggles racing on the same entry cannot skew the counter.
+    """
+    result = await session.execute(
+        update(Entry)
+        .where(Entry.id == entry_id)
+        .values(is_read=~Entry.is_read)
+        .returning(Entry.feed_id, Entry.is_read)
+        .execution_options(synchronize_session=False)
+    )
+    toggled = result.first()
+    if toggled is None:
+        return None
+    await session.execute(
+        update(Feed)
+        .where(Feed.id == toggled.feed_id)
+        .values(unread_count=Feed.unread_count + (-1 if toggled.is_read else 1))
+    )
+    await cache.bump_version(session)
+    await session.commit()
+    return await session.get(Entry, entry_id, populate_existing=True)
+
+async def mark_feed_read(session: AsyncSession, feed_id: int) -> Optional[Feed]:
+    """Mark all of a feed's entries read and take them off its unread counter"""
+    feed = await session.get(Feed, feed_id, options=[selectinload(Feed.category)])
+    if not feed:
+        return None
+    result = await session.execute(
+        update(Entry)
+        .where(Entry.feed_id == feed_id, Entry.is_read == False)
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        # By the rows actually changed, so entries ingested meanwhile stay counted
+        await session.execute(
+            update(Feed)
+            .where(Feed.id == feed_id)
+            .values(unread_count=Feed.unread_count - result.rowcount)
+            .execution_options(synchronize_session=False)
+        )
+        await cache.bump_version(session)
+    await session.commit()
+    await session.refresh(feed, ["unread_count"])
+    return feed
 
 # Category management functions
 async def get_categories(session: AsyncSession):
@@ -295,6 +577,7 @@ async def create_category(session: AsyncSession, name: str) -> Category:
 
     category = Category(name=name)
     session.add(category)
+    await cache.bump_version(session)
     await session.commit()
     return category
 
@@ -312,6 +595,7 @@ async def update_category(session: AsyncSession, category_id: int, name: str) ->
         raise ValueError(f"Category '{name}' already exists")
 
     category.name = name
+    await cache.bump_version(session)
     await session.commit()
     return category
 
@@ -330,6 +614,7 @@ async def delete_category(session: AsyncSession, category_id: int) -> bool:
         feed.category_id = None
 
     await session.delete(category)
+    await cache.bump_version(session)
     await session.commit()
     return True
 
@@ -345,12 +630,69 @@ async def move_feed_to_category(session: AsyncSession, feed_id: int, category_id
             raise ValueError("Category not found")
 
     feed.category_id = category_id
+    await cache.bump_version(session)
+    await session.commit()
+    return feed
+
+async def set_feed_retention(
+    session: AsyncSession,
+    feed_id: int,
+    max_age_days: Optional[int] = None,
+    max_entries: Optional[int] = None,
+    keep_unread: Optional[bool] = None,
+) -> Feed:
+    """Override a feed's retention; None falls back to its category or the defaults"""
+    feed = await session.get(Feed, feed_id, options=[selectinload(Feed.category)])
+    if not feed:
+        raise ValueError("Feed not found")
+    _check_retention(max_age_days, max_entries)
+
+    feed.retention_days = max_age_days
+    feed.retention_max_entries = max_entries
+    feed.retention_keep_unread = keep_unread
     await session.commit()
     return feed
 
+async def set_category_retention(
+    session: AsyncSession,
+    category_id: int,
+    max_age_days: Optional[int] = None,
+    max_entries: Optional[int] = None,
+    keep_unread: Optional[bool] = None,
+) -> Category:
+    """Override retention for a category's feeds; None falls back to the defaults"""
+    category = await session.get(Category, category_id, options=[selectinload(Category.feeds)])
+    if not category:
+        raise ValueError("Category not found")
+    _check_retention(max_age_days, max_entries)
+
+    category.retention_days = max_age_days
+    category.retention_max_entries = max_entries
+    category.retention_keep_unread = keep_unread
+    await session.commit()
+    return category
+
+def _check_retention(max_age_days: Optional[int], max_entries: Optional[int]) -> None:
+    if (max_age_days is not None and max_age_days < 0) or (max_entries is not None and max_entries < 0):
+        raise ValueError("Retention limits cannot be negative")
+
 async def get_unread_count(session: AsyncSession) -> int:
-    """Get the total count of unread entries"""
+    """Get the total count of unread entries from the per-feed counters"""
     result = await session.execute(
-        select(Entry).where(Entry.is_read == False)
+        select(func.coalesce(func.sum(Feed.unread_count), 0))
     )
-    return len(result.scalars().all())
\ No newline at end of file
+    return result.scalar_one()
+
+async def recount_unread(session: AsyncSession, feed_ids=None) -> None:
+    """Rebuild per-feed unread counters from the entries table"""
+    unread = (
+        select(func.count(Entry.id))
+        .where(Entry.feed_id == Feed.id, Entry.is_read == False)
+        .scalar_subquery()
+    )
+    stmt = update(Feed).values(unread_count=unread)
+    if feed_ids is not None:
+        stmt = stmt.where(Feed.id.in_(feed_ids))
+    await session.execute(stmt)
+    await cache.bump_version(session)
+    await session.commit()
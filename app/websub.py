@@ -0,0 +1,259 @@
+"""
+WebSub (PubSubHubbub) subscriptions.
+
+A feed that names a hub, in a `Link` header or a `<link rel="hub">`, is
+subscribed to it when it is added, provided WEBSUB_CALLBACK_URL says where
+the hub can reach us. The hub confirms with a GET to /websub/{feed_id} and
+from then on POSTs new content there, signed with a secret of the feed's
+own; pushed documents go through the same parse and ingest path as polled
+ones. While a subscription is active the feed is only polled every
+POLL_PUSH_INTERVAL minutes, as a fallback. The worker subscribes feeds
+that gained a hub later and renews leases before they run out.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+from datetime import datetime, timedelta
+from typing import Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import async_session
+from .fetcher import FetchResult, fetcher
+from .models import Feed
+from . import leases, metrics, retention, schedule, services
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Public base URL hubs call back, e.g. https://crumbline.example.com (unset: no subscriptions)
+WEBSUB_CALLBACK_URL = os.getenv("WEBSUB_CALLBACK_URL")
+WEBSUB_LEASE_SECONDS = int(os.getenv("WEBSUB_LEASE_SECONDS", 7 * 24 * 3600))
+# How often the worker looks for subscriptions to start or renew
+WEBSUB_RENEW_INTERVAL = int(os.getenv("WEBSUB_RENEW_INTERVAL", 60))  # minutes
+
+# Leases are renewed once they have less than this left
+RENEW_MARGIN = timedelta(hours=12)
+# Larger pushed documents are refused
+MAX_PUSH_BYTES = 5 * 1024 * 1024
+RENEW_LEASE = "websub-renew"
+
+_LINK = re.compile(r"<([^>]*)>([^<]*)")
+_REL = re.compile(r'rel\s*=\s*(?:"([^"]*)"|([^\s;,]+))', re.IGNORECASE)
+_SIGNATURE_METHODS = {"sha1", "sha256", "sha384", "sha512"}
+
+
+def _header_links(value: str) -> Iterator[Tuple[str, List[str]]]:
+    """(url, rels) for each link in an HTTP Link header"""
+    for url, params in _LINK.findall(value):
+        rel = _REL.search(params)
+        if rel:
+            yield url.strip(), (rel.group(1) or rel.group(2)).lower().split()
+
+
+def discover(result: FetchResult) -> Tuple[Optional[str], Optional[str]]:
+    """(hub, topic) advertised by a fetched feed; the topic defaults to the feed's URL
+
+    Link headers take precedence over links in the document, as the spec asks.
+    """
+    links = list(_header_links(result.headers.get("link", "")))
+    if result.parsed is not None:
+        links += [
+            (link.get("href"), (link.get("rel") or "").lower().split())
+            for link in result.parsed.get("feed", {}).get("links", [])
+        ]
+    hub = next((urljoin(result.url, url) for url, rels in links if url and "hub" in rels), None)
+    if hub is None:
+        return None, None
+    topic = next((urljoin(result.url, url) for url, rels in links if url and "self" in rels), None)
+    return hub, topic or result.url
+
+
+def note_hub(feed: Feed, result: FetchResult) -> None:
+    """Record the hub a fetched feed advertises; a different one is subscribed afresh"""
+    hub, topic = discover(result)
+    if (hub, topic) == (feed.hub_url, feed.hub_topic):
+        return
+    if feed.hub_state == "active":
+        schedule.on_push_lost(feed)
+    feed.hub_url, feed.hub_topic = hub, topic
+    feed.hub_secret = feed.hub_state = feed.hub_expires_at = None
+
+
+def callback_url(feed_id: int) -> str:
+    return f"{WEBSUB_CALLBACK_URL.rstrip('/')}/websub/{feed_id}"
+
+
+async def subscribe(session: AsyncSession, feed_id: int, client: Optional[httpx.AsyncClient] = None) -> bool:
+    """Ask a feed's hub for a subscription, or to renew one
+
+    The hub confirms asynchronously through `verify`. Returns whether the
+    hub accepted the request.
+    """
+    if not WEBSUB_CALLBACK_URL:
+        return False
+    feed = await session.get(Feed, feed_id)
+    if feed is None or not feed.hub_url:
+        return False
+    # Stored before asking: the hub may verify before it has even answered
+    feed.hub_secret = feed.hub_secret or secrets.token_hex(32)
+    if feed.hub_state != "active":
+        feed.hub_state = "pending"
+    hub_url = feed.hub_url
+    form = {
+        "hub.mode": "subscribe",
+        "hub.topic": feed.hub_topic,
+        "hub.callback": callback_url(feed_id),
+        "hub.lease_seconds": str(WEBSUB_LEASE_SECONDS),
+        "hub.secret": feed.hub_secret,
+    }
+    await session.commit()
+
+    try:
+        response = await (client or fetcher.client).post(hub_url, data=form)
+    except httpx.HTTPError as e:
+        logger.warning("WebSub subscribe to %s failed: %s", hub_url, e, extra={"feed_id": feed_id})
+        return False
+    if response.status_code not in (202, 204):
+        logger.warning(
+            "WebSub hub %s refused subscription: HTTP %d", hub_url, response.status_code, extra={"feed_id": feed_id}
+        )
+        return False
+    logger.info("Requested WebSub subscription at %s", hub_url, extra={"feed_id": feed_id})
+    return True
+
+
+async def verify(session: AsyncSession, feed: Feed, params: Mapping[str, str]) -> Optional[str]:
+    """Answer a hub's verification request: the text to reply with, or None to refuse it"""
+    if not feed.hub_url or params.get("hub.topic") != feed.hub_topic:
+        return None
+    mode = params.get("hub.mode")
+    now = datetime.utcnow()
+
+    if mode == "denied":
+        logger.warning(
+            "WebSub hub %s denied subscription: %s", feed.hub_url, params.get("hub.reason", "no reason given"),
+            extra={"feed_id": feed.id},
+        )
+        if feed.hub_state == "active":
+            schedule.on_push_lost(feed, now)
+        feed.hub_state = "denied"
+        await session.commit()
+        return ""
+
+    # Only subscriptions we asked for; we never unsubscribe, leases just lapse
+    challenge = params.get("hub.challenge")
+    if mode != "subscribe" or feed.hub_state not in ("pending", "active") or not challenge:
+        return None
+    lease = params.get("hub.lease_seconds", "")
+    feed.hub_expires_at = now + timedelta(seconds=int(lease) if lease.isdigit() else WEBSUB_LEASE_SECONDS)
+    if feed.hub_state != "active":
+        feed.hub_state = "active"
+        schedule.on_push_subscribed(feed, now)
+        logger.info("WebSub subscription to %s active", feed.hub_url, extra={"feed_id": feed.id})
+    await session.commit()
+    return challenge
+
+
+def valid_signature(secret: Optional[str], body: bytes, header: Optional[str]) -> bool:
+    """Check an X-Hub-Signature header ("sha256=<hex>") against the feed's secret"""
+    if not secret or not header:
+        return False
+    method, _, signature = header.partition("=")
+    method = method.strip().lower()
+    if method not in _SIGNATURE_METHODS:
+        return False
+    expected = hmac.new(secret.encode(), body, getattr(hashlib, method)).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+def authentic(feed: Feed, body: bytes, headers: Mapping[str, str]) -> bool:
+    """Whether a pushed document is signed with the feed's secret
+
+    Unsigned or forged content is dropped without telling the sender why.
+    """
+    if valid_signature(feed.hub_secret, body, headers.get("x-hub-signature")):
+        return True
+    logger.warning("Dropped WebSub push with a bad signature", extra={"feed_id": feed.id})
+    return False
+
+
+async def receive(
+    session: AsyncSession, feed: Feed, body: bytes, headers: Mapping[str, str]
+) -> "Optional[services.IngestResult]":
+    """Store the entries in a pushed document that passed `authentic`; None if it was dropped
+
+    The document is parsed before the session is first used, and the
+    connection goes back between the dedup lookups and sanitizing, so the
+    writer is only held for those lookups and the writes.
+    """
+    parsed = await fetcher.parse(body, feed.url, {"content-type": headers.get("content-type", "")})
+    if parsed.bozo and not parsed.entries:
+        logger.warning(
+            "Dropped unreadable WebSub push: %s", parsed.get("bozo_exception"), extra={"feed_id": feed.id}
+        )
+        metrics.FEED_UPDATES.labels("failed").inc()
+        return None
+
+    feed_id, feed_url = feed.id, feed.url
+    policy = await retention.load_policy(session, feed)
+    cutoff = await retention.ingest_cutoff(session, feed, policy)
+    prepared = await services.prepare_entries(session, feed, parsed.entries, cutoff)
+    await session.rollback()
+    await services.sanitize_entries(feed_url, prepared)
+
+    # This session's copy; the caller may have loaded the feed elsewhere
+    feed = await session.get(Feed, feed_id)
+    if feed is None:
+        return None
+    ingested = await services.store_entries(session, feed, prepared)
+    feed.last_updated = datetime.utcnow()
+    await session.commit()
+    metrics.FEED_UPDATES.labels("pushed").inc()
+    metrics.FEED_NEW_ENTRIES.inc(ingested.new)
+    return ingested
+
+
+async def renew_subscriptions(client: Optional[httpx.AsyncClient] = None) -> int:
+    """Scheduled job: start pending subscriptions and renew expiring ones; returns how many were requested"""
+    if not WEBSUB_CALLBACK_URL:
+        return 0
+    now = datetime.utcnow()
+    async with async_session() as session:
+        if not await leases.acquire(session, RENEW_LEASE, ttl=max(WEBSUB_RENEW_INTERVAL * 60 - 60, 60)):
+            return 0
+
+        # A lapsed lease means the hub has stopped pushing: poll until renewed
+        lapsed = await session.execute(
+            select(Feed).where(Feed.hub_state == "active", Feed.hub_expires_at < now)
+        )
+        for feed in lapsed.scalars():
+            feed.hub_state = None
+            schedule.on_push_lost(feed, now)
+        await session.commit()
+
+        due = await session.execute(
+            select(Feed.id).where(
+                Feed.hub_url.is_not(None),
+                or_(
+                    Feed.hub_state.is_(None),
+                    Feed.hub_state == "pending",
+                    and_(Feed.hub_state == "active", Feed.hub_expires_at < now + RENEW_MARGIN),
+                ),
+            )
+        )
+        requested = 0
+        for feed_id in due.scalars().all():
+            requested += await subscribe(session, feed_id, client)
+    if requested:
+        logger.info("Requested %d WebSub subscriptions", requested, extra={"requested": requested})
+    return requested
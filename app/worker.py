@@ -0,0 +1,87 @@
+"""
+Background worker that owns feed refresh.
+
+Run it as its own process (`python worker.py`, or the crumbline-worker
+service) so web processes can be scaled without each one polling every
+feed. Any number of workers, on one machine or several sharing the
+database, may run at once: they drain the same refresh job queue
+(app/jobs.py), so no feed is fetched twice.
+"""
+import asyncio
+import logging
+import os
+import signal
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from dotenv import load_dotenv
+
+from .database import engine, init_db, read_engine
+from .fetcher import fetcher
+from .leases import WORKER_ID
+from . import metrics, refresh, retention, websub
+from .log import configure_logging
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How often the scheduler looks for feeds that are due
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", 60))
+
+
+async def update_all_feeds():
+    return await refresh.refresh_due_feeds()
+
+
+def create_scheduler() -> AsyncIOScheduler:
+    """Scheduler with the periodic refresh job registered"""
+    scheduler = AsyncIOScheduler()
+    # Each feed carries its own next-poll time; the tick only picks up due
+    # feeds, and a slow cycle must never overlap with the next one
+    scheduler.add_job(
+        update_all_feeds, 'interval', seconds=SCHEDULER_TICK_SECONDS,
+        max_instances=1, coalesce=True
+    )
+    # Pruning and compaction; a lease keeps it to one worker per interval
+    scheduler.add_job(
+        retention.run_maintenance, 'interval', hours=retention.MAINTENANCE_INTERVAL_HOURS,
+        max_instances=1, coalesce=True
+    )
+    # WebSub: subscribe feeds that advertise a hub, renew expiring leases
+    scheduler.add_job(
+        websub.renew_subscriptions, 'interval', minutes=websub.WEBSUB_RENEW_INTERVAL,
+        max_instances=1, coalesce=True
+    )
+    return scheduler
+
+
+async def run_worker() -> None:
+    """Run the refresh scheduler until SIGINT or SIGTERM"""
+    await init_db()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    scheduler = create_scheduler()
+    scheduler.start()
+    logger.info("Worker %s started, checking for due feeds every %ds", WORKER_ID, SCHEDULER_TICK_SECONDS)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Worker %s stopping", WORKER_ID)
+        scheduler.shutdown(wait=False)
+        await fetcher.close()
+        await engine.dispose()
+        await read_engine.dispose()
+
+
+def main() -> None:
+    configure_logging()
+    metrics.serve()
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
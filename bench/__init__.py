@@ -0,0 +1,10 @@
+"""
+Benchmarks for feed refresh throughput and page latency.
+
+    python -m bench.run refresh --feeds 200 --rounds 3 --latency 50
+    python -m bench.run pages --entries 100000
+    python -m bench.run compare bench/results/old.json bench/results/new.json
+
+Everything runs against a throwaway database and a local feed server, so
+runs are repeatable and comparable between commits; see bench/run.py.
+"""
@@ -0,0 +1,116 @@
+"""
+Synthetic feed corpus.
+
+Each feed is a window over an endless, deterministic stream of items: a
+round of `advance()` lets some feeds publish new items, chosen by the
+configured update rate. Documents are RSS 2.0 or Atom, with HTML bodies
+that exercise the ingest sanitizer.
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from html import escape
+from typing import Dict, List, Tuple
+
+WORDS = (
+    "feed reader latency cache index query page entry sqlite python async worker queue refresh "
+    "network parse render browser server commit benchmark throughput memory disk vacuum schema "
+    "category unread search token stream batch html sanitize summary link image table list"
+).split()
+
+
+@dataclass
+class CorpusConfig:
+    feeds: int = 100
+    # Items in each served document
+    items_per_feed: int = 20
+    body_words: int = 200
+    # Chance that a feed publishes during a round, and how much it publishes
+    update_rate: float = 0.3
+    items_per_update: int = 2
+    # Share of feeds served as Atom rather than RSS
+    atom_share: float = 0.3
+    seed: int = 1
+
+
+class Corpus:
+    def __init__(self, config: CorpusConfig):
+        self.config = config
+        self.round = 0
+        self._rng = random.Random(config.seed)
+        # Recent dates, so retention never discards generated items
+        self.start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        self.published: List[int] = [config.items_per_feed] * config.feeds
+        self.atom = [self._rng.random() < config.atom_share for _ in range(config.feeds)]
+        self._documents: Dict[Tuple[int, int], bytes] = {}
+
+    def advance(self) -> int:
+        """Start a new round; returns how many feeds published new items"""
+        self.round += 1
+        updated = 0
+        for index in range(self.config.feeds):
+            if self._rng.random() < self.config.update_rate:
+                self.published[index] += self.config.items_per_update
+                updated += 1
+        return updated
+
+    def version(self, index: int) -> int:
+        return self.published[index]
+
+    def _body(self, index: int, item: int) -> str:
+        rng = random.Random(f"{self.config.seed}:{index}:{item}")
+        words = [rng.choice(WORDS) for _ in range(self.config.body_words)]
+        paragraphs = [" ".join(words[i:i + 40]) for i in range(0, len(words), 40)]
+        return (
+            "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+            + f'<p><a href="/posts/{item}">permalink</a> <img src="img/{item}.png" alt="figure"></p>'
+            + '<script>track()</script><img src="https://stats.wordpress.com/b.gif" width="1" height="1">'
+        )
+
+    def _published_at(self, index: int, item: int) -> datetime:
+        return self.start + timedelta(minutes=item * 7 + index)
+
+    def document(self, index: int) -> bytes:
+        """The feed's current document"""
+        key = (index, self.published[index])
+        document = self._documents.get(key)
+        if document is None:
+            document = self._render_atom(index) if self.atom[index] else self._render_rss(index)
+            self._documents = {k: v for k, v in self._documents.items() if k[0] != index}
+            self._documents[key] = document
+        return document
+
+    def _items(self, index: int):
+        newest = self.published[index]
+        return range(newest - 1, max(newest - self.config.items_per_feed, 0) - 1, -1)
+
+    def _render_rss(self, index: int) -> bytes:
+        items = "".join(
+            f"<item><title>Post {item} from feed {index}</title>"
+            f"<link>https://feed{index}.bench.invalid/posts/{item}</link>"
+            f"<guid>bench-{index}-{item}</guid>"
+            f"<pubDate>{format_datetime(self._published_at(index, item).replace(tzinfo=timezone.utc), usegmt=True)}</pubDate>"
+            f"<description>{escape(self._body(index, item))}</description></item>"
+            for item in self._items(index)
+        )
+        return (
+            '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+            f"<title>Bench feed {index}</title><link>https://feed{index}.bench.invalid/</link>"
+            f"<description>Synthetic feed {index}</description>{items}</channel></rss>"
+        ).encode()
+
+    def _render_atom(self, index: int) -> bytes:
+        entries = "".join(
+            f"<entry><title>Post {item} from feed {index}</title>"
+            f'<link href="https://feed{index}.bench.invalid/posts/{item}"/>'
+            f"<id>urn:bench:{index}:{item}</id>"
+            f"<updated>{self._published_at(index, item).isoformat()}Z</updated>"
+            f'<content type="html">{escape(self._body(index, item))}</content></entry>'
+            for item in self._items(index)
+        )
+        return (
+            '<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom">'
+            f"<title>Bench feed {index}</title><id>urn:bench:{index}</id>"
+            f"<updated>{self.start.isoformat()}Z</updated>{entries}</feed>"
+        ).encode()
@@ -0,0 +1,128 @@
+"""
+Local stand-in for the feeds' web servers.
+
+Serves a Corpus over HTTP on 127.0.0.1 with injectable latency and server
+errors. It honours conditional GETs, so feeds that did not change in a
+round are answered with 304 like a well-behaved origin would.
+"""
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .corpus import Corpus
+
+_FEED_PATH = re.compile(r"^/feeds/(\d+)\.xml$")
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    ok: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+
+
+class FeedServer:
+    def __init__(
+        self,
+        corpus: Corpus,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        port: int = 0,
+        seed: int = 1,
+    ):
+        """`latency` and `jitter` are in seconds; `error_rate` is the share of 500 answers"""
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stats = ServerStats()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def url(self, index: int) -> str:
+        return f"http://127.0.0.1:{self.port}/feeds/{index}.xml"
+
+    def start(self) -> "FeedServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FeedServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _draw(self):
+        with self._lock:
+            self.stats.requests += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self._rng.random() < self.error_rate
+        return delay, fail
+
+    def _count(self, field: str, sent: int = 0) -> None:
+        with self._lock:
+            setattr(self.stats, field, getattr(self.stats, field) + 1)
+            self.stats.bytes_sent += sent
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes = b"", headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                match = _FEED_PATH.match(self.path)
+                if not match or int(match[1]) >= server.corpus.config.feeds:
+                    self._reply(404)
+                    return
+                index = int(match[1])
+                delay, fail = server._draw()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    server._count("errors")
+                    self._reply(500, b"injected error")
+                    return
+
+                etag = f'"{index}-{server.corpus.version(index)}"'
+                if self.headers.get("If-None-Match") == etag:
+                    server._count("not_modified")
+                    self._reply(304, headers={"ETag": etag})
+                    return
+                body = server.corpus.document(index)
+                server._count("ok", len(body))
+                content_type = "application/atom+xml" if server.corpus.atom[index] else "application/rss+xml"
+                self._reply(200, body, {"Content-Type": content_type, "ETag": etag})
+
+        return Handler
@@ -0,0 +1,344 @@
+"""
+Benchmark runner.
+
+`refresh` serves a synthetic corpus from the local feed server and times
+rounds of `update_all_feeds` against it: the first round fetches every
+feed, later ones see a share of feeds publish and the rest answer 304.
+`pages` seeds a database and load-tests the entry list routes in-process,
+with the fragment cache off (every request renders) and on.
+
+Each run writes a JSON file to bench/results/ (or --output) with the
+commit it measured; `compare` prints the change between two such files.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# Changes smaller than this are reported as noise by `compare`
+REGRESSION_THRESHOLD = 0.10
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _environment() -> dict:
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _use_database(path: str, **settings) -> None:
+    """Point the app at `path`; must run before any app module is imported"""
+    if "app.database" in sys.modules:
+        raise RuntimeError("app modules were imported before the benchmark database was configured")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    for name, value in settings.items():
+        os.environ[name] = str(value)
+
+
+def _latency_summary(samples: List[float], elapsed: float) -> dict:
+    ordered = sorted(samples)
+    cuts = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+    return {
+        "requests": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "requests_per_second": round(len(ordered) / elapsed, 1),
+    }
+
+
+# Refresh
+
+async def _refresh_rounds(args, server, corpus) -> List[dict]:
+    from sqlalchemy import insert, update
+
+    from app.database import async_session, engine, init_db, read_engine
+    from app.fetcher import fetcher
+    from app.models import Feed
+    from app.worker import update_all_feeds
+
+    await init_db()
+    async with async_session() as session:
+        await session.execute(insert(Feed), [
+            {"url": server.url(index), "title": f"Bench feed {index}", "unread_count": 0}
+            for index in range(corpus.config.feeds)
+        ])
+        await session.commit()
+
+    rounds = []
+    try:
+        for number in range(args.rounds):
+            published = corpus.advance() if number else corpus.config.feeds
+            # Make every feed due, whatever the adaptive schedule decided
+            async with async_session() as session:
+                await session.execute(update(Feed).values(next_poll_at=datetime(2000, 1, 1)))
+                await session.commit()
+
+            before = dict(vars(server.stats))
+            stats = await update_all_feeds()
+            served = {key: value - before[key] for key, value in vars(server.stats).items()}
+            rounds.append({
+                "round": number,
+                "feeds_published": published,
+                "feeds_total": stats.feeds_total,
+                "feeds_fetched": stats.feeds_fetched,
+                "new_entries": stats.new_entries,
+                "failures": stats.failures,
+                "duration_seconds": round(stats.duration, 3),
+                "feeds_per_second": round(stats.feeds_total / stats.duration, 1) if stats.duration else None,
+                "server": served,
+            })
+            print(
+                f"round {number}: {stats.feeds_total} feeds in {stats.duration:.2f}s, "
+                f"{stats.new_entries} new entries, {served['not_modified']} not modified, {stats.failures} failed"
+            )
+    finally:
+        await fetcher.close()
+        await engine.dispose()
+        await read_engine.dispose()
+    return rounds
+
+
+def run_refresh(args) -> dict:
+    directory = tempfile.mkdtemp(prefix="crumbline-bench-")
+    _use_database(
+        os.path.join(directory, "bench.db"),
+        REFRESH_CONCURRENCY=args.concurrency,
+        # Every feed is on the one local server; per-host politeness would
+        # otherwise be the only thing measured
+        REFRESH_PER_HOST=args.per_host or args.concurrency,
+        REFRESH_JOB_MAX_ATTEMPTS=args.rounds + 1,
+        LOG_LEVEL=args.log_level,
+    )
+    from app.log import configure_logging
+
+    from .corpus import Corpus, CorpusConfig
+    from .feedserver import FeedServer
+
+    configure_logging(args.log_level)
+    config = CorpusConfig(
+        feeds=args.feeds,
+        items_per_feed=args.items,
+        body_words=args.body_words,
+        update_rate=args.update_rate,
+        seed=args.seed,
+    )
+    corpus = Corpus(config)
+    with FeedServer(corpus, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                    error_rate=args.error_rate, seed=args.seed) as server:
+        rounds = asyncio.run(_refresh_rounds(args, server, corpus))
+
+    steady = rounds[1:] or rounds
+    return {
+        "benchmark": "refresh",
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("func", "output")},
+        "results": {
+            "initial_round_seconds": rounds[0]["duration_seconds"],
+            "initial_feeds_per_second": rounds[0]["feeds_per_second"],
+            "steady_round_seconds": round(statistics.fmean(r["duration_seconds"] for r in steady), 3),
+            "steady_feeds_per_second": round(statistics.fmean(r["feeds_per_second"] or 0 for r in steady), 1),
+            "rounds": rounds,
+        },
+    }
+
+
+# Pages
+
+ROUTES = ("/", "/unread", "/feeds/{id}/entries")
+
+
+async def _load_test(args, feeds: int) -> Dict[str, dict]:
+    import httpx
+
+    from app import cache
+    from app.auth import create_access_token
+    from app.database import engine, read_engine
+    from app.main import app
+
+    from .seed import USERNAME
+
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app)
+    cookies = {"session": create_access_token({"sub": USERNAME})}
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        for cached in (False, True):
+            cache.fragment_cache.clear()
+            # maxsize 0 stores nothing, so every request renders
+            cache.fragment_cache.maxsize = cache.FRAGMENT_CACHE_SIZE if cached else 0
+            for route in ROUTES:
+                paths = [route.replace("{id}", str(rng.randrange(feeds) + 1)) for _ in range(args.requests)]
+                headers = {"HX-Request": "true"} if "{id}" in route else {}
+                for path in paths[:args.warmup]:
+                    (await client.get(path, headers=headers)).raise_for_status()
+
+                slots = asyncio.Semaphore(args.concurrency)
+                samples = []
+
+                async def timed(path):
+                    async with slots:
+                        start = time.perf_counter()
+                        response = await client.get(path, headers=headers)
+                        samples.append(time.perf_counter() - start)
+                        response.raise_for_status()
+
+                start = time.perf_counter()
+                await asyncio.gather(*(timed(path) for path in paths))
+                summary = _latency_summary(samples, time.perf_counter() - start)
+                key = f"{route} ({'cached' if cached else 'uncached'})"
+                results[key] = summary
+                print(f"{key}: p50 {summary['p50_ms']}ms, p95 {summary['p95_ms']}ms, "
+                      f"{summary['requests_per_second']} req/s")
+    await engine.dispose()
+    await read_engine.dispose()
+    return results
+
+
+def run_pages(args) -> dict:
+    directory = tempfile.mkdtemp(prefix="crumbline-bench-")
+    path = os.path.join(directory, "bench.db")
+    _use_database(path, LOG_LEVEL=args.log_level, RUN_SCHEDULER="False")
+    from app.log import configure_logging
+
+    from .seed import seed_database
+
+    configure_logging(args.log_level)
+    start = time.perf_counter()
+    seed_database(path, feeds=args.feeds, entries=args.entries, body_words=args.body_words, seed=args.seed)
+    seeded = time.perf_counter() - start
+    print(f"seeded {args.entries} entries in {seeded:.1f}s ({os.path.getsize(path) / 2**20:.0f} MiB)")
+
+    routes = asyncio.run(_load_test(args, args.feeds))
+    return {
+        "benchmark": "pages",
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("func", "output")},
+        "results": {
+            "seed_seconds": round(seeded, 1),
+            "database_mib": round(os.path.getsize(path) / 2**20, 1),
+            "routes": routes,
+        },
+    }
+
+
+# Compare
+
+def _numbers(data, prefix=""):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _numbers(value, f"{prefix}{key}.")
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix.rstrip("."), data
+
+
+def _lower_is_better(name: str) -> bool:
+    return name.endswith(("_ms", "_seconds", "_mib"))
+
+
+def run_compare(args) -> None:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')} ({candidate['benchmark']})")
+    before = dict(_numbers(baseline["results"]))
+    regressions = 0
+    for name, value in _numbers(candidate["results"]):
+        old = before.get(name)
+        tracked = _lower_is_better(name) or name.endswith("per_second")
+        if old in (None, 0) or not tracked:
+            continue
+        change = (value - old) / old
+        worse = change > 0 if _lower_is_better(name) else change < 0
+        flag = ""
+        if abs(change) >= args.threshold:
+            flag = "  REGRESSION" if worse else "  improved"
+            regressions += worse
+        print(f"  {name}: {old} -> {value} ({change:+.1%}){flag}")
+    if regressions:
+        sys.exit(1)
+
+
+def _save(result: dict, output: str) -> None:
+    result = {**_environment(), **result}
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = result["timestamp"].replace(":", "").replace("-", "")
+        output = os.path.join(RESULTS_DIR, f"{result['benchmark']}-{stamp}-{result['commit'] or 'nogit'}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    refresh = commands.add_parser("refresh", help="feed refresh throughput")
+    refresh.add_argument("--feeds", type=int, default=200)
+    refresh.add_argument("--items", type=int, default=20, help="items per feed document")
+    refresh.add_argument("--body-words", type=int, default=200)
+    refresh.add_argument("--update-rate", type=float, default=0.3, help="share of feeds publishing per round")
+    refresh.add_argument("--rounds", type=int, default=3)
+    refresh.add_argument("--latency", type=float, default=20, help="server latency in ms")
+    refresh.add_argument("--jitter", type=float, default=10, help="extra random latency in ms")
+    refresh.add_argument("--error-rate", type=float, default=0.0)
+    refresh.add_argument("--concurrency", type=int, default=10)
+    refresh.add_argument("--per-host", type=int, default=None, help="defaults to --concurrency")
+    refresh.set_defaults(func=run_refresh)
+
+    pages = commands.add_parser("pages", help="entry list latency")
+    pages.add_argument("--entries", type=int, default=10000)
+    pages.add_argument("--feeds", type=int, default=100)
+    pages.add_argument("--body-words", type=int, default=200)
+    pages.add_argument("--requests", type=int, default=200, help="requests per route")
+    pages.add_argument("--warmup", type=int, default=10)
+    pages.add_argument("--concurrency", type=int, default=8)
+    pages.set_defaults(func=run_pages)
+
+    for command in (refresh, pages):
+        command.add_argument("--seed", type=int, default=1)
+        command.add_argument("--output", help="result file (default: bench/results/)")
+        command.add_argument("--log-level", default="WARNING")
+
+    compare = commands.add_parser("compare", help="compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    compare.set_defaults(func=run_compare)
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if result is not None:
+        _save(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Seeded databases for the page benchmarks.
+
+Builds the schema with the app's own models and migrations, then bulk
+inserts feeds and entries (with their search index rows) directly, which
+takes seconds for 100k entries rather than the hours ingest would.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+from app import search
+from app.auth import get_password_hash
+from app.content import clean_html
+from app.migrations import run_migrations
+from app.models import Base, Category, DataVersion, Entry, Feed, User
+
+from .corpus import WORDS
+
+BATCH_SIZE = 5000
+# Distinct bodies reused across entries; sanitizing each entry would dominate seeding
+BODY_VARIANTS = 64
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+def _bodies(rng: random.Random, words: int):
+    bodies = []
+    for _ in range(BODY_VARIANTS):
+        text = " ".join(rng.choice(WORDS) for _ in range(words))
+        bodies.append(clean_html(f"<p>{text}</p>", "https://bench.invalid/"))
+    return bodies
+
+
+def seed_database(
+    path: str,
+    feeds: int = 100,
+    entries: int = 10000,
+    read_share: float = 0.5,
+    body_words: int = 200,
+    categories: int = 10,
+    seed: int = 1,
+) -> None:
+    """Create a database at `path` with `entries` spread over `feeds`"""
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    now = datetime.utcnow()
+    bodies = _bodies(rng, body_words)
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        run_migrations(conn)
+        conn.execute(insert(User), [{"username": USERNAME, "email": "bench@bench.invalid", "password": get_password_hash(PASSWORD)}])
+        conn.execute(insert(Category), [{"id": i + 1, "name": f"Category {i + 1}"} for i in range(categories)])
+        conn.execute(insert(Feed), [
+            {
+                "id": i + 1,
+                "url": f"https://feed{i}.bench.invalid/rss",
+                "title": f"Bench feed {i}",
+                "category_id": (i % categories) + 1 if i % 4 else None,
+                # Never due: the page benchmark must not refresh anything
+                "next_poll_at": now + timedelta(days=365),
+                "unread_count": 0,
+            }
+            for i in range(feeds)
+        ])
+        conn.execute(insert(DataVersion), [{"name": "data", "version": 1, "updated_at": now}])
+
+        rows, fts_rows = [], []
+        for entry_id in range(1, entries + 1):
+            feed_id = rng.randrange(feeds) + 1
+            body = bodies[entry_id % BODY_VARIANTS]
+            title = f"Post {entry_id}: " + " ".join(rng.choice(WORDS) for _ in range(6))
+            rows.append({
+                "id": entry_id,
+                "feed_id": feed_id,
+                "guid": f"bench-{entry_id}",
+                "title": title,
+                "link": f"https://feed{feed_id - 1}.bench.invalid/posts/{entry_id}",
+                # About four entries an hour over the whole corpus
+                "published": now - timedelta(minutes=15 * (entries - entry_id)),
+                "content": body.html,
+                "summary": body.summary,
+                "word_count": body.word_count,
+                "is_read": rng.random() < read_share,
+            })
+            fts_rows.append(search.fts_row(entry_id, title, body.text))
+            if len(rows) == BATCH_SIZE or entry_id == entries:
+                conn.execute(insert(Entry), rows)
+                conn.execute(insert(search.entries_fts), fts_rows)
+                rows, fts_rows = [], []
+
+        conn.exec_driver_sql(
+            "UPDATE feeds SET unread_count = ("
+            "SELECT COUNT(*) FROM entries WHERE entries.feed_id = feeds.id AND entries.is_read = 0)"
+        )
+        conn.exec_driver_sql("ANALYZE")
+    engine.dispose()
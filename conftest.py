@@ -0,0 +1,54 @@
+# conftest.py
+# Shared pytest fixtures: a throwaway feeds.db created and migrated the
+# same way the app does it on startup.
+
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.migrations import run_migrations
+from app.models import Base
+
+
+class MigratedDatabase:
+    """A migrated database file, with helpers to seed it and open async sessions"""
+
+    def __init__(self, path):
+        self.path = path
+        self.url = f"sqlite+aiosqlite:///{path}"
+        self.engine = create_engine(f"sqlite:///{path}")
+        with self.engine.begin() as conn:
+            run_migrations(conn, Base.metadata)
+
+    def execute(self, statement, params=()):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(statement, params)
+
+    def add_category(self, category_id, name):
+        self.execute("INSERT INTO categories (id, name) VALUES (?, ?)", (category_id, name))
+
+    def add_feed(self, feed_id, url=None, **columns):
+        columns = {"id": feed_id, "url": url or f"https://feed{feed_id}.example/feed", **columns}
+        self.execute(
+            f"INSERT INTO feeds ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            tuple(columns.values()),
+        )
+
+    @asynccontextmanager
+    async def sessions(self):
+        """An async session factory on the file; its engine is disposed on exit"""
+        engine = create_async_engine(self.url)
+        try:
+            yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        finally:
+            await engine.dispose()
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = MigratedDatabase(str(tmp_path / "feeds.db"))
+    yield db
+    db.engine.dispose()
@@ -39,9 +39,10 @@ $APP_PATH/venv/bin/python create_admin.py $ADMIN_USER $ADMIN_EMAIL $ADMIN_PASSWO
 # Setup systemd service
 echo "Setting up systemd service..."
 cp $APP_PATH/crumbline.service /etc/systemd/system/
+cp $APP_PATH/crumbline-worker.service /etc/systemd/system/
 systemctl daemon-reload
-systemctl enable crumbline.service
-systemctl start crumbline.service
+systemctl enable crumbline.service crumbline-worker.service
+systemctl start crumbline.service crumbline-worker.service
 
 # Setup Nginx
 echo "Setting up Nginx..."
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# test_content.py
+# Checks ingest-time HTML processing: allowlisting, URL handling, tracking
+# pixels, and the plain text behind summaries and word counts.
+
+from app.content import clean_html, summarize
+
+BASE = "https://example.com/posts/1"
+
+
+def test_scripts_and_handlers_are_removed():
+    cleaned = clean_html(
+        '<p onclick="steal()">Hi<script>alert(1)</script></p>'
+        '<iframe src="https://evil.example/"><b>inner</b></iframe>'
+        '<a href="javascript:alert(1)">x</a><a href=" java\tscript:alert(2)">y</a>'
+        '<img src="data:image/png;base64,AAAA">',
+        BASE,
+    )
+    assert cleaned.html == "<p>Hi</p><a>x</a><a>y</a>", cleaned.html
+    assert "inner" not in cleaned.text
+    print("✅ Scripts, frames, handlers and unsafe URLs are removed")
+
+
+def test_urls_are_absolutized():
+    cleaned = clean_html('<a href="/about">About</a> <img src="img/a.png" alt="A &amp; B">', BASE)
+    assert 'href="https://example.com/about"' in cleaned.html
+    assert 'rel="noopener noreferrer nofollow"' in cleaned.html
+    assert 'src="https://example.com/posts/img/a.png"' in cleaned.html
+    assert 'alt="A &amp; B"' in cleaned.html
+    assert 'loading="lazy"' in cleaned.html
+    print("✅ Relative URLs are made absolute")
+
+
+def test_tracking_pixels_are_dropped():
+    cleaned = clean_html(
+        '<p>Text</p><img src="https://example.com/t.gif" width="1" height="1">'
+        '<img src="https://feeds.feedburner.com/~r/example/~4/abc">',
+        BASE,
+    )
+    assert cleaned.html == "<p>Text</p>", cleaned.html
+    print("✅ Tracking pixels are dropped")
+
+
+def test_markup_is_balanced_and_text_extracted():
+    cleaned = clean_html("<div><p>One <em>two</div> three &lt;four&gt;<p>five", BASE)
+    assert cleaned.html == "<div><p>One <em>two</em></p></div> three &lt;four&gt;<p>five</p>", cleaned.html
+    assert cleaned.text == "One two three <four> five"
+    assert cleaned.word_count == 5
+    print("✅ Unclosed tags are closed and plain text is extracted")
+
+
+def test_summary_is_cut_on_a_word():
+    text = "word " * 100
+    summary = summarize(text.strip(), length=23)
+    assert summary == "word word word word…", summary
+    assert summarize("short") == "short"
+    print("✅ Summaries are cut on word boundaries")
+
+
+if __name__ == "__main__":
+    test_scripts_and_handlers_are_removed()
+    test_urls_are_absolutized()
+    test_tracking_pixels_are_dropped()
+    test_markup_is_balanced_and_text_extracted()
+    test_summary_is_cut_on_a_word()
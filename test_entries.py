@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# test_entries.py
+# Checks entry lists: keyset cursors round-trip and page through entries
+# that share a publish time without skipping or repeating any, and the
+# per-feed unread counters agree with the entries after every kind of write,
+# including read toggles racing on one entry.
+
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from app import retention, services
+from app.models import Entry, Feed
+
+PUBLISHED = datetime(2024, 6, 1, 12, 30, 15, 250000)
+
+
+def test_cursor_round_trip():
+    entry = SimpleNamespace(published=PUBLISHED, id=42)
+    cursor = services.encode_cursor(entry)
+    assert services.decode_cursor(cursor) == (PUBLISHED, 42)
+    whole_second = SimpleNamespace(published=PUBLISHED.replace(microsecond=0), id=7)
+    assert services.decode_cursor(services.encode_cursor(whole_second)) == (whole_second.published, 7)
+
+    for malformed in ("", "42", "yesterday_42", f"{PUBLISHED.isoformat()}_x"):
+        with pytest.raises(ValueError):
+            services.decode_cursor(malformed)
+    print("✅ Cursors round-trip, malformed ones are rejected")
+
+
+async def _page_checks(session_factory):
+    async with session_factory() as session:
+        # Groups of five entries per publish time, two feeds interleaved
+        for feed_id in (1, 2):
+            feed = SimpleNamespace(id=feed_id, url=f"https://feed{feed_id}.example/feed")
+            await services.ingest_entries(session, feed, [
+                {
+                    "id": f"{feed_id}-{n}",
+                    "title": f"Entry {n}",
+                    "link": f"https://feed{feed_id}.example/{n}",
+                    "published_parsed": (PUBLISHED - timedelta(hours=n // 5)).timetuple(),
+                }
+                for n in range(20)
+            ])
+        await session.execute(Entry.__table__.update().where(Entry.id % 3 == 0).values(is_read=True))
+        await session.commit()
+
+        for filters in ({}, {"feed_id": 2}, {"category_id": 1}, {"unread_only": True}):
+            expected = (await session.execute(
+                services.entries_query(limit=1000, **filters)
+            )).scalars().all()
+            seen, cursor = [], None
+            while True:
+                # Pages of 4 always end inside a group of equal publish times
+                entries, cursor = await services.get_entries(session, cursor=cursor, limit=4, **filters)
+                seen.extend(entries)
+                if cursor is None:
+                    break
+            assert [entry.id for entry in seen] == [entry.id for entry in expected], filters
+            assert len(set(entry.id for entry in seen)) == len(seen)
+            keys = [(entry.published, entry.id) for entry in seen]
+            assert keys == sorted(keys, reverse=True)
+
+
+def test_pages_with_tied_publish_times(database):
+    database.add_category(1, "News")
+    database.add_feed(1, category_id=1)
+    database.add_feed(2)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _page_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Keyset pages walk tied publish times without gaps or repeats")
+
+
+def _parsed_entries(feed_id, numbers):
+    return [
+        {"id": f"{feed_id}-{n}", "title": f"Entry {n}", "link": f"https://feed{feed_id}.example/{n}"}
+        for n in numbers
+    ]
+
+
+async def _assert_counters(session):
+    counters = dict((await session.execute(select(Feed.id, Feed.unread_count))).all())
+    actual = dict((await session.execute(
+        select(Feed.id, func.count(Entry.id))
+        .outerjoin(Entry, (Entry.feed_id == Feed.id) & (Entry.is_read == False))
+        .group_by(Feed.id)
+    )).all())
+    assert counters == actual, (counters, actual)
+    assert await services.get_unread_count(session) == sum(actual.values())
+    return counters
+
+
+async def _counter_checks(session_factory):
+    async with session_factory() as session:
+        feeds = {feed_id: await session.get(Feed, feed_id) for feed_id in (1, 2)}
+        await services.ingest_entries(session, feeds[1], _parsed_entries(1, range(10)))
+        await services.ingest_entries(session, feeds[2], _parsed_entries(2, range(5)))
+        await session.commit()
+        assert await _assert_counters(session) == {1: 10, 2: 5}
+
+        # Known entries are not counted twice
+        await services.ingest_entries(session, feeds[1], _parsed_entries(1, range(8, 12)))
+        await session.commit()
+        assert await _assert_counters(session) == {1: 12, 2: 5}
+
+        await services.toggle_entry_read(session, 1)
+        await services.toggle_entry_read(session, 2)
+        await services.toggle_entry_read(session, 2)
+        assert await _assert_counters(session) == {1: 11, 2: 5}
+
+        feed = await services.mark_feed_read(session, 1)
+        assert feed.unread_count == 0
+        assert await _assert_counters(session) == {1: 0, 2: 5}
+        # Read entries toggled back are unread again; nothing else changed
+        await services.toggle_entry_read(session, 3)
+        assert (await services.mark_feed_read(session, 2)).unread_count == 0
+        assert await _assert_counters(session) == {1: 1, 2: 0}
+
+        await services.ingest_entries(session, feeds[2], _parsed_entries(2, range(5, 8)))
+        await session.commit()
+        policy = retention.RetentionPolicy(max_age_days=0, max_entries=4, keep_unread=False)
+        await retention.prune_feed(session, 2, policy)
+        assert await _assert_counters(session) == {1: 1, 2: 3}
+
+        # Deleting a feed takes its entries and counter with it
+        await session.delete(await session.get(Feed, 2))
+        await session.commit()
+        assert await _assert_counters(session) == {1: 1}
+        assert await services.mark_feed_read(session, 2) is None
+
+
+def test_unread_counters_stay_consistent(database):
+    database.add_feed(1)
+    database.add_feed(2)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _counter_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Unread counters follow ingest, toggles, mark-all-read, pruning and deletes")
+
+
+async def _racing_toggle_checks(database):
+    # Separate engines, like two web processes handling a double click
+    async with database.sessions() as first, database.sessions() as second:
+        async with first() as session:
+            feed = await session.get(Feed, 1)
+            await services.ingest_entries(session, feed, _parsed_entries(1, range(3)))
+            await session.commit()
+
+        async def toggle(session_factory):
+            async with session_factory() as session:
+                return await services.toggle_entry_read(session, 1)
+
+        for _ in range(5):
+            entries = await asyncio.gather(toggle(first), toggle(second))
+            assert {entry.is_read for entry in entries} == {True, False}
+        async with first() as session:
+            assert await _assert_counters(session) == {1: 3}
+            assert await services.toggle_entry_read(session, 99) is None
+
+
+def test_racing_toggles_keep_counters(database):
+    database.add_feed(1)
+    asyncio.run(_racing_toggle_checks(database))
+    print("✅ Concurrent toggles of one entry leave the counter exact")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# test_fetcher.py
+# Checks bounded feed downloads: documents cut after an item cap or a run
+# of known entries, size and compression-ratio limits, the validators
+# kept for conditional GETs, and that new entries are sanitized with the
+# write connection back in the pool.
+
+import asyncio
+import gzip
+
+import feedparser
+import httpx
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import services
+from app.fetcher import FeedFetcher, FeedTooLarge, ItemScanner, fetcher as shared_fetcher
+from app.models import Entry, Feed
+
+FEED_URL = "https://podcast.example/feed.xml"
+
+
+def _rss(count, newest_first=True):
+    days = range(count, 0, -1) if newest_first else range(1, count + 1)
+    items = "".join(
+        f"<item><title>Episode {day} &amp; more</title><guid>ep-{day}</guid>"
+        f"<pubDate>{day % 28 + 1:02d} Jan {2000 + day // 28} 00:00:00 GMT</pubDate>"
+        f"<description>{'words ' * 50}</description></item>"
+        for day in days
+    )
+    return (
+        f"<?xml version='1.0' encoding='utf-8'?><rss version='2.0'><channel><title>Podcast</title>{items}"
+        "</channel></rss>"
+    ).encode()
+
+
+def _scan(document, chunk_size=100, **options):
+    scanner = ItemScanner(base_url=FEED_URL, **options)
+    for start in range(0, len(document), chunk_size):
+        if scanner.feed(document[start:start + chunk_size]):
+            break
+    return scanner
+
+
+def test_scanner_cuts_after_item_cap():
+    document = _rss(50)
+    scanner = _scan(document, max_items=5)
+    assert scanner.done and scanner.items == 5
+    assert len(scanner.data) < len(document)
+    parsed = feedparser.parse(scanner.truncate())
+    assert not parsed.bozo, parsed.get("bozo_exception")
+    assert parsed.feed.title == "Podcast"
+    assert [entry.id for entry in parsed.entries] == [f"ep-{day}" for day in range(50, 45, -1)]
+
+    # Undefined entities are skipped, malformed documents left whole
+    assert _scan(document.replace(b" more", b"&nbsp;more"), max_items=5).done
+    scanner = _scan(b"<rss><channel><item></channel>" + document, max_items=5)
+    assert scanner.failed and not scanner.done
+    print("✅ Documents are cut after the item cap and stay well-formed")
+
+
+def test_scanner_stops_at_known_entries():
+    known = {f"ep-{day}" for day in range(1, 48)}
+    scanner = _scan(_rss(200), known_guids=known, stop_after_known=3)
+    # 153 new items, then three known ones
+    assert scanner.done and scanner.items == 156
+    # Oldest first: new items could still follow, so everything is read
+    scanner = _scan(_rss(200, newest_first=False), known_guids=known, stop_after_known=3)
+    assert not scanner.done and scanner.items == 200
+    print("✅ Newest-first feeds are read only up to known entries")
+
+
+def _fetcher(handler, **limits):
+    fetcher = FeedFetcher(parse_workers=1, **limits)
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return fetcher
+
+
+def test_download_limits():
+    document = _rss(2000)
+    sent = []
+
+    async def chunks():
+        for start in range(0, len(document), 4096):
+            sent.append(start)
+            yield document[start:start + 4096]
+
+    async def checks():
+        fetcher = _fetcher(lambda request: httpx.Response(200, content=chunks()))
+        result = await fetcher.fetch(FEED_URL, max_items=10)
+        assert result.truncated and len(result.parsed.entries) == 10
+        # The rest of the document was never downloaded
+        assert len(sent) * 4096 < len(document) // 10
+        await fetcher.close()
+
+        # Over the size limit: keep what is complete, or fail if nothing is
+        fetcher = _fetcher(lambda request: httpx.Response(200, content=document), max_bytes=100_000)
+        result = await fetcher.fetch(FEED_URL, max_items=None)
+        assert result.truncated and 0 < len(result.parsed.entries) < 2000
+        assert len(result.content) < 100_000 + 64 * 1024
+        await fetcher.close()
+        fetcher = _fetcher(lambda request: httpx.Response(200, content=b"<rss>" + b" " * 200_000), max_bytes=100_000)
+        try:
+            await fetcher.fetch(FEED_URL)
+            raise AssertionError("oversized feed accepted")
+        except FeedTooLarge:
+            pass
+        await fetcher.close()
+
+        bomb = gzip.compress(b"<rss><channel>" + b" " * 20_000_000)
+        fetcher = _fetcher(
+            lambda request: httpx.Response(200, content=bomb, headers={"Content-Encoding": "gzip"}), max_ratio=100
+        )
+        try:
+            await fetcher.fetch(FEED_URL)
+            raise AssertionError("compression bomb accepted")
+        except FeedTooLarge as e:
+            assert "decompresses" in str(e)
+        await fetcher.close()
+
+    asyncio.run(checks())
+    print("✅ Downloads stop early and respect size and compression limits")
+
+
+def test_unchanged_body_keeps_validators_current(database):
+    database.add_feed(1, FEED_URL)
+    document = _rss(3)
+    rss = {"Content-Type": "application/rss+xml"}
+    responses = [
+        httpx.Response(200, content=document, headers={**rss, "ETag": '"v1"'}),
+        # Same body, new validators: nothing to parse, but they are stored
+        httpx.Response(200, content=document, headers={
+            **rss, "ETag": '"v2"', "Last-Modified": "Sat, 01 Jun 2024 00:00:00 GMT",
+        }),
+        # A bare 304 leaves them as they were
+        httpx.Response(304),
+    ]
+    sent = []
+
+    def handler(request):
+        sent.append(request.headers.get("if-none-match"))
+        return responses[len(sent) - 1]
+
+    async def checks():
+        default_client = shared_fetcher._client
+        shared_fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            async with database.sessions() as session_factory, session_factory() as session:
+                for _ in responses:
+                    feed = await session.get(Feed, 1)
+                    assert await services.update_feed(session, feed) is not None
+                feed = await session.get(Feed, 1)
+                assert (feed.etag, feed.last_modified) == ('"v2"', "Sat, 01 Jun 2024 00:00:00 GMT")
+        finally:
+            await shared_fetcher._client.aclose()
+            shared_fetcher._client = default_client
+
+    asyncio.run(checks())
+    assert sent == [None, '"v1"', '"v2"'], sent
+    print("✅ Unchanged bodies still update the stored validators")
+
+
+def test_sanitizing_holds_no_connection(database, monkeypatch):
+    database.add_feed(1, FEED_URL)
+    # One connection, as for the writer pool
+    engine = create_async_engine(database.url, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    checked_out = []
+    clean_html = services.clean_html
+
+    def watched_clean_html(content, base_url=None):
+        checked_out.append(engine.sync_engine.pool.checkedout())
+        return clean_html(content, base_url)
+
+    monkeypatch.setattr(services, "clean_html", watched_clean_html)
+
+    async def checks():
+        default_client = shared_fetcher._client
+        shared_fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=_rss(20), headers={"Content-Type": "application/rss+xml"})
+        ))
+        try:
+            async with session_factory() as session:
+                feed = await session.get(Feed, 1)
+                assert (await services.update_feed(session, feed)).new == 20
+                assert await session.scalar(select(func.count()).select_from(Entry)) == 20
+        finally:
+            await shared_fetcher._client.aclose()
+            shared_fetcher._client = default_client
+            await engine.dispose()
+
+    asyncio.run(checks())
+    assert checked_out == [0] * 20, checked_out
+    print("✅ New entries are sanitized with the write connection returned")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# test_fragment_cache.py
+# Checks the rendered-fragment cache: LRU eviction and expiry, and that
+# mutations bump the data version that keys cached renders and ETags.
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import cache, services
+from app.cache import FragmentCache
+
+
+def test_lru_eviction_and_expiry():
+    async def checks():
+        fragments = FragmentCache(maxsize=2, ttl=60)
+        await fragments.set("a", "<p>a</p>")
+        await fragments.set("b", "<p>b</p>")
+        assert await fragments.get("a") == "<p>a</p>"
+        # "b" is now the least recently used
+        await fragments.set("c", "<p>c</p>")
+        assert await fragments.get("b") is None
+        assert await fragments.get("a") == "<p>a</p>"
+
+        expiring = FragmentCache(maxsize=2, ttl=0.01)
+        await expiring.set("a", "<p>a</p>")
+        time.sleep(0.02)
+        assert await expiring.get("a") is None
+
+    asyncio.run(checks())
+    print("✅ Fragment cache evicts least recently used and expired renders")
+
+
+async def _version_checks(session_factory):
+    async with session_factory() as session:
+        assert await cache.get_version(session) == 0
+
+        category = await services.create_category(session, "News")
+        after_create = await cache.get_version(session)
+        assert after_create == 1, after_create
+
+        feed = SimpleNamespace(id=1, url="https://a.example/feed")
+        entries = [{"id": "1", "title": "One", "link": "https://a.example/1"}]
+        await services.ingest_entries(session, feed, entries)
+        await session.commit()
+        after_ingest = await cache.get_version(session)
+        assert after_ingest == after_create + 1
+
+        # Nothing new, nothing to invalidate
+        await services.ingest_entries(session, feed, entries)
+        await session.commit()
+        assert await cache.get_version(session) == after_ingest
+
+        await services.toggle_entry_read(session, 1)
+        await services.move_feed_to_category(session, 1, category.id)
+        assert await cache.get_version(session) == after_ingest + 2
+
+        # A rolled-back change keeps the old version
+        await cache.bump_version(session)
+        await session.rollback()
+        assert await cache.get_version(session) == after_ingest + 2
+
+    etags = {cache.fragment_etag("sidebar", version) for version in (1, 2)}
+    assert len(etags) == 2
+
+
+def test_mutations_bump_version(database):
+    database.add_feed(1)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _version_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Mutations bump the data version, rollbacks don't")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# test_http_cache.py
+# Checks static files under content-hashed names, conditional request
+# handling and response compression.
+
+import os
+import tempfile
+from datetime import datetime
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.testclient import TestClient
+
+from app.http_cache import HashedStaticFiles, add_compression, http_date, is_not_modified
+
+CHANGED_AT = datetime(2024, 6, 1, 12, 0, 0, 500)
+
+
+def _app(directory):
+    app = FastAPI()
+    add_compression(app)
+    static_files = HashedStaticFiles(directory=directory)
+    app.mount("/static", static_files, name="static")
+
+    @app.get("/page")
+    async def page(request: Request):
+        etag = 'W/"v1"'
+        headers = {"ETag": etag, "Last-Modified": http_date(CHANGED_AT)}
+        if is_not_modified(request, etag, CHANGED_AT):
+            return Response(status_code=304, headers=headers)
+        return PlainTextResponse("entry " * 200, headers=headers)
+
+    return app, static_files
+
+
+def test_hashed_static_files():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "site.css")
+        with open(path, "w") as f:
+            f.write("body { color: black; }")
+        app, static_files = _app(directory)
+        client = TestClient(app)
+
+        hashed = static_files.hashed_path("site.css")
+        assert hashed != "site.css" and hashed.endswith(".css")
+        response = client.get(f"/static/{hashed}")
+        assert response.status_code == 200 and "color" in response.text
+        assert "immutable" in response.headers["cache-control"]
+        assert client.get(f"/static/{hashed}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+        # Plain names revalidate; changed content gets a new name
+        assert client.get("/static/site.css").headers["cache-control"] == "no-cache"
+        with open(path, "w") as f:
+            f.write("body { color: white; }")
+        os.utime(path, (0, 0))
+        assert static_files.hashed_path("site.css") != hashed
+        assert client.get(f"/static/{hashed}").headers["cache-control"] == "no-cache"
+        assert client.get("/static/missing.css").status_code == 404
+    print("✅ Static files are served immutable under content-hashed names")
+
+
+def test_conditional_requests_and_compression():
+    with tempfile.TemporaryDirectory() as directory:
+        client = TestClient(_app(directory)[0])
+        response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] in ("gzip", "br")
+
+        assert client.get("/page", headers={"If-None-Match": '"v1"'}).status_code == 304
+        assert client.get("/page", headers={"If-None-Match": 'W/"v0", W/"v1"'}).status_code == 304
+        assert client.get("/page", headers={"If-None-Match": 'W/"v0"'}).status_code == 200
+        last_modified = response.headers["last-modified"]
+        assert client.get("/page", headers={"If-Modified-Since": last_modified}).status_code == 304
+        assert client.get("/page", headers={"If-Modified-Since": "Sat, 01 Jun 2024 11:00:00 GMT"}).status_code == 200
+        # If-None-Match takes precedence over If-Modified-Since
+        headers = {"If-None-Match": 'W/"v0"', "If-Modified-Since": last_modified}
+        assert client.get("/page", headers=headers).status_code == 200
+    print("✅ Responses are compressed and repeat requests get 304s")
+
+
+if __name__ == "__main__":
+    test_hashed_static_files()
+    test_conditional_requests_and_compression()
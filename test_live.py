@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# test_live.py
+# Checks live updates: the broker's fan-out, replay and slow-reader cutoff,
+# the watcher's rendered updates, and that event streams skip compression.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from jinja2 import Environment, FileSystemLoader
+
+from app import live, services
+from app.http_cache import add_compression
+
+templates = Environment(loader=FileSystemLoader("templates"))
+
+
+def render(template_name, context):
+    return templates.get_template(template_name).render(context)
+
+
+def test_broker_fans_out_and_replays():
+    async def checks():
+        broker = live.Broker(queue_size=3, replay_size=2)
+        broker.horizon = 0
+        broker.stale_message = "stale"
+        first, second = broker.subscribe(), broker.subscribe()
+        update = live.Update(1, live.encode_event("changed", event_id=1))
+        broker.publish(update)
+        assert first.get_nowait() is second.get_nowait() is update
+        assert update.message == "id: 1\nevent: changed\ndata: \n\n"
+
+        # A reader that falls behind is cut off, not buffered for
+        for version in (2, 3, 4, 5):
+            broker.publish(live.Update(version, f"v{version}"))
+            assert first.get_nowait().version == version
+        assert _drain(second) == [None]
+        assert second not in broker.subscribers
+
+        # Reconnecting at version 4 replays 5; at 1, some is gone for good
+        assert [u.message for u in _drain(broker.subscribe(since=4))] == ["v5"]
+        assert [u.message for u in _drain(broker.subscribe(since=1))] == ["stale", "v4", "v5"]
+
+    asyncio.run(checks())
+    print("✅ Broker fans out one message, drops slow readers and replays missed updates")
+
+
+def _drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+async def _watcher_checks(session_factory):
+    broker = live.Broker()
+    watcher = live.Watcher(broker, session_factory, render, max_entries=3)
+    await watcher.start_state()
+    assert await watcher.poll() is None
+
+    feed = SimpleNamespace(id=1, url="https://a.example/feed")
+    async with session_factory() as session:
+        await services.ingest_entries(session, feed, [
+            {"id": str(n), "title": f"Post {n}", "link": f"https://a.example/{n}"} for n in range(2)
+        ])
+        await session.commit()
+    queue = broker.subscribe()
+    update = await watcher.poll()
+    assert queue.get_nowait() is update
+    assert "event: changed" in update.message
+    assert "2 new entries: 2 in Example." in " ".join(update.message.split())
+    assert 'hx-swap-oob="afterbegin:#live-all"' in update.message
+    assert 'hx-swap-oob="afterbegin:#live-feed-1"' in update.message
+    assert 'hx-swap-oob="afterbegin:#live-category-7"' in update.message
+    assert update.message.count("Post 1") == 4
+
+    # Too many at once: announced with a reload link, not pushed
+    async with session_factory() as session:
+        await services.ingest_entries(session, feed, [
+            {"id": str(n), "title": f"Post {n}", "link": f"https://a.example/{n}"} for n in range(2, 6)
+        ])
+        await session.commit()
+    update = await watcher.poll()
+    assert "event: notice" in update.message and "Reload" in update.message
+    assert "event: entries" not in update.message
+
+    # Changes without new entries only signal the sidebar
+    async with session_factory() as session:
+        await services.toggle_entry_read(session, 1)
+    update = await watcher.poll()
+    assert update.message == live.encode_event("changed", event_id=update.version)
+
+
+def test_watcher_publishes_new_entries(database):
+    database.add_category(7, "News")
+    database.add_feed(1, "https://a.example/feed", title="Example", category_id=7)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _watcher_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Watcher renders new entries once per change for every list they belong to")
+
+
+def test_event_streams_are_not_compressed():
+    app = FastAPI()
+    add_compression(app)
+
+    @app.get("/events")
+    async def events():
+        async def stream():
+            yield live.encode_event("notice", "x" * 2000)
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    client = TestClient(app)
+    response = client.get("/events", headers={"Accept": "text/event-stream", "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text.startswith("event: notice\ndata: xxx")
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    print("✅ Event streams bypass compression")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
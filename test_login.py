@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# test_login.py
+# Checks that logging in never holds a database connection while the
+# password hash is verified, so concurrent logins neither queue on the
+# pool nor block writers.
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import auth
+
+VERIFY_SECONDS = 0.3
+
+
+def test_password_check_holds_no_connection(database, monkeypatch):
+    database.execute(
+        "INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+        ("alice", "alice@example.com", auth.get_password_hash("secret")),
+    )
+    # One connection, as for the writer pool
+    engine = create_async_engine(database.url, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    checked_out = []
+    verify = auth.verify_password
+
+    def slow_verify(plain, hashed):
+        checked_out.append(engine.sync_engine.pool.checkedout())
+        time.sleep(VERIFY_SECONDS)
+        return verify(plain, hashed)
+
+    monkeypatch.setattr(auth, "verify_password", slow_verify)
+
+    async def login(password):
+        async with session_factory() as session:
+            return await auth.authenticate_user(session, "alice", password)
+
+    async def write():
+        # Waits for the pool's only connection, which logins must not hold
+        start = time.monotonic()
+        async with session_factory() as session:
+            await session.execute(text("UPDATE users SET email = email"))
+            await session.commit()
+        return time.monotonic() - start
+
+    async def checks():
+        logins = [asyncio.create_task(login(password)) for password in ("secret", "wrong")]
+        await asyncio.sleep(VERIFY_SECONDS / 3)
+        waited = await write()
+        user, refused = await asyncio.gather(*logins)
+        await engine.dispose()
+        return user, refused, waited
+
+    user, refused, waited = asyncio.run(checks())
+    assert user.username == "alice" and refused is False
+    assert checked_out == [0, 0], checked_out
+    assert waited < VERIFY_SECONDS / 2, waited
+    assert asyncio.run(_missing_user(database)) is False
+    print("✅ Password checks run with the connection returned to the pool")
+
+
+async def _missing_user(database):
+    async with database.sessions() as session_factory, session_factory() as session:
+        return await auth.authenticate_user(session, "nobody", "secret")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
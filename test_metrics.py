@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# test_metrics.py
+# Checks the Prometheus surface: request latency by route template, SQL
+# counted per request through engine hooks, and JSON log records.
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import metrics
+from app.log import JsonFormatter
+
+
+def test_requests_and_queries_are_measured():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'm.db')}")
+        metrics.instrument_engine(engine, "test")
+
+        app = FastAPI()
+        app.add_middleware(metrics.MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def item(item_id: int):
+            async with engine.connect() as conn:
+                for _ in range(3):
+                    await conn.execute(text("SELECT 1"))
+            return {"id": item_id}
+
+        @app.get("/metrics")
+        async def scrape():
+            return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+        client = TestClient(app)
+        for item_id in range(4):
+            assert client.get(f"/items/{item_id}").status_code == 200
+        assert client.get("/no/such/path").status_code == 404
+
+        labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+        assert REGISTRY.get_sample_value("crumbline_http_request_duration_seconds_count", labels) == 4
+        assert REGISTRY.get_sample_value("crumbline_http_request_db_queries_sum", {"route": "/items/{item_id}"}) == 12
+        unmatched = {"method": "GET", "route": "unmatched", "status": "404"}
+        assert REGISTRY.get_sample_value("crumbline_http_request_duration_seconds_count", unmatched) == 1
+
+        body = client.get("/metrics").text
+        assert 'crumbline_db_query_duration_seconds_count{engine="test",statement="SELECT"}' in body
+        assert "crumbline_executor_queued" in body
+        asyncio.run(engine.dispose())
+    print("✅ Requests are timed by route and their SQL is counted")
+
+
+def test_json_log_records_carry_extra_fields():
+    record = logging.getLogger("app.test").makeRecord(
+        "app.test", logging.INFO, __file__, 1, "Fetched %s", ("feed",), None, extra={"feed_id": 7}
+    )
+    data = json.loads(JsonFormatter().format(record))
+    assert data["message"] == "Fetched feed"
+    assert data["level"] == "INFO" and data["feed_id"] == 7
+    print("✅ JSON log records include extra fields")
+
+
+if __name__ == "__main__":
+    test_requests_and_queries_are_measured()
+    test_json_log_records_carry_extra_fields()
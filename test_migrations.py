@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# test_migrations.py
+# Checks that schema migrations upgrade an old feeds.db, once even when
+# several processes start together, and that the hot entry queries are
+# served by indexes (EXPLAIN QUERY PLAN).
+
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import sqlite
+
+from app import jobs, services
+from app.migrations import MIGRATIONS, get_version, run_migrations
+from app.models import Base
+
+# Schema as created by the first release, before any migration existed
+LEGACY_SCHEMA = [
+    """CREATE TABLE categories (
+        id INTEGER NOT NULL, name VARCHAR NOT NULL,
+        PRIMARY KEY (id), UNIQUE (name))""",
+    """CREATE TABLE feeds (
+        id INTEGER NOT NULL, url VARCHAR NOT NULL, title VARCHAR, description TEXT,
+        last_updated DATETIME, category_id INTEGER,
+        PRIMARY KEY (id), UNIQUE (url), FOREIGN KEY(category_id) REFERENCES categories (id))""",
+    """CREATE TABLE entries (
+        id INTEGER NOT NULL, feed_id INTEGER, title VARCHAR NOT NULL, link VARCHAR NOT NULL,
+        published DATETIME, content TEXT, is_read BOOLEAN, created_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(feed_id) REFERENCES feeds (id))""",
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR NOT NULL, email VARCHAR NOT NULL,
+        password VARCHAR NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (username), UNIQUE (email))""",
+]
+
+
+def _seed(conn, feeds=20, entries=4000):
+    for feed_id in range(1, feeds + 1):
+        conn.exec_driver_sql(
+            "INSERT INTO feeds (id, url, category_id) VALUES (?, ?, ?)",
+            (feed_id, f"https://example.com/{feed_id}.xml", None),
+        )
+    conn.exec_driver_sql("INSERT INTO categories (id, name) VALUES (1, 'News')")
+    conn.exec_driver_sql("UPDATE feeds SET category_id = 1 WHERE id <= 5")
+    for i in range(entries):
+        conn.exec_driver_sql(
+            "INSERT INTO entries (feed_id, title, link, published, content, is_read) "
+            "VALUES (?, ?, ?, ?, '', ?)",
+            (i % feeds + 1, f"Entry {i}", f"https://example.com/e/{i}",
+             f"2024-01-{i % 28 + 1:02d} {i % 24:02d}:00:00", 0 if i % 10 == 0 else 1),
+        )
+
+
+def _plan(conn, query):
+    compiled = query.compile(dialect=sqlite.dialect())
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    params = tuple(str(p) if hasattr(p, "isoformat") else p for p in params)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params)
+    return " | ".join(row[3] for row in rows)
+
+
+def test_legacy_database_is_upgraded(tmp_path):
+    # Not the shared fixture: this one starts from the unmigrated schema
+    engine = create_engine(f"sqlite:///{tmp_path / 'feeds.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        _seed(conn, feeds=2, entries=20)
+        conn.exec_driver_sql(
+            "INSERT INTO entries (feed_id, title, link, published, content, is_read, created_at) "
+            "VALUES (1, 'Undated', 'https://example.com/undated', NULL, '', 1, '2024-02-01 09:00:00')"
+        )
+
+    with engine.begin() as conn:
+        version = run_migrations(conn, Base.metadata)
+
+    with engine.connect() as conn:
+        assert version == MIGRATIONS[-1][0]
+        assert get_version(conn) == version
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(feeds)")}
+        assert {"etag", "next_poll_at", "unread_count"} <= columns
+        missing_guid = conn.exec_driver_sql("SELECT COUNT(*) FROM entries WHERE guid IS NULL").scalar()
+        assert missing_guid == 0
+        missing_summary = conn.exec_driver_sql("SELECT COUNT(*) FROM entries WHERE summary IS NULL").scalar()
+        assert missing_summary == 0
+        counts = dict(conn.exec_driver_sql("SELECT id, unread_count FROM feeds").all())
+        assert counts == {1: 2, 2: 0}, counts
+        undated = conn.exec_driver_sql("SELECT published FROM entries WHERE title = 'Undated'").scalar()
+        assert undated == "2024-02-01 09:00:00", undated
+
+    # Publish times stay set on the upgraded table too
+    for statement in (
+        "INSERT INTO entries (feed_id, guid, title, link) VALUES (1, 'x', 'No date', 'https://example.com/x')",
+        "UPDATE entries SET published = NULL",
+    ):
+        with pytest.raises(IntegrityError), engine.begin() as conn:
+            conn.exec_driver_sql(statement)
+
+    # Running again is a no-op
+    with engine.begin() as conn:
+        assert run_migrations(conn) == version
+    engine.dispose()
+    print(f"✅ Legacy database migrated to version {version}")
+
+
+# One process starting up: waits for the shared start time, then migrates
+MIGRATE_SCRIPT = """
+import sys, time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from app.migrations import run_migrations
+from app.models import Base
+
+engine = create_engine("sqlite:///" + sys.argv[1])
+time.sleep(max(float(sys.argv[2]) - time.time(), 0))
+with engine.begin() as conn:
+    run_migrations(conn, Base.metadata)
+"""
+
+
+def test_concurrent_startups_migrate_once(tmp_path):
+    path = tmp_path / "feeds.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        _seed(conn, feeds=5, entries=2000)
+
+    start = time.time() + 2
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", MIGRATE_SCRIPT, str(path), str(start)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        for _ in range(4)
+    ]
+    for process in processes:
+        output, _ = process.communicate(timeout=120)
+        assert process.returncode == 0, output
+
+    with engine.connect() as conn:
+        assert get_version(conn) == MIGRATIONS[-1][0]
+        # Backfills ran once: one search row per entry
+        indexed = conn.exec_driver_sql("SELECT COUNT(*) FROM entries_fts").scalar()
+        assert indexed == 2000, indexed
+        counts = conn.exec_driver_sql("SELECT SUM(unread_count) FROM feeds").scalar()
+        assert counts == 200, counts
+    engine.dispose()
+    print("✅ Concurrent startups apply each migration once")
+
+
+def test_hot_queries_use_indexes(database):
+    with database.engine.begin() as conn:
+        _seed(conn)
+        conn.exec_driver_sql("ANALYZE")
+
+    expectations = [
+        ("home page", services.entries_query(), "ix_entries_published"),
+        ("feed page", services.entries_query(feed_id=3), "ix_entries_feed_published"),
+        ("feed next page", services.entries_query(feed_id=3, cursor="2024-01-10T05:00:00_500"),
+         "ix_entries_feed_published (feed_id=? AND published<?)"),
+        ("unread page", services.entries_query(unread_only=True), "ix_entries_unread_published"),
+        ("due feeds", jobs.due_jobs(datetime(2024, 1, 1)), "ix_feeds_next_poll_at"),
+    ]
+    with database.engine.connect() as conn:
+        for name, query, index in expectations:
+            plan = _plan(conn, query)
+            assert index in plan, f"{name}: {plan}"
+            assert "TEMP B-TREE" not in plan, f"{name} sorts in memory: {plan}"
+            print(f"✅ {name}: {plan}")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# test_opml.py
+# Checks OPML parsing: folders become categories, attribute names are
+# matched case-insensitively, and malformed files are rejected. Import
+# progress is kept in the database, and interrupted imports show as such.
+
+import asyncio
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import opml
+from app.opml import parse_opml
+
+OPML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<opml version="1.0">
+  <head><title>Subscriptions</title></head>
+  <body>
+    <outline text="Tech" title="Tech">
+      <outline text="Python" xmlUrl="https://python.example/feed" type="rss"/>
+      <outline title="Nested">
+        <outline text="Deep" xmlURL="https://deep.example/rss"/>
+      </outline>
+      <outline text="Unnamed folder">
+        <outline text="" >
+          <outline text="Deeper" xmlurl="https://deeper.example/rss"/>
+        </outline>
+      </outline>
+    </outline>
+    <outline text="Loose" xmlUrl=" https://loose.example/atom "/>
+    <outline text="Tagged" xmlUrl="https://tagged.example/feed" category="/News/World,/Other"/>
+  </body>
+</opml>
+"""
+
+
+def test_outlines_map_to_categories():
+    feeds = list(parse_opml(io.BytesIO(OPML)))
+    assert [(feed.url, feed.category) for feed in feeds] == [
+        ("https://python.example/feed", "Tech"),
+        ("https://deep.example/rss", "Nested"),
+        ("https://deeper.example/rss", "Unnamed folder"),
+        ("https://loose.example/atom", None),
+        ("https://tagged.example/feed", "World"),
+    ]
+    assert feeds[0].title == "Python"
+    print("✅ OPML outlines map to feeds and categories")
+
+
+def test_malformed_opml_is_rejected():
+    try:
+        list(parse_opml(io.BytesIO(b"<opml><body><outline xmlUrl='https://a.example/'>")))
+    except ValueError as e:
+        assert "Invalid OPML" in str(e)
+    else:
+        raise AssertionError("Malformed OPML was accepted")
+    print("✅ Malformed OPML files are rejected")
+
+
+async def _progress_checks(session_factory):
+    feeds = await opml.read_opml(io.BytesIO(OPML))
+    assert len(feeds) == 5
+    with pytest.raises(ValueError):
+        await opml.read_opml(io.BytesIO(b"<opml><body>"))
+
+    import_id = await opml.start_import(feeds)
+    # Nothing in this process's memory: progress comes from the table
+    progress = await opml.get_import(import_id)
+    assert (progress.total, progress.finished) == (5, False)
+    while not progress.finished:
+        await asyncio.sleep(0.05)
+        progress = await opml.get_import(import_id)
+    assert (progress.done, progress.added, progress.failed) == (5, 4, 1), progress
+    assert progress.errors == ["https://loose.example/atom: Feed contains no entries"]
+    assert await opml.get_import("unknown") is None
+
+    # An import whose process went away stops being polled
+    async with session_factory() as session:
+        stale = datetime.utcnow() - timedelta(seconds=opml.STALE_IMPORT_SECONDS + 1)
+        session.add(opml.OpmlImport(id="stale", total=3, done=1, started_at=stale, updated_at=stale))
+        await session.commit()
+    progress = await opml.get_import("stale")
+    assert progress.interrupted and not progress.finished
+
+
+def test_import_progress_is_stored(database, monkeypatch):
+    async def fake_import(feeds, progress):
+        for feed in feeds:
+            await asyncio.sleep(0.01)
+            if "loose" in feed.url:
+                progress.failed += 1
+                progress.errors.append(f"{feed.url}: Feed contains no entries")
+            else:
+                progress.added += 1
+            progress.done += 1
+        progress.finished = True
+        return progress
+
+    monkeypatch.setattr(opml, "import_feeds", fake_import)
+    monkeypatch.setattr(opml, "PROGRESS_INTERVAL", 0.01)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            monkeypatch.setattr(opml, "async_session", session_factory)
+            monkeypatch.setattr(opml, "read_session", session_factory)
+            await _progress_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Import progress is read back from the database")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
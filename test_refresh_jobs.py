@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# test_refresh_jobs.py
+# Checks the refresh job queue: leases of crashed workers are reclaimed,
+# and several worker processes draining the same queue never fetch a feed
+# twice.
+
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import select
+
+from app import jobs
+from app.models import RefreshJob
+
+FEEDS = 24
+WORKERS = 3
+
+RSS = (
+    '<?xml version="1.0"?><rss version="2.0"><channel><title>Feed {n}</title>'
+    "<link>http://example.com/</link><description>test</description>"
+    "<item><title>Item</title><link>http://example.com/{n}/1</link><guid>{n}-1</guid></item>"
+    "</channel></rss>"
+)
+
+
+def _serve():
+    hits = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            hits[self.path] += 1
+            body = RSS.format(n=self.path.strip("/")).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, hits
+
+
+def test_expired_lease_is_reclaimed(database):
+    for n in range(4):
+        database.add_feed(n + 1)
+
+    async def run():
+        now = datetime.utcnow()
+        async with database.sessions() as session_factory, session_factory() as session:
+            await jobs.enqueue_due(session, now)
+            claimed = await jobs.claim(session, 2, owner="crashed", ttl=60, now=now)
+            assert len(claimed) == 2
+
+            # Still leased: another worker gets the remaining jobs only
+            others = await jobs.claim(session, 10, owner="alive", now=now)
+            assert set(others).isdisjoint(claimed)
+            assert len(others) == 2
+
+            # Once the lease runs out the jobs are claimed again
+            later = now + timedelta(seconds=61)
+            reclaimed = await jobs.claim(session, 10, owner="alive", now=later)
+            assert sorted(reclaimed) == sorted(claimed), reclaimed
+
+            # The crashed worker can no longer complete what it lost
+            await jobs.complete(session, claimed[0], owner="crashed")
+            await jobs.complete(session, claimed[1], owner="alive")
+            remaining = (await session.execute(
+                select(RefreshJob.feed_id, RefreshJob.attempts)
+            )).all()
+            assert (claimed[0], 2) in remaining and len(remaining) == 3, remaining
+
+    asyncio.run(run())
+    print("✅ Expired leases are reclaimed by another worker")
+
+
+def test_workers_never_fetch_a_feed_twice(database):
+    server, hits = _serve()
+    try:
+        for n in range(FEEDS):
+            database.add_feed(n + 1, f"http://127.0.0.1:{server.server_port}/{n}")
+        env = dict(os.environ, DATABASE_URL=database.url, REFRESH_CONCURRENCY="2")
+        code = "import asyncio; from app import refresh; asyncio.run(refresh.refresh_due_feeds())"
+        workers = [
+            subprocess.Popen([sys.executable, "-c", code], env=env,
+                             cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.DEVNULL)
+            for _ in range(WORKERS)
+        ]
+        for worker in workers:
+            assert worker.wait(timeout=60) == 0
+
+        with database.engine.connect() as conn:
+            left = conn.exec_driver_sql("SELECT COUNT(*) FROM refresh_jobs").scalar()
+            entries = conn.exec_driver_sql("SELECT COUNT(*) FROM entries").scalar()
+    finally:
+        server.shutdown()
+
+    assert len(hits) == FEEDS, hits
+    assert max(hits.values()) == 1, [path for path, count in hits.items() if count > 1]
+    assert left == 0 and entries == FEEDS
+    print(f"✅ {WORKERS} workers fetched {FEEDS} feeds exactly once each")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
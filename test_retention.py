@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# test_retention.py
+# Checks entry retention: policy resolution from feed, category and
+# defaults, batched pruning by age and count, unread counters and the
+# search index after pruning, that ingest only skips what pruning would
+# delete, and that pruned entries are not stored again by a refresh.
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+
+from app import retention, search, services
+from app.fetcher import fetcher
+from app.models import Entry, Feed, PrunedEntry
+
+NOW = datetime(2024, 6, 1)
+
+
+def test_policy_resolution():
+    feed = SimpleNamespace(retention_days=None, retention_max_entries=20, retention_keep_unread=None)
+    category = SimpleNamespace(retention_days=30, retention_max_entries=100, retention_keep_unread=False)
+
+    policy = retention.policy_for(feed, category)
+    assert (policy.max_age_days, policy.max_entries, policy.keep_unread) == (30, 20, False)
+
+    policy = retention.policy_for(feed)
+    assert policy.max_age_days == retention.RETENTION_MAX_AGE_DAYS
+    assert policy.keep_unread == retention.RETENTION_KEEP_UNREAD
+    # Pruning is opt-in
+    assert retention.RetentionPolicy().cutoff() is None and not retention.RetentionPolicy().max_entries
+
+    # 0 means keep forever
+    assert retention.RetentionPolicy(max_age_days=0).cutoff() is None
+    print("✅ Retention policy falls back from feed to category to defaults")
+
+
+async def _prune_checks(session_factory):
+    async with session_factory() as session:
+        feed = SimpleNamespace(id=1, url="https://a.example/feed")
+        # One entry a day for 50 days; every other one already read
+        parsed = [
+            {
+                "id": f"e{day}",
+                "title": f"Day {day}",
+                "link": f"https://a.example/{day}",
+                "published_parsed": (NOW - timedelta(days=day)).timetuple(),
+            }
+            for day in range(50)
+        ]
+        await services.ingest_entries(session, feed, parsed)
+        await session.execute(Entry.__table__.update().where(Entry.id % 2 == 0).values(is_read=True))
+        await services.recount_unread(session)
+
+        # Age limit, sparing unread entries
+        policy = retention.RetentionPolicy(max_age_days=30, max_entries=0, keep_unread=True)
+        deleted = await retention.prune_feed(session, 1, policy, now=NOW, batch_size=3)
+        assert deleted == 10, deleted
+        old = await session.scalar(
+            select(func.count()).where(Entry.published < NOW - timedelta(days=30), Entry.is_read == True)
+        )
+        assert old == 0
+
+        # Count limit, unread entries included this time
+        policy = retention.RetentionPolicy(max_age_days=0, max_entries=15, keep_unread=False)
+        deleted = await retention.prune_feed(session, 1, policy, now=NOW, batch_size=4)
+        remaining = (await session.execute(select(Entry.published).order_by(Entry.published.desc()))).scalars().all()
+        assert len(remaining) == 15 and deleted == 25, (len(remaining), deleted)
+        assert remaining[0] == NOW
+
+        # Counters and the search index follow the deletes
+        unread = await session.scalar(select(Feed.unread_count).where(Feed.id == 1))
+        actual = await session.scalar(select(func.count()).where(Entry.is_read == False))
+        assert unread == actual, (unread, actual)
+        indexed = await session.scalar(select(func.count()).select_from(search.entries_fts))
+        assert indexed == 15
+
+        # Pruned entries are not stored again by the next refresh
+        cutoff = await retention.ingest_cutoff(session, feed, policy)
+        result = await services.ingest_entries(session, feed, parsed, published_after=cutoff)
+        assert result.new == 0, result
+
+
+def test_prune_feed(database):
+    database.add_feed(1)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _prune_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Old and surplus entries are pruned in batches")
+
+
+def _dated_rss(*days):
+    """RSS with one item per given number of days ago, dated by <pubDate>"""
+    today = datetime.now(timezone.utc)
+    items = "".join(
+        f"<item><title>Day {day}</title><link>https://a.example/{day}</link><guid>day-{day}</guid>"
+        f"<pubDate>{format_datetime(today - timedelta(days=day), usegmt=True)}</pubDate></item>"
+        for day in days
+    )
+    return (
+        "<?xml version='1.0'?><rss version='2.0'><channel><title>Archive</title>"
+        f"<link>https://a.example/</link><description>Old posts</description>{items}</channel></rss>"
+    ).encode()
+
+
+async def _ingest_checks(session_factory):
+    async with session_factory() as session:
+        feed = await services.add_feed(session, "https://a.example/feed")
+        assert feed.unread_count == 5
+        assert await session.scalar(select(func.count()).select_from(Entry)) == 5
+
+        # Every item is past the age limit, but new entries are unread and
+        # the policy keeps unread entries
+        await services.set_feed_retention(session, feed.id, max_age_days=180, keep_unread=True)
+        feed = await session.get(Feed, feed.id)
+        assert (await services.update_feed(session, feed)).new == 2
+        assert (await session.get(Feed, feed.id)).unread_count == 7
+
+        # Without keep_unread, pruning would delete old entries, so new
+        # ones past the age limit are skipped and recent ones stored
+        await services.set_feed_retention(session, feed.id, max_age_days=30, keep_unread=False)
+        feed = await session.get(Feed, feed.id)
+        result = await services.update_feed(session, feed)
+        assert result.new == 2 and result.skipped == 8, result
+        titles = (await session.execute(select(Entry.title).order_by(Entry.published.desc()).limit(2))).scalars().all()
+        assert titles == ["Day 0", "Day 1"]
+
+
+async def _serve(documents, checks):
+    """Run `checks` with the fetcher answering each request with the next document"""
+    responses = iter(documents)
+    default_client = fetcher._client
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=next(responses), headers={"Content-Type": "application/rss+xml"})
+    ))
+    try:
+        await checks()
+    finally:
+        await fetcher._client.aclose()
+        fetcher._client = default_client
+
+
+def test_ingest_keeps_what_pruning_would_keep(database):
+    # Well past a 180-day limit
+    documents = [
+        _dated_rss(*range(400, 405)),
+        _dated_rss(*range(398, 405)),
+        _dated_rss(0, 1, *range(398, 406)),
+    ]
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _ingest_checks(session_factory)
+
+    asyncio.run(_serve(documents, checks))
+    print("✅ Old unread entries are stored; only entries pruning would delete are skipped")
+
+
+async def _pruned_checks(session_factory):
+    async with session_factory() as session:
+        feed = await services.add_feed(session, "https://a.example/feed")
+        await services.mark_feed_read(session, feed.id)
+        await services.set_feed_retention(session, feed.id, max_age_days=30)
+        feed = await session.get(Feed, feed.id)
+        policy = await retention.load_policy(session, feed)
+        assert policy.keep_unread
+        assert await retention.prune_feed(session, feed.id, policy) == 5
+
+        # The feed still lists everything that was pruned
+        feed = await session.get(Feed, feed.id)
+        result = await services.update_feed(session, feed)
+        assert result.new == 1 and result.skipped == 5, result
+        titles = (await session.execute(select(Entry.title))).scalars().all()
+        assert titles == ["Day 0"], titles
+        assert (await session.get(Feed, feed.id)).unread_count == 1
+
+        # Tombstones go with their feed
+        await session.delete(await session.get(Feed, feed.id))
+        await session.commit()
+        assert await session.scalar(select(func.count()).select_from(PrunedEntry)) == 0
+
+
+def test_pruned_entries_stay_gone(database):
+    documents = [_dated_rss(*range(400, 405)), _dated_rss(0, *range(400, 405))]
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _pruned_checks(session_factory)
+
+    asyncio.run(_serve(documents, checks))
+    print("✅ Read entries removed by pruning are not stored again as unread")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
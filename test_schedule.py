@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# test_schedule.py
+# Checks the adaptive polling schedule: intervals from the posting rate
+# within the min/max bounds, publisher hints (Cache-Control, Expires,
+# <ttl>, Retry-After), and failure backoff growth and its cap.
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import schedule
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+MINUTE = 60
+HOUR = 60 * MINUTE
+
+
+def _parsed(*ages, ttl=None):
+    """A parsed feed with one entry published each of `ages` ago"""
+    feed = {"ttl": ttl} if ttl is not None else {}
+    return {"feed": feed, "entries": [{"published_parsed": (NOW - age).timetuple()} for age in ages]}
+
+
+def _feed(**state):
+    return SimpleNamespace(**{"poll_interval": None, "error_count": 0, "hub_state": None, **state})
+
+
+def test_posting_rate_within_bounds():
+    # Hourly posts, the latest just now: poll about every half hour
+    hourly = _parsed(*(timedelta(hours=n) for n in range(10)))
+    assert schedule.posting_interval(hourly, NOW) == HOUR
+    feed = _feed()
+    schedule.on_success(feed, hourly, {}, NOW)
+    assert feed.poll_interval == 30 * MINUTE
+    assert feed.next_poll_at == NOW + timedelta(minutes=30)
+
+    # Very busy feeds never go below the minimum...
+    busy = _parsed(*(timedelta(minutes=n) for n in range(10)))
+    schedule.on_success(feed, busy, {}, NOW)
+    assert feed.poll_interval == schedule.POLL_MIN_INTERVAL * MINUTE
+
+    # ...and feeds that went quiet slow down, up to the maximum
+    quiet = _parsed(*(timedelta(days=300 + n) for n in range(10)))
+    assert schedule.posting_interval(quiet, NOW) == 150 * 24 * HOUR
+    schedule.on_success(feed, quiet, {}, NOW)
+    assert feed.poll_interval == schedule.POLL_MAX_INTERVAL * MINUTE
+
+    # No dates at all: the default
+    schedule.on_success(feed, {"entries": [{}]}, {}, NOW)
+    assert feed.poll_interval == schedule.POLL_DEFAULT_INTERVAL * MINUTE
+
+    # Unchanged polls stretch the interval, still within the maximum
+    feed.poll_interval = schedule.POLL_MAX_INTERVAL * MINUTE - 1
+    schedule.on_not_modified(feed, {}, NOW)
+    assert feed.poll_interval == schedule.POLL_MAX_INTERVAL * MINUTE
+    print("✅ Poll intervals follow the posting rate within the min/max bounds")
+
+
+def test_publisher_hints():
+    assert schedule.server_interval({"cache-control": "public, max-age=7200"}) == 2 * HOUR
+    assert schedule.server_interval({"cache-control": "s-maxage=600"}) == 600
+    assert schedule.server_interval({"cache-control": "no-cache"}) is None
+    expires = {"date": "Sat, 01 Jun 2024 12:00:00 GMT", "expires": "Sat, 01 Jun 2024 15:00:00 GMT"}
+    assert schedule.server_interval(expires) == 3 * HOUR
+    # max-age wins over Expires
+    assert schedule.server_interval({**expires, "cache-control": "max-age=60"}) == 60
+    assert schedule.server_interval({"expires": "0"}) is None
+    assert schedule.server_interval({}, _parsed(ttl="90")) == 90 * MINUTE
+    assert schedule.server_interval({"cache-control": "max-age=60"}, _parsed(ttl="90")) == 90 * MINUTE
+
+    # A hint only ever lengthens the interval, and is still clamped
+    hourly = _parsed(*(timedelta(hours=n) for n in range(10)))
+    feed = _feed()
+    schedule.on_success(feed, hourly, {"cache-control": "max-age=60"}, NOW)
+    assert feed.poll_interval == 30 * MINUTE
+    schedule.on_success(feed, hourly, {"cache-control": "max-age=7200"}, NOW)
+    assert feed.poll_interval == 2 * HOUR
+    schedule.on_success(feed, _parsed(timedelta(hours=1), ttl="100000"), {}, NOW)
+    assert feed.poll_interval == schedule.POLL_MAX_INTERVAL * MINUTE
+    schedule.on_not_modified(feed, {"cache-control": "max-age=0"}, NOW)
+    assert feed.poll_interval == schedule.POLL_MAX_INTERVAL * MINUTE
+
+    # Feeds a hub pushes to fall back to slow polling
+    feed = _feed(hub_state="active")
+    schedule.on_success(feed, hourly, {}, NOW)
+    assert feed.poll_interval == schedule.POLL_PUSH_INTERVAL * MINUTE
+    print("✅ Cache-Control, Expires and <ttl> hints lengthen the interval")
+
+
+def test_failure_backoff():
+    base = schedule.POLL_DEFAULT_INTERVAL * MINUTE
+    delays = [schedule.backoff_interval(count) for count in range(1, 8)]
+    assert delays[:3] == [base, 2 * base, 4 * base]
+    assert all(a <= b for a, b in zip(delays, delays[1:]))
+    assert max(delays) == schedule.backoff_interval(100) == schedule.POLL_BACKOFF_MAX * MINUTE
+
+    feed = _feed(error_count=2, poll_interval=30 * MINUTE)
+    schedule.on_failure(feed, NOW)
+    assert feed.error_count == 3
+    assert feed.next_poll_at == NOW + timedelta(seconds=4 * base)
+
+    # Retry-After, in seconds or as a date, is waited out...
+    feed = _feed()
+    schedule.on_failure(feed, NOW, {"retry-after": "7200"})
+    assert feed.next_poll_at == NOW + timedelta(hours=2)
+    schedule.on_failure(feed, NOW, {"retry-after": "Sat, 01 Jun 2024 15:00:00 GMT"})
+    assert feed.next_poll_at == NOW + timedelta(hours=3)
+    # ...but never brings a poll forward, and is held to the backoff cap
+    schedule.on_failure(feed, NOW, {"retry-after": "1"})
+    assert feed.next_poll_at == NOW + timedelta(seconds=schedule.backoff_interval(3))
+    schedule.on_failure(feed, NOW, {"retry-after": str(365 * 24 * HOUR)})
+    assert feed.next_poll_at == NOW + timedelta(minutes=schedule.POLL_BACKOFF_MAX)
+    assert schedule.retry_after({"retry-after": "soon"}, NOW) is None
+
+    # Success resets the count
+    schedule.on_success(feed, _parsed(timedelta(hours=1)), {}, NOW)
+    assert feed.error_count == 0
+    print("✅ Failures back off exponentially up to the cap and honour Retry-After")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
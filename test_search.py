@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# test_search.py
+# Checks the FTS5 entry index: ingest adds plain text, deletes remove it,
+# legacy entries are backfilled, and searches honour the list filters.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from app import search, services
+from app.migrations import run_migrations
+from app.models import Entry
+
+
+def _entries(feed_id, words):
+    return [
+        {
+            "id": f"{feed_id}-{i}",
+            "title": f"Note {i} on {word}",
+            "link": f"https://example.com/{feed_id}/{i}",
+            "description": f"<p>All about <em>{word}</em></p><script>var hidden = 1;</script>",
+        }
+        for i, word in enumerate(words)
+    ]
+
+
+async def _search_checks(session_factory):
+    async with session_factory() as session:
+        for feed_id in (1, 2):
+            feed = SimpleNamespace(id=feed_id, url=f"https://example.com/{feed_id}")
+            await services.ingest_entries(session, feed, _entries(feed_id, ["sqlite", "python", "kernels"] * 10))
+        await session.commit()
+
+        entries, next_page = await search.search_entries(session, "python", limit=15)
+        assert len(entries) == 15 and next_page == 2
+        entries, next_page = await search.search_entries(session, "python", page=2, limit=15)
+        assert len(entries) == 5 and next_page is None
+
+        # Stemming, prefixes, markup and hidden scripts
+        assert (await search.search_entries(session, "kernel"))[0]
+        assert (await search.search_entries(session, "sql"))[0]
+        assert not (await search.search_entries(session, "em"))[0]
+        assert not (await search.search_entries(session, "hidden"))[0]
+        # FTS5 syntax in user input is taken literally
+        assert (await search.search_entries(session, 'python" OR ('))[0] == []
+
+        entries, _ = await search.search_entries(session, "sqlite", category_id=1, limit=50)
+        assert {entry.feed_id for entry in entries} == {1}
+        await session.execute(Entry.__table__.update().where(Entry.feed_id == 2).values(is_read=True))
+        await session.commit()
+        entries, _ = await search.search_entries(session, "sqlite", unread_only=True, limit=50)
+        assert {entry.feed_id for entry in entries} == {1}
+
+        await session.execute(delete(Entry).where(Entry.feed_id == 1))
+        await session.commit()
+        indexed = await session.scalar(select(func.count()).select_from(search.entries_fts))
+        assert indexed == 30, indexed
+
+
+def test_search_index(database):
+    database.add_category(1, "News")
+    database.add_feed(1, category_id=1)
+    database.add_feed(2)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _search_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Search index follows ingest and deletes, and honours filters")
+
+
+def test_existing_entries_are_backfilled(database):
+    database.add_feed(1)
+    with database.engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE entries_fts")
+        conn.exec_driver_sql(
+            "INSERT INTO entries (feed_id, guid, title, link, published, content) "
+            "VALUES (1, 'g', 'Old entry', 'https://a.example/1', '2024-01-01', '<b>archived</b> text')"
+        )
+        conn.exec_driver_sql("PRAGMA user_version = 3")
+    with database.engine.begin() as conn:
+        run_migrations(conn)
+        match = search.match_expression("archived")
+        rows = conn.exec_driver_sql(
+            "SELECT rowid, content FROM entries_fts WHERE entries_fts MATCH ?", (match,)
+        ).all()
+        assert [tuple(row) for row in rows] == [(1, "archived text")], rows
+    print("✅ Existing entries are added to the search index")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
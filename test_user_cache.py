@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# test_user_cache.py
+# Checks the authenticated-user cache: entries expire after the TTL, the
+# least recently used user is evicted first, and invalidation drops one.
+
+from types import SimpleNamespace
+
+import pytest
+
+from app import auth
+from app.auth import UserCache
+
+
+def _user(name):
+    return SimpleNamespace(id=hash(name), username=name)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    users = UserCache(maxsize=10, ttl=300)
+    alice = _user("alice")
+    users.set("alice", alice)
+
+    now[0] += 299
+    assert users.get("alice") is alice
+    # Reads do not extend the lifetime; a fresh login does
+    now[0] += 2
+    assert users.get("alice") is None
+    assert "alice" not in users._entries
+    users.set("alice", alice)
+    now[0] += 299
+    assert users.get("alice") is alice
+    print("✅ Cached users expire after the TTL")
+
+
+def test_least_recently_used_is_evicted():
+    users = UserCache(maxsize=2, ttl=300)
+    alice, bob, carol = _user("alice"), _user("bob"), _user("carol")
+    users.set("alice", alice)
+    users.set("bob", bob)
+    # Reading alice makes bob the least recently used
+    assert users.get("alice") is alice
+    users.set("carol", carol)
+    assert users.get("bob") is None
+    assert users.get("alice") is alice and users.get("carol") is carol
+
+    # Updating an existing key does not evict anyone
+    users.set("alice", alice)
+    assert len(users._entries) == 2 and users.get("carol") is carol
+
+    users.invalidate("carol")
+    users.invalidate("nobody")
+    assert users.get("carol") is None and users.get("alice") is alice
+    users.clear()
+    assert users.get("alice") is None
+    print("✅ The least recently used user is evicted first")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# test_websub.py
+# Checks WebSub against a stand-in hub: hub discovery, subscription and
+# verification, signed pushes ingested like polled entries, fallback
+# polling while subscribed, and lease renewal.
+
+import asyncio
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app import schedule, websub
+from app.fetcher import FetchResult, parse_feed
+from app.models import Base, Entry, Feed
+
+FEED_URL = "https://blog.example/feed.xml"
+HUB_URL = "https://hub.example/"
+
+
+def _atom(*ids, hub=HUB_URL):
+    entries = "".join(
+        f"<entry><id>urn:{i}</id><title>Post {i}</title><link href='/posts/{i}'/>"
+        f"<updated>2024-01-0{i}T00:00:00Z</updated></entry>"
+        for i in ids
+    )
+    return (
+        "<?xml version='1.0'?><feed xmlns='http://www.w3.org/2005/Atom'><title>Blog</title>"
+        f"<link rel='hub' href='{hub}'/><link rel='self' href='{FEED_URL}'/>{entries}</feed>"
+    ).encode()
+
+
+class StubHub:
+    """Stands in for a hub: accepts subscriptions, verifies them, pushes signed content"""
+
+    def __init__(self):
+        self.requests = []
+        self.transport = httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append({key: values[0] for key, values in parse_qs(request.content.decode()).items()})
+        return httpx.Response(202)
+
+    async def confirm(self, session, feed, lease_seconds=3600):
+        request = self.requests[-1]
+        reply = await websub.verify(session, feed, {
+            "hub.mode": "subscribe",
+            "hub.topic": request["hub.topic"],
+            "hub.challenge": "c4a11e6e",
+            "hub.lease_seconds": str(lease_seconds),
+        })
+        assert reply == "c4a11e6e", reply
+
+    def sign(self, body: bytes) -> dict:
+        digest = hmac.new(self.requests[-1]["hub.secret"].encode(), body, hashlib.sha256).hexdigest()
+        return {"content-type": "application/atom+xml", "x-hub-signature": f"sha256={digest}"}
+
+
+def test_hub_discovery():
+    parsed = parse_feed(_atom(1), FEED_URL, {})
+    result = FetchResult(url=FEED_URL, status=200, headers={}, content=b"", parsed=parsed)
+    assert websub.discover(result) == (HUB_URL, FEED_URL)
+
+    # Link headers win over the document
+    result.headers = {"link": '<https://other.example/hub>; rel="hub", </feed?self>; rel="self"'}
+    assert websub.discover(result) == ("https://other.example/hub", "https://blog.example/feed?self")
+
+    plain = parse_feed(_atom(1).replace(f"<link rel='hub' href='{HUB_URL}'/>".encode(), b""), FEED_URL, {})
+    assert websub.discover(FetchResult(url=FEED_URL, status=200, headers={}, content=b"", parsed=plain)) == (None, None)
+    print("✅ Hubs are found in Link headers and feed links")
+
+
+async def _subscription_checks(session_factory):
+    hub = StubHub()
+    client = httpx.AsyncClient(transport=hub.transport)
+    websub.WEBSUB_CALLBACK_URL = "https://crumbline.example"
+
+    async with session_factory() as session:
+        feed = await session.get(Feed, 1)
+        result = FetchResult(url=FEED_URL, status=200, headers={}, content=b"", parsed=parse_feed(_atom(1), FEED_URL, {}))
+        websub.note_hub(feed, result)
+        await session.commit()
+
+        assert await websub.subscribe(session, 1, client)
+        request = hub.requests[-1]
+        assert request["hub.mode"] == "subscribe" and request["hub.topic"] == FEED_URL
+        assert request["hub.callback"] == "https://crumbline.example/websub/1"
+        assert feed.hub_state == "pending" and feed.hub_secret == request["hub.secret"]
+
+        # Verifications we did not ask for are refused
+        assert await websub.verify(session, feed, {"hub.mode": "unsubscribe", "hub.topic": FEED_URL,
+                                                   "hub.challenge": "x"}) is None
+        assert await websub.verify(session, feed, {"hub.mode": "subscribe", "hub.topic": "https://evil.example/",
+                                                   "hub.challenge": "x"}) is None
+
+        await hub.confirm(session, feed)
+        assert feed.hub_state == "active"
+        assert feed.next_poll_at >= datetime.utcnow() + timedelta(minutes=schedule.POLL_PUSH_INTERVAL - 1)
+        # A busy feed that is pushed to is still only polled as a fallback
+        schedule.on_success(feed, parse_feed(_atom(1, 2, 3), FEED_URL, {}), {})
+        assert feed.poll_interval == schedule.POLL_PUSH_INTERVAL * 60
+
+        body = _atom(2, 3)
+        assert websub.authentic(feed, body, hub.sign(body))
+        ingested = await websub.receive(session, feed, body, hub.sign(body))
+        assert ingested.new == 2
+        links = (await session.execute(select(Entry.link).order_by(Entry.id))).scalars().all()
+        assert links == ["https://blog.example/posts/2", "https://blog.example/posts/3"]
+        assert feed.unread_count == 2
+
+        forged = _atom(4)
+        assert not websub.authentic(feed, forged, {"x-hub-signature": "sha256=" + "0" * 64})
+        assert not websub.authentic(feed, forged, {"x-hub-signature": hub.sign(body)["x-hub-signature"]})
+        assert not websub.authentic(feed, forged, {})
+
+        # Leases close to running out are renewed by the worker job
+        feed.hub_expires_at = datetime.utcnow() + timedelta(hours=1)
+        await session.commit()
+    default_session = websub.async_session
+    websub.async_session = session_factory
+    try:
+        assert await websub.renew_subscriptions(client) == 1
+        assert len(hub.requests) == 2 and hub.requests[-1]["hub.secret"] == request["hub.secret"]
+        # A lapsed lease puts the feed back on regular polling
+        async with session_factory() as session:
+            feed = await session.get(Feed, 1)
+            feed.hub_expires_at = datetime.utcnow() - timedelta(minutes=1)
+            await session.commit()
+            await session.execute(Base.metadata.tables["leases"].delete())
+            await session.commit()
+        await websub.renew_subscriptions(client)
+        async with session_factory() as session:
+            feed = await session.get(Feed, 1)
+            assert feed.hub_state == "pending" and feed.next_poll_at <= datetime.utcnow()
+    finally:
+        websub.async_session = default_session
+        websub.WEBSUB_CALLBACK_URL = None
+        await client.aclose()
+
+
+def test_subscription_and_push(database):
+    database.add_feed(1, FEED_URL)
+
+    async def checks():
+        async with database.sessions() as session_factory:
+            await _subscription_checks(session_factory)
+
+    asyncio.run(checks())
+    print("✅ Hub subscriptions are verified, signed pushes ingested and leases renewed")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))